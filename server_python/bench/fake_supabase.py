@@ -0,0 +1,409 @@
+"""
+In-process stand-in for the supabase client, used by the benchmarks.
+
+Implements the PostgREST query-builder subset the API uses
+(table().select().eq().in_().or_().order().limit().range().single()
+.execute(), insert / update / delete, select(count=..., head=...) and
+embedded resources such as `order_items(*, products(name))`), plus the
+Postgres functions in sql/ (place_order, set_orders_status,
+update_delivery_positions). Every execute() can be delayed by a fixed
+`latency` to model the network round trip, and is counted so benchmarks
+can report backend calls per request.
+"""
+import asyncio
+import re
+import time
+import uuid
+from collections import Counter
+from functools import lru_cache
+from datetime import datetime, timezone
+
+
+class APIError(Exception):
+    pass
+
+
+class Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+# Embedded resources: (table, embed) -> (kind, foreign key)
+#   m2o: row[fk] references embed.id; o2m: embed[fk] references row.id
+RELATIONS = {
+    ('orders', 'tables'): ('m2o', 'table_id'),
+    ('orders', 'order_items'): ('o2m', 'order_id'),
+    ('orders', 'deliveries'): ('o2m', 'order_id'),
+    ('order_items', 'products'): ('m2o', 'product_id'),
+    ('order_items', 'orders'): ('m2o', 'order_id'),
+    ('products', 'categories'): ('m2o', 'category_id'),
+    ('deliveries', 'orders'): ('m2o', 'order_id'),
+}
+
+_FILTER = re.compile(r'(\w+)\.(eq|neq|lt|lte|gt|gte)\.(.*)', re.S)
+
+
+def _split_top(text):
+    """Splits on commas that are not inside parentheses."""
+    parts, depth, current = [], 0, ''
+    for ch in text:
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        if ch == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+        else:
+            current += ch
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+@lru_cache(maxsize=256)
+def _parse_columns(columns):
+    """select() string -> tuple of column names and (embed, sub-select) pairs."""
+    parsed = []
+    for column in _split_top(columns):
+        embed = re.match(r'(\w+)(?:!\w+)?\((.*)\)$', column, re.S)  # orders!inner(...) -> orders
+        parsed.append(embed.groups() if embed else column)
+    return tuple(parsed)
+
+
+def _compare(value, op, operand):
+    if value is None:
+        return False
+    value = str(value)
+    if len(operand) > 1 and operand[0] == operand[-1] == '"':
+        operand = operand[1:-1]
+    return {
+        'eq': value == operand, 'neq': value != operand,
+        'lt': value < operand, 'lte': value <= operand,
+        'gt': value > operand, 'gte': value >= operand,
+    }[op]
+
+
+def _parse_or(expr):
+    """PostgREST or=(...) filter (with nested and(...)) as a row predicate."""
+    branches = []
+    for part in _split_top(expr):
+        nested = re.match(r'and\((.*)\)$', part, re.S)
+        if nested:
+            branches.append([_FILTER.match(p).groups() for p in _split_top(nested.group(1))])
+        else:
+            branches.append([_FILTER.match(part).groups()])
+    return lambda row: any(all(_compare(row.get(c), op, v) for c, op, v in branch) for branch in branches)
+
+
+class Query:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.op = 'select'
+        self.columns = '*'
+        self.payload = None
+        self.filters = []
+        self.orders = []
+        self._limit = None
+        self._offset = 0
+        self._single = False
+        self._maybe_single = False
+        self._count = None
+        self._head = False
+
+    # --- builders ---
+
+    def select(self, *columns, count=None, head=None):
+        if self.op == 'select':
+            self.columns = ', '.join(columns) if columns else '*'
+        self._count = count
+        self._head = bool(head)
+        return self
+
+    def insert(self, payload):
+        self.op, self.payload = 'insert', payload
+        return self
+
+    def upsert(self, payload, on_conflict=None):
+        self.op, self.payload = 'upsert', payload
+        return self
+
+    def update(self, payload):
+        self.op, self.payload = 'update', payload
+        return self
+
+    def delete(self):
+        self.op = 'delete'
+        return self
+
+    def _filter(self, predicate):
+        self.filters.append(predicate)
+        return self
+
+    def _getter(self, column):
+        """Row -> value; `embed.column` reads a many-to-one embed (as with !inner)."""
+        if '.' not in column:
+            return lambda r: r.get(column)
+        name, field = column.split('.', 1)
+        _, fk = RELATIONS[(self.table, name)]
+
+        def get(r):
+            target = self.client.by_id(name).get(str(r.get(fk)))
+            return target.get(field) if target else None
+        return get
+
+    def _compare_with(self, column, value, op):
+        get = self._getter(column)
+        return self._filter(lambda r: _compare(get(r), op, str(value)))
+
+    def eq(self, column, value):
+        get = self._getter(column)
+        return self._filter(lambda r: str(get(r)) == str(value))
+
+    def neq(self, column, value):
+        get = self._getter(column)
+        return self._filter(lambda r: str(get(r)) != str(value))
+
+    def gt(self, column, value):
+        return self._compare_with(column, value, 'gt')
+
+    def gte(self, column, value):
+        return self._compare_with(column, value, 'gte')
+
+    def lt(self, column, value):
+        return self._compare_with(column, value, 'lt')
+
+    def lte(self, column, value):
+        return self._compare_with(column, value, 'lte')
+
+    def is_(self, column, value):
+        return self._filter(lambda r: r.get(column) is None if value in (None, 'null') else r.get(column) == value)
+
+    def in_(self, column, values):
+        wanted = {str(v) for v in values}
+        return self._filter(lambda r: str(r.get(column)) in wanted)
+
+    def or_(self, expr):
+        return self._filter(_parse_or(expr))
+
+    def order(self, column, desc=False, nullsfirst=None):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def range(self, start, end):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def offset(self, n):
+        self._offset = n
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def maybe_single(self):
+        self._maybe_single = True
+        return self
+
+    # --- execution ---
+
+    def _project(self, table, row, columns):
+        if columns.strip() == '*':
+            return dict(row)
+        out = {}
+        for column in _parse_columns(columns):
+            if isinstance(column, tuple):
+                name, sub = column
+                kind, fk = RELATIONS[(table, name)]
+                if kind == 'm2o':
+                    target = self.client.by_id(name).get(str(row.get(fk)))
+                    out[name] = self._project(name, target, sub) if target else None
+                else:
+                    children = self.client.children(name, fk).get(str(row['id']), [])
+                    out[name] = [self._project(name, child, sub) for child in children]
+            elif column == '*':
+                out.update(row)
+            else:
+                out[column] = row.get(column)
+        return out
+
+    def _run(self):
+        client = self.client
+        client.calls[(self.table, self.op)] += 1
+        rows = client.tables.setdefault(self.table, [])
+
+        if self.op in ('insert', 'upsert'):
+            payload = self.payload if isinstance(self.payload, list) else [self.payload]
+            created = []
+            for item in payload:
+                row = dict(item)
+                row.setdefault('id', str(uuid.uuid4()))
+                row.setdefault('created_at', datetime.now(timezone.utc).isoformat())
+                if self.op == 'upsert':
+                    rows[:] = [r for r in rows if r['id'] != row['id']]
+                rows.append(row)
+                created.append(dict(row))
+            client.invalidate(self.table)
+            return Response(created)
+
+        matched = [r for r in rows if all(f(r) for f in self.filters)]
+        if self.op == 'update':
+            for row in matched:
+                row.update(self.payload)
+            client.invalidate(self.table)
+            return Response([dict(r) for r in matched])
+        if self.op == 'delete':
+            ids = {id(r) for r in matched}
+            rows[:] = [r for r in rows if id(r) not in ids]
+            client.invalidate(self.table)
+            return Response([dict(r) for r in matched])
+
+        for column, desc in reversed(self.orders):
+            matched.sort(key=lambda r: (r.get(column) is None, str(r.get(column) or '')), reverse=desc)
+        total = len(matched)
+        matched = matched[self._offset:]
+        if self._limit is not None:
+            matched = matched[:self._limit]
+        if self._head:
+            return Response([], count=total if self._count else None)
+        data = [self._project(self.table, r, self.columns) for r in matched]
+        if self._single:
+            if len(data) != 1:
+                raise APIError("JSON object requested, multiple (or no) rows returned")
+            return Response(data[0])
+        if self._maybe_single:
+            return Response(data[0] if data else None)
+        return Response(data, count=total if self._count else None)
+
+    def execute(self):
+        return self.client.execute(self._run)
+
+
+class RPC:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def _run(self):
+        self.client.calls[('rpc', self.name)] += 1
+        return Response(self.client.functions[self.name](self.client, **self.params))
+
+    def execute(self):
+        return self.client.execute(self._run)
+
+
+class FakeSupabase:
+    """
+    Holds tables as lists of dicts. With is_async=True execute() returns a
+    coroutine (like the async supabase client), otherwise it returns directly.
+    """
+
+    def __init__(self, tables=None, is_async=False, latency: float = 0.0):
+        self.tables = tables if tables is not None else {}
+        self.is_async = is_async
+        self.latency = latency
+        self.calls = Counter()  # (table or 'rpc', operation) -> count
+        self.functions = {
+            'place_order': rpc_place_order,
+            'set_orders_status': rpc_set_orders_status,
+            'update_delivery_positions': rpc_update_delivery_positions,
+        }
+        self._by_id = {}
+        self._children = {}
+
+    def table(self, name):
+        return Query(self, name)
+
+    from_ = table
+
+    def rpc(self, name, params=None):
+        return RPC(self, name, params or {})
+
+    def execute(self, run):
+        if self.is_async:
+            return self._execute_async(run)
+        if self.latency:
+            time.sleep(self.latency)
+        return run()
+
+    async def _execute_async(self, run):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return run()
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    # --- lookup indexes for embeds, rebuilt after writes ---
+
+    def by_id(self, table):
+        if table not in self._by_id:
+            self._by_id[table] = {str(r['id']): r for r in self.tables.get(table, [])}
+        return self._by_id[table]
+
+    def children(self, table, fk):
+        key = (table, fk)
+        if key not in self._children:
+            grouped = {}
+            for row in self.tables.get(table, []):
+                grouped.setdefault(str(row.get(fk)), []).append(row)
+            self._children[key] = grouped
+        return self._children[key]
+
+    def invalidate(self, table):
+        self._by_id.pop(table, None)
+        for key in [k for k in self._children if k[0] == table]:
+            del self._children[key]
+
+
+# --- Postgres functions (sql/*.sql) ---
+
+def rpc_place_order(client, p_order, p_items=None, p_delivery=None):
+    now = datetime.now(timezone.utc).isoformat()
+    order = {**p_order, 'id': str(uuid.uuid4()), 'created_at': now}
+    order.setdefault('status', 'pending')
+    client.tables.setdefault('orders', []).append(order)
+    for item in p_items or []:
+        client.tables.setdefault('order_items', []).append({**item, 'id': str(uuid.uuid4()), 'order_id': order['id']})
+    result = dict(order)
+    if p_delivery is not None:
+        delivery = {**p_delivery, 'id': str(uuid.uuid4()), 'order_id': order['id'], 'created_at': now}
+        delivery.setdefault('status', 'open')
+        client.tables.setdefault('deliveries', []).append(delivery)
+        result['delivery_id'] = delivery['id']
+    for table in ('orders', 'order_items', 'deliveries'):
+        client.invalidate(table)
+    return result
+
+
+def rpc_set_orders_status(client, p_order_ids, p_status, p_from_statuses=None):
+    ids = {str(i) for i in p_order_ids}
+    updated = []
+    for order in client.tables.get('orders', []):
+        if str(order['id']) in ids and (p_from_statuses is None or order.get('status') in p_from_statuses):
+            old_status = order.get('status')
+            order['status'] = p_status
+            updated.append({**order, 'old_status': old_status})
+    client.invalidate('orders')
+    return updated
+
+
+def rpc_update_delivery_positions(client, p_positions):
+    positions = {str(p['id']): p for p in p_positions}
+    count = 0
+    for delivery in client.tables.get('deliveries', []):
+        position = positions.get(str(delivery['id']))
+        if position:
+            delivery['current_lat'] = position['current_lat']
+            delivery['current_lng'] = position['current_lng']
+            count += 1
+    return count
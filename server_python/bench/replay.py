@@ -0,0 +1,215 @@
+"""
+Replays a traffic capture (TRAFFIC_CAPTURE_PATH, see traffic_capture.py)
+against a running server, keeping the original inter-arrival times, and
+compares latencies with the ones recorded at capture time.
+
+    cd server_python
+    python bench/replay.py capture.jsonl --target http://localhost:8000 \\
+        --token "$ADMIN_JWT" --speed 4 --json replay.json
+
+Requests are sent open-loop: each one starts at its original offset divided
+by --speed, whether or not earlier ones have finished, so bursts stay
+bursts. Captures are anonymised, so requests that carried a token are sent
+with --token (or --driver-token for /driver/ routes), pseudonymised user
+ids can be mapped to a test account with --user-id, redacted addresses
+are sent as --address, and free text (notes, names) is replayed as x's of
+the original length.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+import httpx
+
+DEFAULT_ADDRESS = "Rua Augusta 1, 1100-048 Lisboa, Portugal"
+
+
+def load_capture(path: str, include=None, exclude=None):
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn last line of a capture still being written
+            if include and not any(record['path'].startswith(p) for p in include):
+                continue
+            if exclude and any(record['path'].startswith(p) for p in exclude):
+                continue
+            records.append(record)
+    records.sort(key=lambda r: r['t'])
+    return records
+
+
+def _substitute(value, args, key=None):
+    if isinstance(value, dict):
+        return {k: _substitute(v, args, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_substitute(v, args, key) for v in value]
+    if key == 'user_id' and args.user_id:
+        return args.user_id
+    if key in ('delivery_address', 'address') and value == 'redacted':
+        return args.address
+    return value
+
+
+def build_request(record, args):
+    headers = {}
+    if record.get('auth'):
+        token = args.driver_token if args.driver_token and record['path'].startswith('/driver/') else args.token
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+    if record.get('idempotency_key'):
+        # Keep retries as retries, but don't collide with keys from an earlier replay
+        headers['Idempotency-Key'] = f"{args.run_id}-{record['idempotency_key']}"
+    kwargs = {'headers': headers, 'params': [tuple(q) for q in _substitute(record.get('query') or [], args)]}
+    if record.get('body') is not None:
+        kwargs['json'] = _substitute(record['body'], args)
+    return record['method'], record['path'], kwargs
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarise(results):
+    """Per route: original vs replayed p50 / p95 and status mismatches."""
+    by_route = {}
+    for r in results:
+        key = f"{r['method']} {r['route'] or r['path']}"
+        by_route.setdefault(key, []).append(r)
+
+    rows = []
+    for key, items in sorted(by_route.items(), key=lambda kv: -len(kv[1])):
+        original = sorted(i['original_ms'] for i in items if i['original_ms'] is not None)
+        replayed = sorted(i['replay_ms'] for i in items if i['replay_ms'] is not None)
+        row = {
+            'route': key,
+            'requests': len(items),
+            'original_p50_ms': percentile(original, 50),
+            'original_p95_ms': percentile(original, 95),
+            'replay_p50_ms': percentile(replayed, 50),
+            'replay_p95_ms': percentile(replayed, 95),
+            'errors': sum(1 for i in items if i['replay_status'] is None or i['replay_status'] >= 500),
+            'status_mismatches': sum(1 for i in items if i['replay_status'] != i['original_status']),
+        }
+        if row['original_p50_ms'] is not None and row['replay_p50_ms'] is not None:
+            row['delta_p50_ms'] = round(row['replay_p50_ms'] - row['original_p50_ms'], 3)
+            row['delta_p95_ms'] = round(row['replay_p95_ms'] - row['original_p95_ms'], 3)
+        rows.append(row)
+    return rows
+
+
+async def replay(records, args):
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    results = []
+    lag = []  # how late requests started vs their schedule (client saturation)
+
+    async with httpx.AsyncClient(base_url=args.target, limits=limits, timeout=args.timeout) as client:
+        async def fire(record, due):
+            method, path, kwargs = build_request(record, args)
+            lag.append(max(0.0, time.perf_counter() - due) * 1000)
+            started = time.perf_counter()
+            status = None
+            try:
+                res = await client.request(method, path, **kwargs)
+                status = res.status_code
+            except httpx.HTTPError as e:
+                print(f"{method} {path}: {e.__class__.__name__}: {e}")
+            results.append({
+                'method': method,
+                'path': path,
+                'route': record.get('route'),
+                'original_status': record.get('status'),
+                'original_ms': record.get('duration_ms'),
+                'replay_status': status,
+                'replay_ms': round((time.perf_counter() - started) * 1000, 3) if status is not None else None,
+            })
+
+        t0 = records[0]['t']
+        start = time.perf_counter()
+        tasks = []
+        for record in records:
+            due = start + (record['t'] - t0) / args.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(record, due)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    lag.sort()
+    return results, elapsed, lag
+
+
+def print_report(rows, summary):
+    print(f"Replayed {summary['requests']} requests in {summary['seconds']}s "
+          f"(captured span {summary['captured_seconds']}s, speed x{summary['speed']}); "
+          f"start lag p95 {summary['start_lag_p95_ms']} ms")
+    print(f"{'route':<44}{'n':>7}{'p50 was':>10}{'p50 now':>10}{'Δp50':>9}{'p95 was':>10}{'p95 now':>10}{'Δp95':>9}{'err':>6}{'≠status':>9}")
+
+    def fmt(value):
+        return f"{value:.1f}" if value is not None else "-"
+
+    for r in rows:
+        print(f"{r['route'][:43]:<44}{r['requests']:>7}{fmt(r['original_p50_ms']):>10}{fmt(r['replay_p50_ms']):>10}"
+              f"{fmt(r.get('delta_p50_ms')):>9}{fmt(r['original_p95_ms']):>10}{fmt(r['replay_p95_ms']):>10}"
+              f"{fmt(r.get('delta_p95_ms')):>9}{r['errors']:>6}{r['status_mismatches']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help='capture file written by TRAFFIC_CAPTURE_PATH')
+    parser.add_argument('--target', default='http://localhost:8000')
+    parser.add_argument('--speed', type=float, default=1.0, help='1 = original pace, 4 = four times faster')
+    parser.add_argument('--token', help='bearer token for requests that were authenticated')
+    parser.add_argument('--driver-token', help='bearer token for /driver/ routes (defaults to --token)')
+    parser.add_argument('--user-id', help='send this user id in place of the pseudonymised ones')
+    parser.add_argument('--address', default=DEFAULT_ADDRESS, help='address sent in place of redacted ones')
+    parser.add_argument('--include', nargs='*', metavar='PREFIX', help='only replay paths with these prefixes')
+    parser.add_argument('--exclude', nargs='*', metavar='PREFIX', help='skip paths with these prefixes')
+    parser.add_argument('--limit', type=int, help='replay only the first N requests')
+    parser.add_argument('--max-connections', type=int, default=200)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--json', metavar='PATH', help='write the report as JSON')
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error('--speed must be positive')
+    args.run_id = f"replay-{int(time.time())}"
+
+    records = load_capture(args.capture, args.include, args.exclude)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("Nothing to replay")
+        sys.exit(1)
+
+    results, elapsed, lag = asyncio.run(replay(records, args))
+    rows = summarise(results)
+    summary = {
+        'requests': len(results),
+        'seconds': round(elapsed, 3),
+        'captured_seconds': round(records[-1]['t'] - records[0]['t'], 3),
+        'speed': args.speed,
+        'start_lag_p95_ms': round(percentile(lag, 95) or 0.0, 3),
+        'replay_mean_ms': round(statistics.fmean(r['replay_ms'] for r in results if r['replay_ms'] is not None), 3)
+        if any(r['replay_ms'] is not None for r in results) else None,
+    }
+    print_report(rows, summary)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'summary': summary, 'routes': rows}, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == '__main__':
+    main()
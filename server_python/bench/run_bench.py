@@ -0,0 +1,306 @@
+"""
+Load benchmark for the API, run fully in-process.
+
+The app is driven through httpx's ASGI transport against the fake supabase
+client in bench/fake_supabase.py, whose execute() sleeps --latency-ms to
+model the database round trip. That makes it cheap to compare branches:
+numbers reflect the API's own overhead plus how many backend calls each
+request makes, not the network.
+
+    cd server_python
+    python bench/run_bench.py                          # all scenarios
+    python bench/run_bench.py -s place_table_order kds_orders -c 100 -n 5000
+    python bench/run_bench.py --latency-ms 20 --json results.json
+
+Scenarios run in the order given against the same data, so orders placed
+by the placement scenarios are on the KDS board and in the admin lists
+for the ones that follow.
+
+For every scenario it reports req/s, p50/p95/p99 latency (ms), errors and
+backend calls per request; --json writes the same numbers for diffing.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# Settings the app reads at import time
+os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-secret-" + "x" * 32)
+os.environ.setdefault("AUTH_REMOTE_FALLBACK", "false")
+os.environ.setdefault("IDEMPOTENCY_BACKEND", "memory")
+os.environ.setdefault("GEOCODE_BACKEND", "none")
+os.environ.setdefault("GEOCODE_CACHE_PATH", os.path.join(tempfile.mkdtemp(), "geocode_cache.sqlite3"))
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+import jwt
+
+from fake_supabase import FakeSupabase
+
+ESTABLISHMENT_ID = str(uuid.UUID(int=1))
+ADMIN_ID = str(uuid.UUID(int=2))
+CUSTOMER_ID = str(uuid.UUID(int=3))
+
+
+# --- data ---
+
+def seed(orders: int = 2000, products: int = 60, tables: int = 30, days: int = 7):
+    """A single establishment with a menu and `orders` orders spread over the last `days` days."""
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+    data = {
+        'establishments': [{'id': ESTABLISHMENT_ID, 'name': 'Bench', 'street': 'Rua Augusta 1',
+                            'zip_code': '1100-048', 'city': 'Lisboa', 'country': 'Portugal'}],
+        'profiles': [
+            {'id': ADMIN_ID, 'role': 'admin', 'full_name': 'Bench Admin', 'email': 'admin@bench'},
+            {'id': CUSTOMER_ID, 'role': 'client', 'full_name': 'Bench Customer', 'email': 'customer@bench',
+             'street': 'Rua do Ouro 10', 'city': 'Lisboa', 'country': 'Portugal'},
+        ],
+        'categories': [{'id': str(uuid.UUID(int=100 + i)), 'name': f'Category {i}', 'establishment_id': ESTABLISHMENT_ID}
+                       for i in range(6)],
+        'tables': [{'id': str(uuid.UUID(int=1000 + i)), 'table_number': str(i + 1), 'establishment_id': ESTABLISHMENT_ID,
+                    'qr_code_uuid': str(uuid.UUID(int=2000 + i))} for i in range(tables)],
+        'orders': [], 'order_items': [], 'deliveries': [],
+    }
+    data['products'] = [{
+        'id': str(uuid.UUID(int=10000 + i)),
+        'name': f'Product {i}',
+        'price': round(rng.uniform(2, 25), 2),
+        'category_id': data['categories'][i % len(data['categories'])]['id'],
+        'is_available': True,
+        'establishment_id': ESTABLISHMENT_ID,
+    } for i in range(products)]
+
+    statuses = ['pending', 'prep', 'ready', 'delivered', 'completed', 'cancelled']
+    for i in range(orders):
+        created = now - timedelta(seconds=rng.uniform(0, days * 86400))
+        # Most of today's orders are still on the board
+        status = rng.choice(statuses[:2] if now - created < timedelta(hours=2) else statuses[2:])
+        delivery = rng.random() < 0.3
+        order = {
+            'id': str(uuid.UUID(int=10 ** 6 + i)),
+            'establishment_id': ESTABLISHMENT_ID,
+            'table_id': None if delivery else rng.choice(data['tables'])['id'],
+            'user_id': CUSTOMER_ID if delivery else None,
+            'order_type': 'delivery' if delivery else 'dine_in',
+            'status': status,
+            'created_at': created.isoformat(),
+        }
+        total = 0.0
+        for product in rng.sample(data['products'], rng.randint(1, 4)):
+            quantity = rng.randint(1, 3)
+            total += product['price'] * quantity
+            data['order_items'].append({'id': str(uuid.uuid4()), 'order_id': order['id'], 'product_id': product['id'],
+                                        'quantity': quantity, 'unit_price': product['price']})
+        order['total_amount'] = round(total, 2)
+        data['orders'].append(order)
+        if delivery:
+            data['deliveries'].append({
+                'id': str(uuid.uuid4()), 'order_id': order['id'], 'address': 'Rua do Ouro 10, Lisboa',
+                'status': 'open' if status in ('pending', 'prep') else 'delivered', 'driver_id': None,
+                'current_lat': 38.71 + rng.uniform(-0.02, 0.02), 'current_lng': -9.14 + rng.uniform(-0.02, 0.02),
+                'created_at': order['created_at'],
+            })
+    return data
+
+
+def token(user_id: str, role: str):
+    now = int(time.time())
+    claims = {'sub': user_id, 'aud': 'authenticated', 'iat': now, 'exp': now + 3600,
+              'role': 'authenticated', 'app_metadata': {'role': role}}
+    return jwt.encode(claims, os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256")
+
+
+# --- scenarios ---
+# Each returns (method, path, kwargs for httpx) for the i-th request.
+
+def _items(data, rng):
+    return [{'product_id': p['id'], 'quantity': rng.randint(1, 3)} for p in rng.sample(data['products'], 2)]
+
+
+def place_table_order(data, rng, i, admin):
+    table = rng.choice(data['tables'])
+    body = {'table_id': table['table_number'], 'items': _items(data, rng), 'total': 0}
+    return 'POST', '/orders/table', {'json': body}
+
+
+def place_delivery_order(data, rng, i, admin):
+    body = {'items': _items(data, rng), 'total': 0, 'user_id': CUSTOMER_ID, 'delivery_address': 'Rua do Ouro 10, Lisboa'}
+    return 'POST', '/orders/delivery', {'json': body}
+
+
+def menu(data, rng, i, admin):
+    return 'GET', '/menu', {}
+
+
+def kds_orders(data, rng, i, admin):
+    return 'GET', '/kds/orders', {'headers': admin}
+
+
+def admin_orders(data, rng, i, admin):
+    return 'GET', '/admin/orders', {'params': {'limit': 50}, 'headers': admin}
+
+
+def admin_orders_slim(data, rng, i, admin):
+    params = {'limit': 50, 'fields': 'id,status,total_amount,created_at', 'expand': ''}
+    return 'GET', '/admin/orders', {'params': params, 'headers': admin}
+
+
+def stats_today(data, rng, i, admin):
+    return 'GET', '/admin/stats/today', {'headers': admin}
+
+
+def stats_sales(data, rng, i, admin):
+    return 'GET', '/admin/stats/sales', {'params': {'period': 'daily'}, 'headers': admin}
+
+
+def stats_top_products(data, rng, i, admin):
+    return 'GET', '/admin/stats/top_products', {'headers': admin}
+
+
+def stats_orders_by_status(data, rng, i, admin):
+    return 'GET', '/admin/stats/orders-by-status', {'headers': admin}
+
+
+SCENARIOS = {f.__name__: f for f in (
+    place_table_order, place_delivery_order, menu, kds_orders, admin_orders, admin_orders_slim,
+    stats_today, stats_sales, stats_top_products, stats_orders_by_status,
+)}
+
+
+# --- runner ---
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client, name, data, admin, backends, requests: int, concurrency: int, warmup: int):
+    """`backends` are the fake clients whose calls are counted (async repository + sync deps/roles)."""
+    make = SCENARIOS[name]
+    rng = random.Random(name)
+
+    async def send(i):
+        method, path, kwargs = make(data, rng, i, admin)
+        return await client.request(method, path, **kwargs)
+
+    for i in range(warmup):
+        await send(i)
+
+    latencies, errors, statuses = [], 0, {}
+    counter = iter(range(requests))
+    calls_before = sum(b.total_calls for b in backends)
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                res = await send(i)
+                status = res.status_code
+            except Exception as e:
+                print(f"{name}: request failed: {e}")
+                status = 'exception'
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 'exception' or status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    backend_calls = sum(b.total_calls for b in backends) - calls_before
+
+    latencies.sort()
+    return {
+        'scenario': name,
+        'requests': requests,
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'rps': round(requests / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        'errors': errors,
+        'status_codes': {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        'backend_calls_per_request': round(backend_calls / requests, 3) if requests else 0.0,
+    }
+
+
+async def run(args):
+    data = seed(orders=args.orders)
+    latency = args.latency_ms / 1000
+    db = FakeSupabase(data, is_async=True, latency=latency)
+    sync_db = FakeSupabase(data, latency=latency)
+
+    import database
+    from metrics import instrument_client
+    # Wrapped like the real clients so the instrumentation overhead is measured too
+    database.async_supabase = instrument_client(db)
+    import deps
+    import main
+    main.supabase = instrument_client(sync_db)
+    deps.supabase = main.supabase
+
+    admin = {'Authorization': f"Bearer {token(ADMIN_ID, 'admin')}"}
+    results = []
+    async with main.app.router.lifespan_context(main.app):
+        # Let the startup backfills / first reconciles finish before measuring
+        await asyncio.sleep(args.settle)
+        print(HEADER + "   (latency in ms)")
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            for name in args.scenarios:
+                result = await run_scenario(client, name, data, admin, (db, sync_db), args.requests, args.concurrency, args.warmup)
+                results.append(result)
+                print_row(result)
+    return {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'config': {'requests': args.requests, 'concurrency': args.concurrency, 'latency_ms': args.latency_ms,
+                   'orders': args.orders, 'warmup': args.warmup},
+        'results': results,
+    }
+
+
+HEADER = f"{'scenario':<24}{'req/s':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'errors':>8}{'calls/req':>11}"
+
+
+def print_row(r):
+    print(f"{r['scenario']:<24}{r['rps']:>10.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+          f"{r['errors']:>8}{r['backend_calls_per_request']:>11.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('-n', '--requests', type=int, default=1000, help='requests per scenario')
+    parser.add_argument('-c', '--concurrency', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='simulated database round trip')
+    parser.add_argument('--orders', type=int, default=2000, help='orders seeded before the run')
+    parser.add_argument('--warmup', type=int, default=20, help='unmeasured requests per scenario')
+    parser.add_argument('--settle', type=float, default=0.5, help='seconds to wait after startup')
+    parser.add_argument('--json', metavar='PATH', help='write results as JSON')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 import os
+import httpx
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import create_client, Client, acreate_client, AsyncClient, AsyncClientOptions
+from metrics import instrument_client
 
 load_dotenv()
 
@@ -16,9 +18,47 @@ print(f"DEBUG: KEY found? {bool(key)}")
 supabase: Client = None
 if url and key:
     try:
-        supabase = create_client(url, key)
+        # Every query is timed and attributed to the calling route (metrics.py)
+        supabase = instrument_client(create_client(url, key))
         print("DEBUG: Supabase Client Initialized Successfully!")
     except Exception as e:
         print(f"DEBUG: Failed to init Supabase: {e}")
 else:
     print("DEBUG: Missing URL or KEY - Supabase will remain None.")
+
+# Async client used by the API handlers (see repository.py). It has to be
+# created inside the running event loop, so main.py calls init_async_client()
+# on startup. All PostgREST calls share one pooled HTTP client.
+async_supabase: AsyncClient = None
+http_client: httpx.AsyncClient = None
+
+HTTP_POOL_SIZE = int(os.getenv("SUPABASE_HTTP_POOL_SIZE", "100"))
+HTTP_TIMEOUT = float(os.getenv("SUPABASE_HTTP_TIMEOUT", "30"))
+
+async def init_async_client():
+    global async_supabase, http_client
+    if not (url and key) or async_supabase is not None:
+        return async_supabase
+    try:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_SIZE,
+                max_keepalive_connections=HTTP_POOL_SIZE,
+            ),
+            timeout=HTTP_TIMEOUT,
+            follow_redirects=True,
+        )
+        async_supabase = instrument_client(
+            await acreate_client(url, key, options=AsyncClientOptions(httpx_client=http_client))
+        )
+        print("DEBUG: Async Supabase Client Initialized Successfully!")
+    except Exception as e:
+        print(f"DEBUG: Failed to init async Supabase: {e}")
+    return async_supabase
+
+async def close_async_client():
+    global async_supabase, http_client
+    if http_client is not None:
+        await http_client.aclose()
+    async_supabase = None
+    http_client = None
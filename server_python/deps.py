@@ -1,53 +1,47 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from database import supabase
+from tokens import verify_token, InvalidToken
+from roles import resolve_role
 
 security = HTTPBearer()
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
-    Validates the Bearer token using Supabase Auth.
+    Validates the Bearer token, locally when possible (see tokens.py).
+    Verified tokens are cached, so repeat calls skip the Auth server entirely.
     Returns the user data if valid, raises 401 otherwise.
     """
     token = credentials.credentials
-    
-    if not supabase:
-         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database connection unavailable"
-        )
 
     try:
-        # supabase.auth.get_user(token) validates the JWT
-        user = supabase.auth.get_user(token)
-        if not user:
-             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return user
+        return verify_token(token, remote_client=supabase)
+    except InvalidToken as e:
+        print(f"Auth Error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     except Exception as e:
         print(f"Auth Error: {e}")
+        if not supabase:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Database connection unavailable"
+            )
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def get_current_admin(user = Depends(get_current_user)):
-    """
-    Validates that the current user has 'admin' role.
-    """
+def _require_role(user, role: str, detail: str):
     try:
-        user_id = user.user.id
-        # Check profile for role (Source of Truth)
-        res = supabase.table('profiles').select('role').eq('id', user_id).single().execute()
-        
-        if not res.data or res.data.get('role') != 'admin':
+        if resolve_role(user, supabase) != role:
              raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
-                detail="Admin privileges required"
+                detail=detail
             )
         return user
     except Exception as e:
@@ -56,22 +50,26 @@ def get_current_admin(user = Depends(get_current_user)):
             raise e
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
 
+def get_current_admin(user = Depends(get_current_user)):
+    """
+    Validates that the current user has 'admin' role.
+    The role comes from the JWT claim or the role cache (see roles.py).
+    """
+    return _require_role(user, 'admin', "Admin privileges required")
+
 def get_current_driver(user = Depends(get_current_user)):
     """
     Validates that the current user has 'driver' role.
     """
+    return _require_role(user, 'driver', "Driver privileges required")
+
+def get_current_user_role(user = Depends(get_current_user)):
+    """
+    The current user and their role ('admin', 'driver', 'client' or None),
+    for endpoints open to several roles with per-resource checks.
+    """
     try:
-        user_id = user.user.id
-        res = supabase.table('profiles').select('role').eq('id', user_id).single().execute()
-        
-        if not res.data or res.data.get('role') != 'driver':
-             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Driver privileges required"
-            )
-        return user
+        return user, resolve_role(user, supabase)
     except Exception as e:
         print(f"RBAC Error: {e}")
-        if isinstance(e, HTTPException):
-            raise e
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+        return user, None
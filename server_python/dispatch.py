@@ -0,0 +1,141 @@
+import asyncio
+import os
+import time
+
+import repository
+from geo_index import GridIndex
+
+RECONCILE_INTERVAL = float(os.getenv("DISPATCH_RECONCILE_INTERVAL", "60"))
+# Driver positions older than this are not suggested
+DRIVER_MAX_AGE = float(os.getenv("DISPATCH_DRIVER_MAX_AGE", "300"))
+
+
+class DispatchIndex:
+    """
+    Spatial indexes for matching drivers and jobs: the open delivery pool
+    (keyed by delivery id) and the last known position of each driver
+    (keyed by driver id). Kept current by the delivery write paths and the
+    location endpoints, and reloaded periodically from deliveries.
+    """
+
+    def __init__(self):
+        self.open_deliveries = GridIndex()
+        self.drivers = GridIndex()
+        self._by_order = {}  # order_id -> delivery_id, for open deliveries
+        self.ready = False
+        self._touched = None  # delivery ids changed while a reload is in flight
+        self._lock = asyncio.Lock()
+
+    # --- open delivery pool ---
+
+    def _touch(self, delivery_id):
+        if self._touched is not None:
+            self._touched.add(str(delivery_id))
+
+    def add_open_delivery(self, delivery: dict):
+        self._touch(delivery['id'])
+        lat, lng = delivery.get('current_lat'), delivery.get('current_lng')
+        if lat is None or lng is None:
+            return
+        delivery_id = str(delivery['id'])
+        data = {
+            'delivery_id': delivery_id,
+            'order_id': str(delivery.get('order_id')),
+            'address': delivery.get('address'),
+            'created_at': delivery.get('created_at'),
+        }
+        self.open_deliveries.upsert(delivery_id, float(lat), float(lng), data)
+        self._by_order[data['order_id']] = delivery_id
+
+    def move_delivery(self, delivery_id: str, lat: float, lng: float):
+        self._touch(delivery_id)
+        entry = self.open_deliveries.get(str(delivery_id))
+        if entry is not None:
+            self.open_deliveries.upsert(str(delivery_id), lat, lng, entry[2])
+
+    def close_delivery(self, delivery_id: str):
+        self._touch(delivery_id)
+        entry = self.open_deliveries.remove(str(delivery_id))
+        if entry is not None:
+            self._by_order.pop(entry[2]['order_id'], None)
+
+    def open_delivery_for_order(self, order_id: str):
+        delivery_id = self._by_order.get(str(order_id))
+        return self.open_deliveries.get(delivery_id) if delivery_id else None
+
+    # --- drivers ---
+
+    def update_driver(self, driver_id: str, lat: float, lng: float, delivery_id=None):
+        """Latest position of a driver; delivery_id is set while they are on a delivery."""
+        self.drivers.upsert(str(driver_id), lat, lng, {
+            'driver_id': str(driver_id),
+            'delivery_id': delivery_id,
+            'seen_at': time.monotonic(),
+        })
+
+    def move_driver(self, driver_id: str, lat: float, lng: float):
+        """New position only: a driver on a delivery stays on it."""
+        entry = self.drivers.get(str(driver_id))
+        self.update_driver(driver_id, lat, lng, delivery_id=entry[2]['delivery_id'] if entry else None)
+
+    def remove_driver(self, driver_id: str):
+        self.drivers.remove(str(driver_id))
+
+    # --- queries ---
+
+    def nearest_drivers(self, lat: float, lng: float, k: int = 5, max_km: float | None = None,
+                        include_busy: bool = False, max_age: float = DRIVER_MAX_AGE):
+        cutoff = time.monotonic() - max_age
+
+        def eligible(key, data):
+            return data['seen_at'] >= cutoff and (include_busy or data['delivery_id'] is None)
+
+        return self.drivers.nearest(lat, lng, k, max_km=max_km, where=eligible)
+
+    def nearby_deliveries(self, lat: float, lng: float, radius_km: float, limit: int = 20):
+        return self.open_deliveries.nearest(lat, lng, limit, max_km=radius_km)
+
+    # --- loading / reconciliation ---
+
+    async def reconcile(self):
+        """Reloads the open pool; changes made while the query ran win over its result."""
+        async with self._lock:
+            self._touched = set()
+            try:
+                deliveries = await repository.get_open_deliveries()
+                touched, self._touched = self._touched, None
+                kept = {key: self.open_deliveries.get(key) for key in touched}
+                self.open_deliveries.clear()
+                self._by_order = {}
+                for delivery in deliveries:
+                    if str(delivery['id']) not in touched:
+                        self.add_open_delivery(delivery)
+                for key, entry in kept.items():
+                    if entry is not None:
+                        self.open_deliveries.upsert(key, entry[0], entry[1], entry[2])
+                        self._by_order[entry[2]['order_id']] = key
+            finally:
+                self._touched = None
+            cutoff = time.monotonic() - DRIVER_MAX_AGE
+            for driver_id in [k for k, (_, _, d) in self.drivers.items() if d['seen_at'] < cutoff]:
+                self.drivers.remove(driver_id)
+            self.ready = True
+
+    async def ensure_ready(self):
+        if not self.ready:
+            await self.reconcile()
+
+    async def run_reconciler(self, interval: float = RECONCILE_INTERVAL):
+        """Background loop started by main.py's lifespan."""
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"Error reconciling dispatch index: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        return {"open_deliveries": len(self.open_deliveries), "drivers": len(self.drivers)}
+
+
+dispatch = DispatchIndex()
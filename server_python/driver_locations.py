@@ -0,0 +1,149 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+import repository
+from cache import TTLCache
+from rollups import parse_timestamp
+
+# Positions are written to deliveries at most once per delivery every
+# LOCATION_FLUSH_INTERVAL seconds, whatever the fix rate.
+FLUSH_INTERVAL = float(os.getenv("LOCATION_FLUSH_INTERVAL", "5"))
+FLUSH_BATCH_SIZE = int(os.getenv("LOCATION_FLUSH_BATCH_SIZE", "500"))
+# Positions not updated for this long are dropped from memory
+STALE_AFTER = float(os.getenv("LOCATION_STALE_AFTER", "3600"))
+
+
+class LocationStore:
+    """
+    Latest known position per delivery, fed by POST /driver/location.
+    Reads are served from here; a write-behind flusher persists only the
+    latest position of each delivery that moved since the last flush, in
+    bulk, so the database sees one write per delivery per interval instead
+    of one per GPS fix.
+    """
+
+    def __init__(self):
+        self._latest = {}  # delivery_id -> position dict
+        self._dirty = set()
+        self._owners = TTLCache(maxsize=10000, ttl=60)  # delivery_id -> driver_id
+        self._parties = TTLCache(maxsize=10000, ttl=60)  # delivery_id -> {driver_id, user_id}
+        self.fixes_received = 0
+        self.rows_flushed = 0
+        self.flushes = 0
+
+    # --- ingest ---
+
+    async def owner_of(self, delivery_id: str):
+        """driver_id assigned to the delivery (cached briefly), or None."""
+        owner = self._owners.get(delivery_id)
+        if owner is None:
+            delivery = await repository.get_delivery(delivery_id)
+            owner = (delivery or {}).get('driver_id')
+            if owner:
+                self._owners.set(delivery_id, owner)
+        return owner
+
+    def set_owner(self, delivery_id: str, driver_id: str):
+        self._owners.set(delivery_id, driver_id)
+        self._parties.pop(delivery_id)
+
+    async def parties_of(self, delivery_id: str):
+        """{driver_id, user_id} allowed to follow the delivery (cached briefly), or None if it doesn't exist."""
+        parties = self._parties.get(delivery_id)
+        if parties is None:
+            parties = await repository.get_delivery_parties(delivery_id)
+            if parties:
+                self._parties.set(delivery_id, parties)
+        return parties
+
+    def record(self, delivery_id: str, driver_id, lat: float, lng: float,
+               heading=None, speed=None, recorded_at=None, persist: bool = True):
+        """
+        Keeps the fix if it is newer than the one we have. Returns True if kept.
+        With persist=False it is only served from memory (synthetic load tests).
+        """
+        self.fixes_received += 1
+        recorded_at = parse_timestamp(recorded_at) if recorded_at else datetime.now(timezone.utc)
+        current = self._latest.get(delivery_id)
+        if current is not None and current['recorded_at'] >= recorded_at:
+            return False  # out of order (e.g. a batch replayed after a reconnect)
+        self._latest[delivery_id] = {
+            'delivery_id': delivery_id,
+            'driver_id': driver_id,
+            'lat': lat,
+            'lng': lng,
+            'heading': heading,
+            'speed': speed,
+            'recorded_at': recorded_at,
+            'received_at': time.monotonic(),
+        }
+        if persist:
+            self._dirty.add(delivery_id)
+        return True
+
+    # --- reads ---
+
+    def get(self, delivery_id: str):
+        return self._latest.get(delivery_id)
+
+    def all(self):
+        return list(self._latest.values())
+
+    def forget(self, delivery_id: str):
+        self._latest.pop(delivery_id, None)
+        self._dirty.discard(delivery_id)
+
+    # --- write-behind ---
+
+    async def flush(self):
+        """Persists every delivery whose position changed since the last flush."""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, set()
+        pending = [self._latest[d] for d in dirty if d in self._latest]
+        written = 0
+        try:
+            for i in range(0, len(pending), FLUSH_BATCH_SIZE):
+                batch = pending[i:i + FLUSH_BATCH_SIZE]
+                await repository.update_delivery_positions([
+                    {'id': p['delivery_id'], 'current_lat': p['lat'], 'current_lng': p['lng']}
+                    for p in batch
+                ])
+                written += len(batch)
+        except Exception:
+            # Retry the unwritten ones next time (newer fixes are already dirty)
+            self._dirty.update(p['delivery_id'] for p in pending[written:])
+            raise
+        finally:
+            self.rows_flushed += written
+            self.flushes += 1
+        return written
+
+    def _prune(self):
+        cutoff = time.monotonic() - STALE_AFTER
+        for delivery_id in [d for d, p in self._latest.items() if p['received_at'] < cutoff and d not in self._dirty]:
+            del self._latest[delivery_id]
+
+    async def run_flusher(self, interval: float = FLUSH_INTERVAL):
+        """Background loop started by main.py's lifespan."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+                self._prune()
+            except Exception as e:
+                print(f"Error flushing driver locations: {e}")
+
+    def stats(self):
+        return {
+            "tracked": len(self._latest),
+            "pending": len(self._dirty),
+            "fixes_received": self.fixes_received,
+            "rows_flushed": self.rows_flushed,
+            "flushes": self.flushes,
+        }
+
+
+driver_locations = LocationStore()
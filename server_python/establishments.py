@@ -0,0 +1,68 @@
+import asyncio
+import os
+
+from fastapi import HTTPException
+
+import repository
+
+# Establishment used for delivery orders and new products. Defaults to the
+# first establishment returned by the database (what the old
+# `select("id").limit(1)` lookups picked).
+DEFAULT_ESTABLISHMENT_ID = os.getenv("DEFAULT_ESTABLISHMENT_ID")
+
+
+class EstablishmentDirectory:
+    """
+    Establishments loaded once and kept in memory, indexed by id.
+    Establishments rarely change, so there is no TTL: call refresh()
+    (or POST /admin/establishments/refresh) after editing them.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._by_id = {}
+        self._default = None
+        self._lock = asyncio.Lock()
+
+    def replace(self, rows):
+        self._by_id = {str(row['id']): row for row in rows}
+        default = self._by_id.get(str(DEFAULT_ESTABLISHMENT_ID)) if DEFAULT_ESTABLISHMENT_ID else None
+        self._default = default or (rows[0] if rows else None)
+        self.loaded = True
+
+    async def refresh(self):
+        async with self._lock:
+            rows = await repository.get_establishments()
+            self.replace(rows)
+            print(f"Establishments loaded: {len(rows)}")
+
+    async def ensure_loaded(self):
+        if not self.loaded:
+            await self.refresh()
+        return self
+
+    def get(self, establishment_id):
+        return self._by_id.get(str(establishment_id))
+
+    @property
+    def default(self):
+        return self._default
+
+    @property
+    def default_id(self):
+        return self._default['id'] if self._default else None
+
+    def all(self):
+        return list(self._by_id.values())
+
+
+establishments = EstablishmentDirectory()
+
+
+async def get_establishments():
+    """FastAPI dependency: the loaded establishment directory."""
+    try:
+        return await establishments.ensure_loaded()
+    except Exception as e:
+        print(f"Error loading establishments: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
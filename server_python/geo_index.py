@@ -0,0 +1,136 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """
+    Uniform lat/lng grid of points (cells of `cell_deg` degrees, ~1.1 km of
+    latitude at the default). Nearest-k and radius queries only look at
+    the rings of cells around the query point, so their cost depends on
+    local density rather than on the total number of points.
+    """
+
+    def __init__(self, cell_deg: float = 0.01):
+        self.cell_deg = cell_deg
+        self._points = {}  # key -> (lat, lng, data)
+        self._cells = {}   # (row, col) -> set of keys
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def upsert(self, key, lat: float, lng: float, data=None):
+        old = self._points.get(key)
+        cell = self._cell(lat, lng)
+        if old is not None:
+            old_cell = self._cell(old[0], old[1])
+            if old_cell != cell:
+                self._remove_from_cell(old_cell, key)
+        self._points[key] = (lat, lng, data)
+        self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        old = self._points.pop(key, None)
+        if old is not None:
+            self._remove_from_cell(self._cell(old[0], old[1]), key)
+        return old
+
+    def _remove_from_cell(self, cell, key):
+        keys = self._cells.get(cell)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._cells[cell]
+
+    def get(self, key):
+        return self._points.get(key)
+
+    def clear(self):
+        self._points.clear()
+        self._cells.clear()
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, key):
+        return key in self._points
+
+    def items(self):
+        return self._points.items()
+
+    def _ring(self, center, r):
+        row, col = center
+        if r == 0:
+            yield center
+            return
+        for c in range(col - r, col + r + 1):
+            yield (row - r, c)
+            yield (row + r, c)
+        for rr in range(row - r + 1, row + r):
+            yield (rr, col - r)
+            yield (rr, col + r)
+
+    def _ring_min_km(self, lat, r):
+        """Lower bound on the distance to any point beyond ring r - 1."""
+        if r == 0:
+            return 0.0
+        deg_km = math.pi * EARTH_RADIUS_KM / 180
+        # A longitude degree is narrowest at the highest latitude the ring spans
+        lat_edge = min(89.9, abs(lat) + r * self.cell_deg)
+        return (r - 1) * self.cell_deg * deg_km * min(1.0, math.cos(math.radians(lat_edge)))
+
+    def nearest(self, lat: float, lng: float, k: int = 5, max_km: float | None = None, where=None):
+        """Up to k (distance_km, key, data) tuples, closest first."""
+        if k <= 0 or not self._points:
+            return []
+        center = self._cell(lat, lng)
+        found = []
+        visited = 0
+        r = 0
+        while visited < len(self._points):
+            ring_min = self._ring_min_km(lat, r)
+            if max_km is not None and ring_min > max_km:
+                break
+            if len(found) >= k and ring_min > found[k - 1][0]:
+                break
+            if 8 * r > len(self._cells):
+                # Sparse far-away points: scanning the rest beats probing empty cells
+                self._scan(lat, lng, max_km, where, found, skip_within=r - 1, center=center)
+                found.sort(key=lambda f: f[0])
+                break
+            for cell in self._ring(center, r):
+                for key in self._cells.get(cell, ()):
+                    visited += 1
+                    self._consider(lat, lng, key, max_km, where, found)
+            found.sort(key=lambda f: f[0])
+            r += 1
+        return found[:k]
+
+    def _consider(self, lat, lng, key, max_km, where, found):
+        plat, plng, data = self._points[key]
+        if where is not None and not where(key, data):
+            return
+        distance = haversine_km(lat, lng, plat, plng)
+        if max_km is None or distance <= max_km:
+            found.append((distance, key, data))
+
+    def _scan(self, lat, lng, max_km, where, found, skip_within, center):
+        """Every point outside the rings already visited (Chebyshev distance > skip_within)."""
+        row, col = center
+        for cell, keys in self._cells.items():
+            if max(abs(cell[0] - row), abs(cell[1] - col)) <= skip_within:
+                continue
+            for key in keys:
+                self._consider(lat, lng, key, max_km, where, found)
+
+    def within(self, lat: float, lng: float, radius_km: float, where=None):
+        """All (distance_km, key, data) within radius_km, closest first."""
+        return self.nearest(lat, lng, k=len(self._points), max_km=radius_km, where=where)
@@ -0,0 +1,263 @@
+import asyncio
+import csv
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import httpx
+
+from cache import TTLCache
+
+# nominatim (default), gazetteer (offline table, for tests / dev) or none
+GEOCODE_BACKEND = os.getenv("GEOCODE_BACKEND", "nominatim")
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "geocode_cache.sqlite3")
+GEOCODE_GAZETTEER_PATH = os.getenv(
+    "GEOCODE_GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.csv")
+)
+# Nominatim's usage policy allows at most one request per second
+GEOCODE_MIN_INTERVAL = float(os.getenv("GEOCODE_MIN_INTERVAL", "1.0"))
+# Addresses that could not be found are retried after this many seconds
+GEOCODE_NEGATIVE_TTL = float(os.getenv("GEOCODE_NEGATIVE_TTL", str(24 * 3600)))
+# Recently used addresses kept in memory in front of the SQLite file
+GEOCODE_MEMORY_SIZE = int(os.getenv("GEOCODE_MEMORY_SIZE", "10000"))
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+NOMINATIM_USER_AGENT = os.getenv("NOMINATIM_USER_AGENT", "manda_ai")
+
+# Used until the establishment address has been resolved (Lisbon)
+DEFAULT_COORDINATES = (38.7223, -9.1393)
+
+
+def build_address_string(data):
+    if not data: return None
+    components = [
+        data.get('street'),
+        data.get('zip_code'),
+        data.get('city'),
+        data.get('country')
+    ]
+    # Filter empty/null and join
+    return ", ".join([c for c in components if c])
+
+
+def normalize_address(address: str) -> str:
+    """Cache key: case, accents, punctuation and spacing don't matter."""
+    text = unicodedata.normalize('NFKD', address)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    text = re.sub(r'[^\w\s,-]', ' ', text)
+    parts = [' '.join(part.split()) for part in text.split(',')]
+    return ', '.join(part for part in parts if part)
+
+
+# --- cache ---
+
+class GeocodeCache:
+    """
+    Persistent address -> coordinates cache in a local SQLite file (misses
+    included), with recently used entries kept in memory so repeat lookups
+    don't touch the disk. The file is opened on first use.
+    """
+
+    def __init__(self, path: str = GEOCODE_CACHE_PATH, negative_ttl: float = GEOCODE_NEGATIVE_TTL,
+                 memory_size: int = GEOCODE_MEMORY_SIZE):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self._memory = TTLCache(maxsize=memory_size, ttl=negative_ttl)  # key -> (coords,)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(
+                "create table if not exists geocode_cache ("
+                " key text primary key, lat real, lng real, created_at real not null)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, key, coords, created_at):
+        # Misses only until they are due for a retry
+        ttl = None if coords else self.negative_ttl - (time.time() - created_at)
+        self._memory.set(key, (coords,), ttl=ttl)
+
+    def get(self, key):
+        """(True, (lat, lng) or None) when cached, else (False, None)."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            return True, entry[0]
+        with self._lock:
+            row = self._connection().execute(
+                "select lat, lng, created_at from geocode_cache where key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return False, None
+        lat, lng, created_at = row
+        if lat is None:
+            if time.time() - created_at > self.negative_ttl:
+                return False, None
+            self._remember(key, None, created_at)
+            return True, None
+        self._remember(key, (lat, lng), created_at)
+        return True, (lat, lng)
+
+    def set(self, key, coords):
+        lat, lng = coords if coords else (None, None)
+        now = time.time()
+        self._remember(key, (lat, lng) if coords else None, now)
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "insert or replace into geocode_cache (key, lat, lng, created_at) values (?, ?, ?, ?)",
+                (key, lat, lng, now),
+            )
+            conn.commit()
+
+
+class RateLimiter:
+    """Spaces calls at least `min_interval` seconds apart."""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            delay = self._next - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = time.monotonic() + self.min_interval
+
+
+# --- backends ---
+
+class NominatimBackend:
+    """OpenStreetMap Nominatim over HTTP."""
+
+    rate_limited = True
+
+    def __init__(self, url: str = NOMINATIM_URL, user_agent: str = NOMINATIM_USER_AGENT):
+        self.url = url
+        self.user_agent = user_agent
+        self._client = None
+
+    async def geocode(self, address: str):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=10.0, headers={"User-Agent": self.user_agent})
+        res = await self._client.get(self.url, params={"q": address, "format": "json", "limit": 1})
+        res.raise_for_status()
+        results = res.json()
+        if not results:
+            return None
+        return float(results[0]['lat']), float(results[0]['lon'])
+
+
+class GazetteerBackend:
+    """
+    Offline lookup in a CSV table of `key,lat,lng` rows, where key is a
+    postcode (full or 4-digit prefix) or a place name. Tries the postcode
+    first, then each address component from the most specific.
+    """
+
+    rate_limited = False
+
+    def __init__(self, path: str = GEOCODE_GAZETTEER_PATH):
+        self._places = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                self._places[normalize_address(row['key'])] = (float(row['lat']), float(row['lng']))
+
+    async def geocode(self, address: str):
+        key = normalize_address(address)
+        for code in re.findall(r'\b(\d{4})(?:-(\d{3}))?\b', key):
+            for candidate in (f"{code[0]}-{code[1]}" if code[1] else None, code[0]):
+                if candidate and candidate in self._places:
+                    return self._places[candidate]
+        for part in key.split(', '):
+            if part in self._places:
+                return self._places[part]
+        return None
+
+
+class NullBackend:
+    rate_limited = False
+
+    async def geocode(self, address: str):
+        return None
+
+
+def _create_backend():
+    if GEOCODE_BACKEND == "gazetteer":
+        return GazetteerBackend()
+    if GEOCODE_BACKEND == "none":
+        return NullBackend()
+    return NominatimBackend()
+
+
+# --- service ---
+
+def _log_failure(task):
+    if not task.cancelled() and task.exception():
+        print(f"Error resolving coordinates: {task.exception()}")
+
+
+_background_tasks = set()  # keeps resolve_in_background() tasks referenced until done
+
+
+class Geocoder:
+    """
+    Cached, rate-limited geocoding. Concurrent lookups of the same address
+    share one backend call; results (and misses) are cached on disk, so
+    each address reaches the backend once.
+    """
+
+    def __init__(self, backend=None, cache=None, min_interval: float = GEOCODE_MIN_INTERVAL):
+        self.backend = backend or _create_backend()
+        self.cache = cache or GeocodeCache()
+        self.limiter = RateLimiter(min_interval)
+        self._inflight = {}
+        self.backend_calls = 0
+
+    def cached(self, address):
+        """Coordinates already in the cache, without calling the backend."""
+        if not address:
+            return None
+        return self.cache.get(normalize_address(address))[1]
+
+    async def geocode(self, address):
+        """(lat, lng) for an address string or None if it can't be found."""
+        if not address:
+            return None
+        key = normalize_address(address)
+        hit, coords = self.cache.get(key)
+        if hit:
+            return coords
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(self._lookup(key, address))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _lookup(self, key, address):
+        if self.backend.rate_limited:
+            await self.limiter.wait()
+        self.backend_calls += 1
+        coords = await self.backend.geocode(address)
+        self.cache.set(key, coords)
+        return coords
+
+    def resolve_in_background(self, coro):
+        """Runs a coroutine that uses geocode() without making the caller wait."""
+        task = asyncio.create_task(coro)
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+        task.add_done_callback(_log_failure)
+        return task
+
+
+geocoder = Geocoder()
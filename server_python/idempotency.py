@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from cache import TTLCache
+
+# memory (default) or sqlite. The sqlite store survives restarts and is
+# shared by workers on the same host.
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory")
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_DB_PATH = os.getenv("IDEMPOTENCY_DB_PATH", "idempotency.sqlite3")
+
+
+class MemoryIdempotencyStore:
+    """Bounded in-process store of completed responses."""
+
+    def __init__(self, maxsize: int = IDEMPOTENCY_MAX_KEYS, ttl: float = IDEMPOTENCY_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, record):
+        self._cache.set(key, record)
+
+
+class SQLiteIdempotencyStore:
+    """Persistent store in a local SQLite file, pruned by age and size."""
+
+    def __init__(self, path: str = IDEMPOTENCY_DB_PATH, maxsize: int = IDEMPOTENCY_MAX_KEYS, ttl: float = IDEMPOTENCY_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "create table if not exists idempotency_keys ("
+            " key text primary key, record text not null, created_at real not null)"
+        )
+        self._conn.commit()
+        self._writes = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "select record from idempotency_keys where key = ? and created_at > ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, record):
+        with self._lock:
+            self._conn.execute(
+                "insert or replace into idempotency_keys (key, record, created_at) values (?, ?, ?)",
+                (key, json.dumps(record), time.time()),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._prune()
+            self._conn.commit()
+
+    def _prune(self):
+        self._conn.execute("delete from idempotency_keys where created_at <= ?", (time.time() - self.ttl,))
+        self._conn.execute(
+            "delete from idempotency_keys where key not in ("
+            " select key from idempotency_keys order by created_at desc limit ?)",
+            (self.maxsize,),
+        )
+
+
+def _create_store():
+    if IDEMPOTENCY_BACKEND == "sqlite":
+        return SQLiteIdempotencyStore()
+    return MemoryIdempotencyStore()
+
+
+store = _create_store()
+
+# Requests with the same key that arrive while the first is still running
+# wait for it instead of placing a second order. Each entry is
+# [lock, holders]; it is dropped once no request is holding or waiting on it.
+_inflight = {}
+
+
+def _fingerprint(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def run_idempotent(key: str | None, scope: str, payload, handler):
+    """
+    Runs `handler()` once per (scope, Idempotency-Key). Retries with the same
+    key get the stored response back without touching the database. Only
+    successful responses are stored, so a failed attempt can be retried.
+    """
+    if not key:
+        return await handler()
+
+    store_key = f"{scope}:{key}"
+    fingerprint = _fingerprint(payload)
+
+    entry = _inflight.get(store_key)
+    if entry is None:
+        entry = _inflight[store_key] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            record = store.get(store_key)
+            if record is not None:
+                if record["fingerprint"] != fingerprint:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+                return JSONResponse(content=record["body"], headers={"Idempotent-Replayed": "true"})
+
+            body = await handler()
+            store.set(store_key, {"fingerprint": fingerprint, "body": body})
+            return body
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0 and _inflight.get(store_key) is entry:
+            del _inflight[store_key]
@@ -0,0 +1,190 @@
+import asyncio
+import bisect
+import json
+import os
+
+import repository
+from kds_feed import KDS_STATUSES, kds_hub
+from rollups import parse_timestamp
+
+# How often the board is reloaded from the database to correct drift
+# (e.g. orders changed directly in Supabase).
+RECONCILE_INTERVAL = float(os.getenv("KDS_BOARD_RECONCILE_INTERVAL", "120"))
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(',', ':'), default=str)
+
+
+def _log_failure(task):
+    if not task.cancelled() and task.exception():
+        print(f"Error loading KDS order: {task.exception()}")
+
+
+class ActiveBoard:
+    """
+    The kitchen board (pending / prep orders, in GET /kds/orders shape) kept
+    in memory: indexed by id, by status, and by (created_at, id) for the
+    oldest-first listing. Hydrated once, kept current by the order write
+    paths in main.py and periodically reconciled with the database.
+
+    Like the menu snapshot, the full listing is served as pre-serialized
+    JSON (orders_body()), rebuilt only when the board version changes and
+    reusing each unchanged order's serialized fragment.
+    """
+
+    def __init__(self):
+        self._orders = {}     # id -> order
+        self._by_status = {}  # status -> set of ids
+        self._timeline = []   # sorted (created_at, id)
+        self.ready = False
+        self._touched = None  # ids changed while a reload is in flight
+        self._lock = asyncio.Lock()
+        self._tasks = set()  # in-flight _load() tasks
+        self.version = 0      # bumped on every change to the board
+        self._fragments = {}  # id -> serialized order
+        self._body = None     # (version, serialized listing)
+
+    # --- index maintenance ---
+
+    @staticmethod
+    def _sort_key(order):
+        return (parse_timestamp(order['created_at']), str(order['id']))
+
+    def _insert(self, order):
+        order_id = str(order['id'])
+        self._discard(order_id)
+        self.version += 1
+        self._orders[order_id] = order
+        self._by_status.setdefault(order.get('status'), set()).add(order_id)
+        bisect.insort(self._timeline, self._sort_key(order))
+
+    def _discard(self, order_id):
+        order = self._orders.pop(order_id, None)
+        if order is None:
+            return None
+        self.version += 1
+        self._fragments.pop(order_id, None)
+        self._by_status.get(order.get('status'), set()).discard(order_id)
+        key = self._sort_key(order)
+        index = bisect.bisect_left(self._timeline, key)
+        if index < len(self._timeline) and self._timeline[index] == key:
+            del self._timeline[index]
+        return order
+
+    def _touch(self, order_id):
+        if self._touched is not None:
+            self._touched.add(order_id)
+
+    def _replace(self, orders):
+        self._orders, self._by_status, self._timeline = {}, {}, []
+        self._fragments = {}
+        self.version += 1
+        for order in orders:
+            self._insert(order)
+
+    # --- updates from the write paths ---
+
+    def add(self, kds_order: dict):
+        """A newly placed order (built with kds_feed.build_kds_order)."""
+        self._touch(str(kds_order['id']))
+        if kds_order.get('status') in KDS_STATUSES:
+            self._insert(kds_order)
+
+    def record_status_change(self, row: dict, old_status):
+        """`row` is a set_orders_status row (new status plus old_status)."""
+        order_id = str(row['id'])
+        self._touch(order_id)
+        new_status = row.get('status')
+        current = self._orders.get(order_id)
+        if new_status not in KDS_STATUSES:
+            self._discard(order_id)
+        elif current is not None:
+            self._by_status.get(current.get('status'), set()).discard(order_id)
+            current['status'] = new_status
+            self.version += 1
+            self._fragments.pop(order_id, None)
+            self._by_status.setdefault(new_status, set()).add(order_id)
+        elif old_status not in KDS_STATUSES:
+            # Back on the board: load it with its items, then tell the screens
+            task = asyncio.create_task(self._load(order_id))
+            self._tasks.add(task)  # keep a reference until it finishes
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(_log_failure)
+
+    async def _load(self, order_id):
+        orders = await repository.get_active_orders(order_ids=[order_id])
+        for order in orders:
+            self._touch(order_id)
+            self._insert(order)
+            kds_hub.publish('order_added', order)
+
+    # --- loading / reconciliation ---
+
+    async def reconcile(self):
+        """Reloads the board; changes made while the query ran win over its result."""
+        async with self._lock:
+            self._touched = set()
+            try:
+                orders = await repository.get_active_orders()
+                fresh = {str(o['id']): o for o in orders}
+                for order_id in self._touched:
+                    if order_id in self._orders:
+                        fresh[order_id] = self._orders[order_id]
+                    else:
+                        fresh.pop(order_id, None)
+                self._replace(fresh.values())
+                self.ready = True
+            finally:
+                self._touched = None
+
+    async def ensure_ready(self):
+        if not self.ready:
+            await self.reconcile()
+
+    async def run_reconciler(self, interval: float = RECONCILE_INTERVAL):
+        """Background loop started by main.py's lifespan."""
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"Error reconciling KDS board: {e}")
+            await asyncio.sleep(interval)
+
+    # --- reads ---
+
+    def orders(self, status: str | None = None):
+        """Active orders, oldest first, optionally for one status."""
+        if status is None:
+            return [self._orders[order_id] for _, order_id in self._timeline]
+        ids = self._by_status.get(status, ())
+        return [self._orders[order_id] for _, order_id in self._timeline if order_id in ids]
+
+    def orders_body(self) -> bytes:
+        """orders() as JSON, cached until the board changes."""
+        if self._body is None or self._body[0] != self.version:
+            parts = []
+            for _, order_id in self._timeline:
+                fragment = self._fragments.get(order_id)
+                if fragment is None:
+                    fragment = self._fragments[order_id] = _dumps(self._orders[order_id])
+                parts.append(fragment)
+            self._body = (self.version, f'[{",".join(parts)}]'.encode())
+        return self._body[1]
+
+    def get(self, order_id):
+        return self._orders.get(str(order_id))
+
+    def stats(self):
+        """Size of the board; memory is estimated from the serialized orders."""
+        size = sum(len(json.dumps(o, default=str)) for o in self._orders.values())
+        count = len(self._orders)
+        return {
+            "orders": count,
+            "by_status": {status: len(ids) for status, ids in self._by_status.items() if ids},
+            "approx_bytes": size,
+            "approx_bytes_per_order": round(size / count) if count else 0,
+        }
+
+
+kds_board = ActiveBoard()
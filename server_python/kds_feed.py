@@ -0,0 +1,145 @@
+import asyncio
+import itertools
+import json
+import os
+
+from menu import menu_catalog
+
+# Statuses shown on the kitchen board (same filter as GET /kds/orders)
+KDS_STATUSES = ('pending', 'prep')
+
+KEEPALIVE_INTERVAL = float(os.getenv("KDS_STREAM_KEEPALIVE", "15"))
+# Events buffered per screen; a screen that falls this far behind is
+# disconnected and gets a fresh snapshot when it reconnects.
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("KDS_STREAM_QUEUE_SIZE", "1000"))
+
+
+def build_kds_order(order: dict, items, table_number=None):
+    """
+    A newly placed order in the shape returned by GET /kds/orders
+    (order row + tables + order_items with product names), built from the
+    priced items and the menu catalog instead of re-reading it.
+    """
+    order_items = []
+    for item in items:
+        product = menu_catalog.get_product(item['product_id']) or {}
+        order_items.append({
+            "order_id": order['id'],
+            "product_id": item['product_id'],
+            "quantity": item['quantity'],
+            "unit_price": item['price'],
+            "notes": item.get('notes'),
+            "products": {"name": product.get('name')},
+        })
+    return {
+        **order,
+        "tables": {"table_number": table_number} if table_number is not None else None,
+        "order_items": order_items,
+    }
+
+
+class Subscriber:
+    def __init__(self, queue_size: int):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+
+class KDSHub:
+    """
+    In-process fan-out of kitchen board changes to connected screens.
+    Each subscriber gets its own bounded queue; publishing never blocks the
+    request that placed or updated the order.
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._seq = itertools.count(1)
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.queue_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event: str, data):
+        message = (next(self._seq), event, data)
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Too slow: drop it, the stream ends and the screen resyncs
+                subscriber.overflowed = True
+                self._subscribers.discard(subscriber)
+
+    # --- events from the order write paths ---
+
+    def order_added(self, kds_order: dict):
+        if kds_order.get('status') in KDS_STATUSES:
+            self.publish('order_added', kds_order)
+
+    def status_changed(self, order: dict, old_status):
+        """`order` is a set_orders_status row (new status plus old_status)."""
+        new_status = order.get('status')
+        if new_status == old_status:
+            return
+        if new_status in KDS_STATUSES:
+            # An order coming back onto the board (e.g. reopened) is published
+            # as order_added by kds_board once it has been loaded with its items
+            if old_status in KDS_STATUSES:
+                self.publish('status_changed', {"id": order['id'], "status": new_status})
+        elif old_status in KDS_STATUSES:
+            self.publish('order_removed', {"id": order['id'], "status": new_status})
+
+
+def format_event(event: str, data, event_id=None) -> str:
+    """One Server-Sent Events message."""
+    return format_raw_event(event, json.dumps(data, separators=(',', ':'), default=str), event_id)
+
+
+def format_raw_event(event: str, payload: str, event_id=None) -> str:
+    """Like format_event, with `payload` already serialized (single-line JSON)."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {payload}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def event_stream(hub: KDSHub, request, load_snapshot, keepalive: float = KEEPALIVE_INTERVAL):
+    """
+    SSE body for GET /kds/stream: a `snapshot` event with the whole board
+    (`load_snapshot` returns it as serialized JSON), then `order_added` /
+    `status_changed` / `order_removed` deltas.
+    Subscribes before loading the snapshot so no change is missed; deltas
+    are applied by id, so one already in the snapshot is harmless.
+    """
+    subscriber = hub.subscribe()
+    try:
+        orders = await load_snapshot()
+        yield format_raw_event('snapshot', f'{{"orders":{orders.decode()}}}')
+        while True:
+            if subscriber.overflowed and subscriber.queue.empty():
+                # Dropped by the hub: ask the screen to reconnect for a new snapshot
+                yield format_event('resync', {})
+                break
+            try:
+                seq, event, data = await asyncio.wait_for(subscriber.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(event, data, seq)
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+kds_hub = KDSHub()
@@ -1,11 +1,69 @@
+import asyncio
+import csv
+import io
+import json
+import re
+import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from fastapi import FastAPI, HTTPException, Depends
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from database import supabase
-from deps import get_current_user, get_current_admin, get_current_driver
+import repository
+from database import supabase, init_async_client, close_async_client
+from deps import get_current_user, get_current_admin, get_current_driver, get_current_user_role
+from roles import invalidate_role
+from table_directory import table_directory
+from establishments import EstablishmentDirectory, establishments, get_establishments
+from idempotency import run_idempotent
+from menu import menu_catalog, PricingError
+from rollups import sales_rollups, parse_timestamp, GRANULARITIES, MAX_RANGE_DAYS
+from top_products import top_products, WINDOWS as TOP_PRODUCT_WINDOWS
+from status_counters import status_counters
+from order_status import ORDER_STATUSES, allowed_from
+from stats_cache import stats_cache
+from kds_feed import kds_hub, build_kds_order, event_stream
+from kds_board import kds_board
+from driver_locations import driver_locations
+from dispatch import dispatch
+from geocoding import geocoder, build_address_string, DEFAULT_COORDINATES
+from simulation import simulation
+from traffic_capture import capture_log, CaptureMiddleware
+from metrics import registry, MetricsMiddleware, METRICS_ENABLED, METRICS_TOKEN
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    background = []
+    await init_async_client()
+    if supabase:
+        try:
+            await asyncio.gather(table_directory.refresh(), establishments.refresh(), menu_catalog.refresh())
+        except Exception as e:
+            print(f"Error loading lookup caches: {e}")
+        sales_rollups.start_backfill()
+        top_products.start_backfill()
+        background.append(asyncio.create_task(status_counters.run_reconciler()))
+        background.append(asyncio.create_task(kds_board.run_reconciler()))
+        background.append(asyncio.create_task(driver_locations.run_flusher()))
+        background.append(asyncio.create_task(dispatch.run_reconciler()))
+        if establishments.default:
+            # Warm the geocoding cache with the shop address
+            geocoder.resolve_in_background(geocoder.geocode(build_address_string(establishments.default)))
+    yield
+    for task in background:
+        task.cancel()
+    await simulation.stop()
+    try:
+        await driver_locations.flush()
+    except Exception as e:
+        print(f"Error flushing driver locations on shutdown: {e}")
+    if capture_log:
+        capture_log.close()
+    await close_async_client()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS for Flutter Web/Client
 app.add_middleware(
@@ -14,12 +72,52 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+if capture_log:
+    # Opt-in request recording for replay (TRAFFIC_CAPTURE_PATH, see traffic_capture.py)
+    app.add_middleware(CaptureMiddleware, log=capture_log)
+
+if METRICS_ENABLED:
+    # Latency / status / backend calls per route, served at GET /metrics
+    app.add_middleware(MetricsMiddleware)
+
 @app.get("/")
 def read_root():
     return {"message": "Manda.AI Backend is running"}
 
+@app.get("/metrics")
+def get_metrics(authorization: str | None = Header(None)):
+    """Prometheus metrics (text exposition format). Needs `Bearer METRICS_TOKEN` when that is set."""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(registry.expose(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/menu")
+async def get_menu(request: Request):
+    """Public menu (available products + categories), cached with ETag / 304 support."""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
+    try:
+        snapshot = await menu_catalog.snapshot()
+    except Exception as e:
+        print(f"Error loading menu: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if snapshot.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=snapshot.gzip_body, media_type="application/json", headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
 class TableOrderRequest(BaseModel):
     table_id: str
     items: list
@@ -34,111 +132,144 @@ class DeliveryOrderRequest(BaseModel):
     # No table_id allowed
 
 @app.post("/orders/table")
-def place_table_order(order: TableOrderRequest):
+async def place_table_order(order: TableOrderRequest, idempotency_key: str | None = Header(None, alias="Idempotency-Key")):
+    """Place a dine-in order. Retries carrying the same Idempotency-Key replay the first response."""
+    return await run_idempotent(idempotency_key, "orders/table", order.dict(), lambda: _place_table_order(order))
+
+async def _place_table_order(order: TableOrderRequest):
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
     
-    # 1. Validate Table
-    establishment_id = None
-    final_table_id = None
-    
-    if len(order.table_id) < 10:
-        # Resolve short number
-        print(f"Resolving Table Number: {order.table_id}")
-        table_res = supabase.table("tables").select("id, establishment_id").eq("table_number", order.table_id).execute()
-        if not table_res.data and len(order.table_id) == 1:
-            padded = f"0{order.table_id}"
-            table_res = supabase.table("tables").select("id, establishment_id").eq("table_number", padded).execute()
-            
-        if table_res.data:
-            final_table_id = table_res.data[0]['id']
-            establishment_id = table_res.data[0]['establishment_id']
-        else:
-             raise HTTPException(status_code=400, detail="Invalid Table Number")
-    else:
-        # UUID
-        final_table_id = order.table_id
-        try:
-            table_res = supabase.table("tables").select("establishment_id").eq("id", final_table_id).execute()
-            if table_res.data:
-                establishment_id = table_res.data[0]['establishment_id']
-        except Exception:
-             pass
+    # 1. Validate Table (number, padded number, id or QR code) from memory
+    table = await table_directory.resolve(order.table_id)
+    if not table:
+        detail = "Invalid Table Number" if len(order.table_id) < 10 else "Invalid Table/Establishment"
+        raise HTTPException(status_code=400, detail=detail)
+
+    final_table_id = table['id']
+    establishment_id = table.get('establishment_id')
 
     if not establishment_id:
          raise HTTPException(status_code=400, detail="Invalid Table/Establishment")
 
-    # 2. Create Order (Dine-In)
+    # 2. Price items from the menu catalog (the client-sent total is not trusted)
+    items, total = await _price_order_items(order.items)
+
+    # 3. Create Order (Dine-In)
     order_data = {
         "establishment_id": establishment_id,
         "table_id": final_table_id,
         "order_type": "dine_in", # Explicit Flag
-        "total_amount": order.total,
+        "total_amount": total,
         "status": "pending",
         # user_id is null for guests
     }
     
-    new_order = supabase.table("orders").insert(order_data).execute()
-    order_id = new_order.data[0]['id']
-
-    # 3. Create Items
-    _insert_order_items(order_id, order.items)
+    # 4. Create Order + Items in one transactional call (sql/place_order.sql)
+    new_order = await repository.place_order(order_data, items)
+    order_id = new_order['id']
+    _record_order_placed(new_order, items, table.get('table_number'))
 
     return {"status": "success", "order_id": order_id, "type": "dine_in"}
 
 @app.post("/orders/delivery")
-def place_delivery_order(order: DeliveryOrderRequest):
+async def place_delivery_order(
+    order: DeliveryOrderRequest,
+    establishments: EstablishmentDirectory = Depends(get_establishments),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
+):
+    """Place a delivery order. Retries carrying the same Idempotency-Key replay the first response."""
+    return await run_idempotent(
+        idempotency_key, "orders/delivery", order.dict(),
+        lambda: _place_delivery_order(order, establishments),
+    )
+
+async def _place_delivery_order(order: DeliveryOrderRequest, establishments: EstablishmentDirectory):
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
 
     # 1. Validate Establishment (Default for now)
-    est_res = supabase.table("establishments").select("id").limit(1).execute()
-    establishment_id = est_res.data[0]['id'] if est_res.data else None
+    establishment_id = establishments.default_id
     
     if not establishment_id:
          raise HTTPException(status_code=500, detail="No Establishment Configured")
 
-    # 2. Create Order (Delivery)
+    # 2. Price items from the menu catalog (the client-sent total is not trusted)
+    items, total = await _price_order_items(order.items)
+
+    # 3. Create Order (Delivery)
     order_data = {
         "establishment_id": establishment_id,
         "user_id": order.user_id,
         "order_type": "delivery", # Explicit Flag
-        "total_amount": order.total,
+        "total_amount": total,
         "status": "pending",
         "delivery_address": order.delivery_address
     }
     
-    new_order = supabase.table("orders").insert(order_data).execute()
-    order_id = new_order.data[0]['id']
-
-    # 3. Create Items
-    _insert_order_items(order_id, order.items)
-
-    # 4. Trigger Delivery Logic (Driver Assignment)
+    # 4. Trigger Delivery Logic (Driver Assignment), starting at the shop.
+    # Coordinates come from the geocoding cache; anything not cached yet is
+    # resolved in the background after the order is placed.
+    shop_address = build_address_string(establishments.get(establishment_id))
+    shop = geocoder.cached(shop_address)
+    start_lat, start_lng = shop or DEFAULT_COORDINATES
     delivery_data = {
-        "order_id": order_id,
         "status": "open",
         "address": order.delivery_address,
-        "current_lat": 38.7223,
-        "current_lng": -9.1393 
+        "current_lat": start_lat,
+        "current_lng": start_lng
     }
-    supabase.table("deliveries").insert(delivery_data).execute()
+
+    # 5. Create Order + Items + Delivery atomically in one round trip
+    new_order = await repository.place_order(order_data, items, delivery_data)
+    order_id = new_order['id']
+    delivery_id = new_order.pop('delivery_id', None)
+    _record_order_placed(new_order, items)
+    if delivery_id:
+        dispatch.add_open_delivery({**delivery_data, "id": delivery_id, "order_id": order_id, "created_at": new_order.get('created_at')})
+        geocoder.resolve_in_background(
+            _resolve_delivery_coordinates(delivery_id, None if shop else shop_address, order.delivery_address)
+        )
 
     return {"status": "success", "order_id": order_id, "type": "delivery"}
 
-def _insert_order_items(order_id, items):
-    items_data = []
-    for item in items:
-        items_data.append({
-            "order_id": order_id,
-            "product_id": item['product_id'],
-            "quantity": item['quantity'],
-            "unit_price": item['price'],
-            "notes": item.get('notes')
-        })
-    
-    if items_data:
-        supabase.table("order_items").insert(items_data).execute()
+async def _resolve_delivery_coordinates(delivery_id, shop_address, customer_address):
+    """Background step of delivery placement: geocode the shop (if not cached) and the customer."""
+    shop, destination = await asyncio.gather(
+        geocoder.geocode(shop_address),
+        geocoder.geocode(customer_address),
+    )
+    if destination:
+        await repository.update_delivery(delivery_id, {"dest_lat": destination[0], "dest_lng": destination[1]})
+    if shop:
+        await repository.update_open_delivery(delivery_id, {"current_lat": shop[0], "current_lng": shop[1]})
+        dispatch.move_delivery(delivery_id, shop[0], shop[1])
+
+async def _price_order_items(items):
+    try:
+        return await menu_catalog.price_items(items)
+    except PricingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _record_order_placed(order, items, table_number=None):
+    """Feed a newly placed order into the in-memory aggregates and the KDS feed."""
+    sales_rollups.record_order(order)
+    top_products.record_order(order, items)
+    status_counters.record_order(order)
+    kds_order = build_kds_order(order, items, table_number)
+    kds_board.add(kds_order)
+    kds_hub.order_added(kds_order)
+
+def _record_status_changes(rows, started=None):
+    """
+    Feed status changes (rows from set_orders_status) into the in-memory
+    aggregates. `started` is status_counters.begin_write() from before the call.
+    """
+    for row in rows:
+        sales_rollups.record_status_change(row, row.get('old_status'))
+        status_counters.record_status_change(row, row.get('old_status'), started)
+        kds_board.record_status_change(row, row.get('old_status'))
+        kds_hub.status_changed(row, row.get('old_status'))
 
 # Kept for backward compatibility if needed, but deprecated
 @app.post("/orders") 
@@ -150,7 +281,7 @@ def place_order_legacy(order: dict):
 # --- KDS ENDPOINTS ---
 
 @app.get("/kds/orders")
-def get_kds_orders(user = Depends(get_current_admin)):
+async def get_kds_orders(user = Depends(get_current_admin)):
     """Fetch active orders for the Kitchen Display System (pending or prep). Requires Auth."""
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
@@ -159,39 +290,145 @@ def get_kds_orders(user = Depends(get_current_admin)):
     # est_id = user.user_metadata.get('establishment_id')
 
     try:
-        # Fetch orders with status 'pending' or 'prep'
-        # We fetch related items and products for display
-        response = supabase.table('orders') \
-            .select('*, tables(table_number), order_items(*, products(name))') \
-            .or_('status.eq.pending,status.eq.prep') \
-            .order('created_at', desc=False) \
-            .execute()
-            
-        return response.data
+        # Orders with status 'pending' or 'prep', with items and products for display,
+        # served pre-serialized from the in-memory board (kds_board.py)
+        await kds_board.ensure_ready()
+        return Response(content=kds_board.orders_body(), media_type="application/json")
     except Exception as e:
         print(f"Error fetching KDS orders: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/kds/stream")
+async def stream_kds_orders(request: Request, user = Depends(get_current_admin)):
+    """
+    Server-Sent Events feed for kitchen screens: a `snapshot` event with the
+    active orders (same shape as GET /kds/orders), then `order_added`,
+    `status_changed` and `order_removed` events as orders change.
+    """
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
+    return StreamingResponse(
+        event_stream(kds_hub, request, _kds_snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _kds_snapshot():
+    await kds_board.ensure_ready()
+    return kds_board.orders_body()
+
+@app.get("/admin/kds/board")
+async def get_kds_board_stats(user = Depends(get_current_admin)):
+    """Size of the in-memory KDS board (orders per status, approximate memory). Admin only."""
+    return kds_board.stats()
+
 class StatusUpdateRequests(BaseModel):
     status: str
 
 @app.patch("/kds/orders/{order_id}")
-def update_order_status(order_id: str, request: StatusUpdateRequests, user = Depends(get_current_admin)):
+async def update_order_status(order_id: str, request: StatusUpdateRequests, user = Depends(get_current_admin)):
     """Update order status (e.g. pending -> prep -> ready). Requires Auth."""
     if not supabase:
          raise HTTPException(status_code=500, detail="Supabase not configured")
 
     try:
-        response = supabase.table('orders') \
-            .update({'status': request.status}) \
-            .eq('id', order_id) \
-            .execute()
+        started = status_counters.begin_write()
+        data = await repository.set_orders_status([order_id], request.status)
+        _record_status_changes(data, started)
             
-        return {"status": "success", "data": response.data}
+        return {"status": "success", "data": data}
     except Exception as e:
         print(f"Error updating status: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+class StatusTransition(BaseModel):
+    order_id: str
+    status: str
+
+class BatchStatusUpdateRequest(BaseModel):
+    transitions: list[StatusTransition]
+
+MAX_BATCH_TRANSITIONS = 200
+
+@app.patch("/kds/orders")
+async def update_order_statuses(request: BatchStatusUpdateRequest, user = Depends(get_current_admin)):
+    """
+    Apply many status transitions at once (e.g. bumping a whole rail).
+    Each move is checked against the order state machine (order_status.py);
+    moves to the same status are applied in one call. Returns one result
+    per transition, in request order. Requires Auth.
+    """
+    if not supabase:
+         raise HTTPException(status_code=500, detail="Supabase not configured")
+    if len(request.transitions) > MAX_BATCH_TRANSITIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_TRANSITIONS} transitions per request")
+
+    results = [None] * len(request.transitions)
+    groups = {}  # target status -> [(position, order_id)]
+    seen = set()
+    for i, t in enumerate(request.transitions):
+        try:
+            # Canonical form, as Postgres returns it (uppercase / braced ids are the same order)
+            oid = str(uuid.UUID(t.order_id))
+        except ValueError:
+            results[i] = {"order_id": t.order_id, "ok": False, "error": "Invalid order id"}
+            continue
+        if oid in seen:
+            results[i] = {"order_id": oid, "ok": False, "error": "Duplicate order in batch"}
+            continue
+        seen.add(oid)
+        if t.status not in ORDER_STATUSES:
+            results[i] = {"order_id": oid, "ok": False, "error": f"Invalid status: {t.status}"}
+            continue
+        groups.setdefault(t.status, []).append((i, oid))
+
+    # One set_orders_status call per target status; only orders in a
+    # status that may move there are updated. A failed call only fails its
+    # own group: the others have committed and must still be recorded.
+    statuses = list(groups)
+    started = status_counters.begin_write()
+    updates = await asyncio.gather(*(
+        repository.set_orders_status([oid for _, oid in groups[s]], s, allowed_from(s)) for s in statuses
+    ), return_exceptions=True)
+    updated = {}
+    failed = {}  # target status -> error
+    for s, rows in zip(statuses, updates):
+        if isinstance(rows, Exception):
+            print(f"Error updating statuses to {s}: {rows}")
+            failed[s] = str(rows)
+            continue
+        _record_status_changes(rows, started)
+        updated.update((str(row['id']), row) for row in rows)
+
+    # Explain the ones that weren't updated (one read, only when needed)
+    rejected = [oid for s in statuses if s not in failed for _, oid in groups[s] if oid not in updated]
+    current = {}
+    lookup_error = None
+    if rejected:
+        try:
+            current = await repository.get_order_statuses(rejected)
+        except Exception as e:
+            print(f"Error reading order statuses: {e}")
+            lookup_error = str(e)
+
+    for s in statuses:
+        for i, oid in groups[s]:
+            if s in failed:
+                results[i] = {"order_id": oid, "ok": False, "error": failed[s]}
+            elif oid in updated:
+                results[i] = {"order_id": oid, "ok": True, "old_status": updated[oid].get('old_status'), "status": s}
+            elif oid in current:
+                results[i] = {
+                    "order_id": oid, "ok": False, "old_status": current[oid],
+                    "error": f"Invalid transition: {current[oid]} -> {s}",
+                }
+            elif lookup_error:
+                results[i] = {"order_id": oid, "ok": False, "error": f"Not updated: {lookup_error}"}
+            else:
+                results[i] = {"order_id": oid, "ok": False, "error": "Order not found"}
+    return {"status": "success", "results": results}
+
 # --- ADMIN ENDPOINTS ---
 
 class ProductRequest(BaseModel):
@@ -203,15 +440,14 @@ class ProductRequest(BaseModel):
     is_available: bool = True
 
 @app.post("/admin/products")
-def create_product(product: ProductRequest, user = Depends(get_current_admin)): # Admin only
+async def create_product(product: ProductRequest, user = Depends(get_current_admin), establishments: EstablishmentDirectory = Depends(get_establishments)): # Admin only
     """Create a new product. Admin only."""
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
 
     try:
         # 1. Get Establishment (Mock for now, or use first one)
-        est_res = supabase.table("establishments").select("id").limit(1).execute()
-        est_id = est_res.data[0]['id'] if est_res.data else None
+        est_id = establishments.default_id
         
         if not est_id:
              raise HTTPException(status_code=400, detail="No establishment found")
@@ -219,14 +455,16 @@ def create_product(product: ProductRequest, user = Depends(get_current_admin)):
         data = product.dict()
         data['establishment_id'] = est_id
         
-        response = supabase.table("products").insert(data).execute()
-        return {"status": "success", "data": response.data}
+        created = await repository.insert_product(data)
+        for row in created:
+            menu_catalog.upsert_product(row)
+        return {"status": "success", "data": created}
     except Exception as e:
         print(f"Error creating product: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/admin/products/{product_id}")
-def update_product(product_id: str, product: ProductRequest, user = Depends(get_current_admin)): # Admin only
+async def update_product(product_id: str, product: ProductRequest, user = Depends(get_current_admin)): # Admin only
     """Update an existing product. Admin only."""
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
@@ -235,180 +473,254 @@ def update_product(product_id: str, product: ProductRequest, user = Depends(get_
         print(f"DEBUG UPDATE: {product_id} with {product}")
         payload = product.dict(exclude_unset=True)
         print(f"DEBUG PAYLOAD: {payload}")
-        response = supabase.table("products").update(payload).eq("id", product_id).execute()
-        return {"status": "success", "data": response.data}
+        updated = await repository.update_product(product_id, payload)
+        for row in updated:
+            menu_catalog.upsert_product(row)
+        return {"status": "success", "data": updated}
     except Exception as e:
         print(f"Error updating product: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/admin/products/{product_id}")
-def delete_product(product_id: str, user = Depends(get_current_admin)): # Admin only
+async def delete_product(product_id: str, user = Depends(get_current_admin)): # Admin only
     """Delete a product. Admin only."""
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
 
     try:
         # Soft delete is better, but user asked for delete. Using hard delete for now.
-        response = supabase.table("products").delete().eq("id", product_id).execute()
-        return {"status": "success", "data": response.data}
+        deleted = await repository.delete_product(product_id)
+        menu_catalog.remove_product(product_id)
+        return {"status": "success", "data": deleted}
     except Exception as e:
         print(f"Error deleting product: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/admin/stats/sales")
-def get_sales_stats(period: str = 'daily', user = Depends(get_current_admin)):
-    """Fetch sales stats aggregated by period (daily, weekly, monthly)."""
+async def get_sales_stats(
+    period: str = 'daily',
+    start: str | None = None,
+    end: str | None = None,
+    granularity: str | None = None,
+    tz: str | None = None,
+    establishment_id: str | None = None,
+    user = Depends(get_current_admin)
+):
+    """
+    Fetch sales stats aggregated by period (daily, weekly, monthly), or over a
+    custom start/end range at hour/day/week/month granularity. Served from
+    the pre-summed rollup buckets in rollups.py; cancelled orders are excluded.
+    """
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
 
     try:
-        now = datetime.now()
-        data_points = []
-        
+        zone = ZoneInfo(tz) if tz else sales_rollups.tz
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {tz}")
+    if granularity and granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+    async def compute():
+        await sales_rollups.ensure_ready()
+        now = datetime.now(zone)
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        if start:
+            # Custom range
+            try:
+                range_start = _parse_range_bound(start, zone)
+                range_end = _parse_range_bound(end, zone) if end else now
+            except ValueError:
+                raise HTTPException(status_code=400, detail="start/end must be ISO dates or timestamps")
+            max_days = MAX_RANGE_DAYS[granularity or 'day']
+            if range_end - range_start > timedelta(days=max_days):
+                raise HTTPException(status_code=400, detail=f"Range too long for {granularity or 'day'} granularity (max {max_days} days)")
+            points = sales_rollups.series(range_start, range_end, granularity or 'day', zone.key, establishment_id)
+            return [
+                {"label": p['start'].isoformat(), "value": round(p['revenue'], 2), "orders": p['orders']}
+                for p in points
+            ]
+
         if period == 'daily':
-            # Last 24 hours or "Today"
-            start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            response = supabase.table('orders').select('created_at, total_amount').gte('created_at', start_date.isoformat()).execute()
-            
-            # Aggregate by hour
-            hourly_data = {i: 0.0 for i in range(24)}
-            for order in response.data:
-                # Handle Z timezone or offset if present
-                ts = order['created_at'].replace('Z', '+00:00')
-                dt = datetime.fromisoformat(ts)
-                hourly_data[dt.hour] += order['total_amount']
-            
-            data_points = [{"label": f"{h}h", "value": hourly_data[h]} for h in range(24)]
+            # Today, by hour
+            points = sales_rollups.series(today, today + timedelta(days=1), 'hour', zone.key, establishment_id)
+            return [{"label": f"{p['start'].hour}h", "value": p['revenue']} for p in points]
 
         elif period == 'weekly':
             # Last 7 days
-            start_date = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=6)
-            response = supabase.table('orders').select('created_at, total_amount').gte('created_at', start_date.isoformat()).execute()
-            
-            daily_data = {} 
-            for i in range(7):
-                 d = start_date + timedelta(days=i)
-                 daily_data[d.strftime('%Y-%m-%d')] = 0.0
-
-            for order in response.data:
-                ts = order['created_at'].replace('Z', '+00:00')
-                dt = datetime.fromisoformat(ts)
-                key = dt.strftime('%Y-%m-%d')
-                if key in daily_data:
-                    daily_data[key] += order['total_amount']
-            
-            data_points = []
-            for date_str, total in daily_data.items():
-                dt = datetime.strptime(date_str, '%Y-%m-%d')
-                data_points.append({"label": dt.strftime('%a'), "value": total})
+            start_date = today - timedelta(days=6)
+            points = sales_rollups.series(start_date, today + timedelta(days=1), 'day', zone.key, establishment_id)
+            return [{"label": p['start'].strftime('%a'), "value": p['revenue']} for p in points]
 
         elif period == 'monthly':
-             # Last 30 days
-            start_date = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=29)
-            response = supabase.table('orders').select('created_at, total_amount').gte('created_at', start_date.isoformat()).execute()
-            
-            daily_data = {}
-            for i in range(30):
-                 d = start_date + timedelta(days=i)
-                 daily_data[d.strftime('%Y-%m-%d')] = 0.0
-
-            for order in response.data:
-                 ts = order['created_at'].replace('Z', '+00:00')
-                 dt = datetime.fromisoformat(ts)
-                 key = dt.strftime('%Y-%m-%d')
-                 if key in daily_data:
-                     daily_data[key] += order['total_amount']
-            
-            data_points = [{"label": date_str[8:], "value": total} for date_str, total in daily_data.items()] # label = day part only
+            # Last 30 days
+            start_date = today - timedelta(days=29)
+            points = sales_rollups.series(start_date, today + timedelta(days=1), 'day', zone.key, establishment_id)
+            return [{"label": p['start'].strftime('%d'), "value": p['revenue']} for p in points] # label = day part only
 
-        return data_points
+        return []
 
+    try:
+        key = ('sales', period, start, end, granularity, zone.key, establishment_id)
+        return await stats_cache.get_or_compute(key, compute)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/admin/stats/top_products")
-def get_top_products(limit: int = 5, user = Depends(get_current_admin)):
-    """Fetch top selling products based on order_items."""
+def _parse_range_bound(value: str, zone):
+    """ISO date or timestamp; values without an offset are local to `zone`."""
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return dt if dt.tzinfo else dt.replace(tzinfo=zone)
+
+@app.post("/admin/stats/rollups/rebuild")
+async def rebuild_rollups(user = Depends(get_current_admin)):
+    """Re-run the rollup backfill from the orders table. Admin only."""
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
 
     try:
-        # Fetch all order items and their related product names
-        # Note: In a real production DB, this should be a SQL view or RPC for performance.
-        # For now, we fetch and aggregate in Python.
-        response = supabase.table('order_items').select('product_id, quantity, products(name, price)').execute()
-        
-        product_sales = {}
-        
-        for item in response.data:
-            pid = item['product_id']
-            qty = item['quantity']
-            product_name = item['products']['name'] if item.get('products') else 'Unknown'
-            # price = item['products']['price'] # Not strictly needed if we sort by qty
-            
-            if pid not in product_sales:
-                product_sales[pid] = {'name': product_name, 'quantity': 0, 'revenue': 0.0}
-            
-            product_sales[pid]['quantity'] += qty
-            # We could add revenue here if we had unit_price history or average
-        
-        # Sort by quantity desc
-        sorted_products = sorted(product_sales.values(), key=lambda x: x['quantity'], reverse=True)
-        
-        return sorted_products[:limit]
+        await sales_rollups.backfill()
+        stats_cache.invalidate()
+        return {"status": "success"}
+    except Exception as e:
+        print(f"Error rebuilding rollups: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/admin/stats/top_products")
+async def get_top_products(
+    limit: int = 5,
+    window: str = 'all',
+    sort_by: str = 'quantity',
+    category_id: str | None = None,
+    by_category: bool = False,
+    user = Depends(get_current_admin)
+):
+    """
+    Fetch top selling products (quantity and revenue from order_items.unit_price)
+    for a window (today, 7d, 30d, all), optionally for one category or
+    broken down per category. Served from the counters in top_products.py.
+    """
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
+    if window not in TOP_PRODUCT_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(TOP_PRODUCT_WINDOWS)}")
+    if sort_by not in ('quantity', 'revenue'):
+        raise HTTPException(status_code=400, detail="sort_by must be quantity or revenue")
+
+    async def compute():
+        # Names and categories come from the menu catalog
+        await asyncio.gather(top_products.ensure_ready(), menu_catalog.ensure_fresh())
+
+        def category_of(pid):
+            product = menu_catalog.get_product(pid)
+            return str(product['category_id']) if product and product.get('category_id') is not None else None
+
+        def describe(pid, quantity, revenue):
+            product = menu_catalog.get_product(pid)
+            return {
+                'product_id': pid,
+                'name': product['name'] if product else 'Unknown',
+                'quantity': quantity,
+                'revenue': round(revenue, 2),
+            }
+
+        if by_category:
+            categories = {}
+            for pid in top_products.counters(window):
+                categories.setdefault(category_of(pid), None)
+            breakdown = []
+            for cid in categories:
+                top = top_products.top(limit, window, sort_by, lambda pid, cid=cid: category_of(pid) == cid)
+                category = menu_catalog.get_category(cid) if cid else None
+                breakdown.append({
+                    'category_id': cid,
+                    'category': category['name'] if category else 'Uncategorized',
+                    'products': [describe(*entry) for entry in top],
+                })
+            return breakdown
+
+        product_filter = (lambda pid: category_of(pid) == str(category_id)) if category_id else None
+        return [describe(*entry) for entry in top_products.top(limit, window, sort_by, product_filter)]
+
+    try:
+        key = ('top_products', limit, window, sort_by, category_id, by_category)
+        return await stats_cache.get_or_compute(key, compute)
     except Exception as e:
         print(f"Error fetching top products: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- ADMIN ORDER MANAGEMENT ENDPOINTS ---
 
+ORDERS_PAGE_MAX = 1000
+FIELD_NAME = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+def _parse_list(value: str):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
 @app.get("/admin/orders")
-def get_admin_orders(
+async def get_admin_orders(
+    response: Response,
     status: str | None = None,
     order_type: str | None = None,
     date_from: str | None = None,
     date_to: str | None = None,
     limit: int = 100,
+    cursor: str | None = None,
+    fields: str | None = None,
+    expand: str | None = None,
     user = Depends(get_current_admin)
 ):
-    """Fetch all orders with filters. Admin only."""
+    """
+    Fetch orders with filters, most recent first. Admin only.
+
+    Paged with an opaque cursor: when more orders exist the response carries
+    an X-Next-Cursor header to pass back as `cursor`. `fields` picks order
+    columns (default all) and `expand` the related data to include, from
+    items, tables, profiles and delivery (default items,tables,profiles).
+    """
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
-    
+    if not 1 <= limit <= ORDERS_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {ORDERS_PAGE_MAX}")
+
+    expansions = _parse_list(expand) if expand is not None else ['items', 'tables', 'profiles']
+    unknown = [e for e in expansions if e != 'profiles' and e not in repository.ORDER_EXPANSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown expand: {', '.join(unknown)}")
+
+    columns = '*'
+    if fields:
+        wanted = _parse_list(fields)
+        if not all(FIELD_NAME.match(f) for f in wanted):
+            raise HTTPException(status_code=400, detail="Invalid fields")
+        # id and created_at make up the cursor; user_id is needed for profiles
+        required = ['id', 'created_at'] + (['user_id'] if 'profiles' in expansions else [])
+        columns = ', '.join(dict.fromkeys(required + wanted))
+
+    try:
+        after = repository.decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
-        # Build query with joins for related data
         # Note: Removed profiles join because many orders don't have user_id (guest/table orders)
-        query = supabase.table('orders').select(
-            '*, order_items(*, products(name, price, image_url)), tables(table_number)'
+        # Filters are applied in the repository; one extra row tells us if there's a next page
+        orders = await repository.list_orders(
+            status, order_type, date_from, date_to, limit + 1,
+            after=after, columns=columns,
+            expand=[e for e in expansions if e != 'profiles'],
         )
-        
-        # Apply filters
-        if status:
-            query = query.eq('status', status)
-        if order_type:
-            query = query.eq('order_type', order_type)
-        if date_from:
-            query = query.gte('created_at', date_from)
-        if date_to:
-            query = query.lte('created_at', date_to)
-        
-        # Order by most recent first
-        query = query.order('created_at', desc=True).limit(limit)
-        response = query.execute()
-        
-        # Optionally fetch user info separately for orders that have user_id
-        orders = response.data
-        for order in orders:
-            if order.get('user_id'):
-                try:
-                    profile = supabase.table('profiles').select('full_name, email').eq('id', order['user_id']).single().execute()
-                    order['profiles'] = profile.data if profile.data else None
-                except:
-                    order['profiles'] = None
-            else:
-                order['profiles'] = None
+        if len(orders) > limit:
+            orders = orders[:limit]
+            response.headers["X-Next-Cursor"] = repository.encode_cursor(orders[-1])
+
+        if 'profiles' in expansions:
+            # User info for orders that have user_id, in one batched query
+            await repository.attach_profiles(orders, 'full_name, email')
         
         return orders
     except Exception as e:
@@ -417,28 +729,106 @@ def get_admin_orders(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+EXPORT_PAGE_SIZE = 500
+EXPORT_CSV_COLUMNS = [
+    'id', 'created_at', 'status', 'order_type', 'total_amount', 'establishment_id',
+    'table_number', 'user_id', 'customer_name', 'customer_email', 'delivery_address', 'items',
+]
+
+@app.get("/admin/orders/export")
+async def export_orders(
+    format: str = 'ndjson',
+    status: str | None = None,
+    order_type: str | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    user = Depends(get_current_admin)
+):
+    """
+    Stream every matching order as NDJSON (one order with items, table and
+    profile per line) or CSV (one row per order). Pages through the orders
+    internally, so memory stays flat however large the export. Admin only.
+    """
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    if format not in ('ndjson', 'csv'):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+
+    async def pages():
+        after = None
+        while True:
+            orders = await repository.list_orders(
+                status, order_type, date_from, date_to, EXPORT_PAGE_SIZE, after=after,
+            )
+            if not orders:
+                return
+            await repository.attach_profiles(orders, 'full_name, email')
+            yield orders
+            if len(orders) < EXPORT_PAGE_SIZE:
+                return
+            last = orders[-1]
+            after = (last['created_at'], str(last['id']))
+
+    async def ndjson_rows():
+        try:
+            async for orders in pages():
+                yield ''.join(json.dumps(order, default=str) + '\n' for order in orders)
+        except Exception as e:
+            # Headers are already sent; end the body with an error line
+            print(f"Error exporting orders: {e}")
+            yield json.dumps({"error": str(e)}) + '\n'
+
+    async def csv_rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_CSV_COLUMNS)
+        yield buffer.getvalue()
+        try:
+            async for orders in pages():
+                buffer.seek(0)
+                buffer.truncate()
+                for order in orders:
+                    writer.writerow(_export_csv_row(order))
+                yield buffer.getvalue()
+        except Exception as e:
+            print(f"Error exporting orders: {e}")
+            yield f"# export failed: {e}\n"
+
+    if format == 'csv':
+        return StreamingResponse(
+            csv_rows(), media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="orders.csv"'},
+        )
+    return StreamingResponse(
+        ndjson_rows(), media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="orders.ndjson"'},
+    )
+
+def _export_csv_row(order):
+    profile = order.get('profiles') or {}
+    table = order.get('tables') or {}
+    items = '; '.join(
+        f"{item.get('quantity')} x {(item.get('products') or {}).get('name') or item.get('product_id')}"
+        for item in order.get('order_items') or []
+    )
+    return [
+        order.get('id'), order.get('created_at'), order.get('status'), order.get('order_type'),
+        order.get('total_amount'), order.get('establishment_id'), table.get('table_number'),
+        order.get('user_id'), profile.get('full_name'), profile.get('email'),
+        order.get('delivery_address'), items,
+    ]
+
 @app.get("/admin/orders/{order_id}")
-def get_admin_order_detail(order_id: str, user = Depends(get_current_admin)):
+async def get_admin_order_detail(order_id: str, user = Depends(get_current_admin)):
     """Get detailed information about a specific order. Admin only."""
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
     
     try:
-        response = supabase.table('orders').select(
-            '*, order_items(*, products(name, price, image_url)), tables(table_number), deliveries(*)'
-        ).eq('id', order_id).single().execute()
+        order = await repository.get_order_detail(order_id)
         
-        order = response.data
-        
-        # Fetch profile separately if user_id exists
-        if order.get('user_id'):
-            try:
-                profile = supabase.table('profiles').select('full_name, email, phone_number').eq('id', order['user_id']).single().execute()
-                order['profiles'] = profile.data if profile.data else None
-            except:
-                order['profiles'] = None
-        else:
-            order['profiles'] = None
+        # Fetch profile separately if user_id exists (needs the order's user_id)
+        await repository.attach_profiles([order], 'full_name, email, phone_number')
         
         return order
     except Exception as e:
@@ -448,61 +838,76 @@ def get_admin_order_detail(order_id: str, user = Depends(get_current_admin)):
         raise HTTPException(status_code=404, detail="Order not found")
 
 @app.get("/admin/stats/today")
-def get_today_stats(user = Depends(get_current_admin)):
-    """Get quick stats for today only."""
+async def get_today_stats(user = Depends(get_current_admin)):
+    """Get quick stats for today only (from the live counters in status_counters.py)."""
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
     
+    async def compute():
+        await status_counters.ensure_ready()
+        return status_counters.today_summary()
+
     try:
-        now = datetime.now()
-        start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        # Fetch today's orders
-        response = supabase.table('orders').select('status, total_amount').gte('created_at', start_of_day.isoformat()).execute()
-        
-        orders = response.data
-        total_orders = len(orders)
-        total_revenue = sum(order['total_amount'] for order in orders)
-        
-        # Count by status
-        active_orders = len([o for o in orders if o['status'] in ['pending', 'prep', 'ready', 'on_way']])
-        completed_orders = len([o for o in orders if o['status'] in ['delivered', 'completed']])
-        
-        avg_order_value = total_revenue / total_orders if total_orders > 0 else 0.0
-        
-        return {
-            "total_orders": total_orders,
-            "total_revenue": round(total_revenue, 2),
-            "active_orders": active_orders,
-            "completed_orders": completed_orders,
-            "avg_order_value": round(avg_order_value, 2)
-        }
+        return await stats_cache.get_or_compute(('today',), compute)
     except Exception as e:
         print(f"Error fetching today stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/admin/stats/orders-by-status")
-def get_orders_by_status(user = Depends(get_current_admin)):
-    """Get count of orders by status."""
+async def get_orders_by_status(user = Depends(get_current_admin)):
+    """Get count of orders by status (from the live counters in status_counters.py)."""
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
     
+    async def compute():
+        await status_counters.ensure_ready()
+        return status_counters.by_status()
+
     try:
-        # Fetch all orders (or recent ones)
-        response = supabase.table('orders').select('status').execute()
-        
-        orders = response.data
-        status_counts = {}
-        
-        for order in orders:
-            status = order['status']
-            status_counts[status] = status_counts.get(status, 0) + 1
-        
-        return status_counts
+        return await stats_cache.get_or_compute(('orders-by-status',), compute)
     except Exception as e:
         print(f"Error fetching orders by status: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/admin/stats/cache")
+async def get_stats_cache_counters(user = Depends(get_current_admin)):
+    """Hit / miss / coalesce counters of the stats response cache. Admin only."""
+    return stats_cache.stats()
+
+class RoleUpdateRequest(BaseModel):
+    role: str
+
+@app.patch("/admin/profiles/{user_id}/role")
+async def update_profile_role(user_id: str, request: RoleUpdateRequest, user = Depends(get_current_admin)):
+    """Change a user's role (admin, driver, client). Admin only."""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
+    if request.role not in ('admin', 'driver', 'client'):
+        raise HTTPException(status_code=400, detail="Invalid role")
+
+    try:
+        data = await repository.update_profile_role(user_id, request.role)
+        # Drop the cached role so the change applies on the next request
+        invalidate_role(user_id)
+        return {"status": "success", "data": data}
+    except Exception as e:
+        print(f"Error updating role: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/admin/establishments/refresh")
+async def refresh_establishments(user = Depends(get_current_admin)):
+    """Reload the cached establishments after they were edited. Admin only."""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
+    try:
+        await establishments.refresh()
+        return {"status": "success", "count": len(establishments.all())}
+    except Exception as e:
+        print(f"Error refreshing establishments: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # --- DELIVERY ENDPOINTS ---
 
 class DeliveryRequest(BaseModel):
@@ -511,16 +916,16 @@ class DeliveryRequest(BaseModel):
     driver_id: str | None = None
 
 @app.post("/admin/deliveries/assign")
-def assign_delivery(req: DeliveryRequest, user = Depends(get_current_admin)):
+async def assign_delivery(req: DeliveryRequest, user = Depends(get_current_admin)):
     """Create a delivery. If driver_id/name is missing, it's an OPEN request (Pool)."""
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
 
     try:
         # Check if already assigned
-        existing = supabase.table('deliveries').select('id').eq('order_id', req.order_id).execute()
-        if existing.data:
-            return {"status": "exists", "delivery_id": existing.data[0]['id']}
+        existing = await repository.get_delivery_for_order(req.order_id)
+        if existing:
+            return {"status": "exists", "delivery_id": existing['id']}
 
         # Create new delivery
         status = "open" if not req.driver_name and not req.driver_id else "assigned"
@@ -534,14 +939,16 @@ def assign_delivery(req: DeliveryRequest, user = Depends(get_current_admin)):
             "current_lat": 38.7223,
             "current_lng": -9.1393 
         }
-        res = supabase.table('deliveries').insert(data).execute()
-        return {"status": "success", "delivery_id": res.data[0]['id']}
+        delivery = await repository.insert_delivery(data)
+        if status == "open":
+            dispatch.add_open_delivery(delivery)
+        return {"status": "success", "delivery_id": delivery['id']}
     except Exception as e:
         print(f"Error assigning delivery: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/driver/deliveries/{delivery_id}/accept")
-def accept_delivery(delivery_id: str, user = Depends(get_current_driver)):
+async def accept_delivery(delivery_id: str, user = Depends(get_current_driver)):
     """Driver accepts an open delivery."""
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
@@ -550,31 +957,35 @@ def accept_delivery(delivery_id: str, user = Depends(get_current_driver)):
         # UserResponse wrapper handling
         driver_id = user.user.id if hasattr(user, 'user') else user.id
         
+        # Driver profile and delivery row are independent: fetch both at once
+        profiles, existing = await asyncio.gather(
+            repository.get_profiles([driver_id], 'full_name'),
+            repository.get_delivery(delivery_id),
+        )
+
         # Get driver name from profile safely
         driver_name = "Unknown Driver"
-        try:
-            profile = supabase.table('profiles').select('full_name').eq('id', driver_id).single().execute()
-            if profile.data:
-                driver_name = profile.data.get('full_name') or "Driver"
-        except Exception:
+        profile = profiles.get(driver_id)
+        if profile:
+            driver_name = profile.get('full_name') or "Driver"
+        else:
              print("Profile not found for driver, using default.")
-             # Fallback if profile doesn't exist
-             pass
 
         # 1. Check if available
-        existing = supabase.table('deliveries').select('driver_id, status').eq('id', delivery_id).single().execute()
-        if not existing.data:
+        if not existing:
              raise HTTPException(status_code=404, detail="Delivery not found")
         
-        if existing.data.get('driver_id') is not None:
+        if existing.get('driver_id') is not None:
              raise HTTPException(status_code=400, detail="Delivery already taken")
 
         # 2. Update
-        res = supabase.table('deliveries').update({
+        await repository.update_delivery(delivery_id, {
             "driver_id": driver_id,
             "driver_name": driver_name,
             "status": "assigned"
-        }).eq('id', delivery_id).execute()
+        })
+        driver_locations.set_owner(delivery_id, driver_id)
+        dispatch.close_delivery(delivery_id)
         
         return {"status": "success", "message": "Delivery accepted"}
 
@@ -582,33 +993,252 @@ def accept_delivery(delivery_id: str, user = Depends(get_current_driver)):
         print(f"Error accepting delivery: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+class LocationFix(BaseModel):
+    delivery_id: str
+    lat: float
+    lng: float
+    heading: float | None = None
+    speed: float | None = None
+    recorded_at: str | None = None # ISO timestamp from the device; defaults to arrival time
+
+MAX_LOCATION_BATCH = 500
+
+@app.post("/driver/location")
+async def post_driver_location(fixes: LocationFix | list[LocationFix], user = Depends(get_current_driver)):
+    """
+    Report GPS fixes (one, or a batch buffered while offline) for the driver's
+    deliveries. Kept in memory and written to deliveries in bulk by the
+    flusher in driver_locations.py.
+    """
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
+    if isinstance(fixes, LocationFix):
+        fixes = [fixes]
+    if len(fixes) > MAX_LOCATION_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LOCATION_BATCH} fixes per request")
+    # Validate the whole batch before recording any of it
+    recorded_at = []
+    for fix in fixes:
+        if not (-90 <= fix.lat <= 90 and -180 <= fix.lng <= 180):
+            raise HTTPException(status_code=400, detail="Invalid coordinates")
+        try:
+            recorded_at.append(parse_timestamp(fix.recorded_at) if fix.recorded_at else None)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="recorded_at must be an ISO timestamp")
+
+    driver_id = user.user.id if hasattr(user, 'user') else user.id
+    try:
+        delivery_ids = list(dict.fromkeys(fix.delivery_id for fix in fixes))
+        owners = await asyncio.gather(*(driver_locations.owner_of(d) for d in delivery_ids))
+    except Exception as e:
+        print(f"Error checking delivery owners: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if any(str(owner) != str(driver_id) for owner in owners):
+        raise HTTPException(status_code=403, detail="Delivery not assigned to this driver")
+
+    accepted = sum(
+        driver_locations.record(fix.delivery_id, driver_id, fix.lat, fix.lng, fix.heading, fix.speed, at)
+        for fix, at in zip(fixes, recorded_at)
+    )
+
+    latest = driver_locations.get(fixes[-1].delivery_id)
+    dispatch.update_driver(driver_id, latest['lat'], latest['lng'], delivery_id=latest['delivery_id'])
+    return {"status": "success", "accepted": accepted}
+
+@app.get("/deliveries/{delivery_id}/location")
+async def get_delivery_location(delivery_id: str, auth = Depends(get_current_user_role)):
+    """
+    Latest position of a delivery: live from memory, else the last persisted
+    one. Admins, the assigned driver and the order's customer only.
+    """
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
+    user, role = auth
+    if role != 'admin':
+        user_id = user.user.id if hasattr(user, 'user') else user.id
+        try:
+            parties = await driver_locations.parties_of(delivery_id)
+        except Exception as e:
+            print(f"Error checking delivery access: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        if not parties:
+            raise HTTPException(status_code=404, detail="Delivery not found")
+        if str(user_id) not in (str(parties['driver_id']), str(parties['user_id'])):
+            raise HTTPException(status_code=403, detail="Not allowed to follow this delivery")
+
+    position = driver_locations.get(delivery_id)
+    if position:
+        return {
+            "delivery_id": delivery_id,
+            "lat": position['lat'],
+            "lng": position['lng'],
+            "heading": position['heading'],
+            "speed": position['speed'],
+            "recorded_at": position['recorded_at'],
+            "source": "live",
+        }
+
+    try:
+        delivery = await repository.get_delivery_position(delivery_id)
+    except Exception as e:
+        print(f"Error fetching delivery location: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not delivery:
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    return {
+        "delivery_id": delivery_id,
+        "lat": delivery.get('current_lat'),
+        "lng": delivery.get('current_lng'),
+        "heading": None,
+        "speed": None,
+        "recorded_at": delivery.get('updated_at'),
+        "source": "db",
+    }
+
+@app.get("/admin/deliveries/locations")
+async def get_live_locations(user = Depends(get_current_admin)):
+    """All live driver positions plus ingest / flush and dispatch index counters. Admin only."""
+    return {"positions": driver_locations.all(), "stats": {**driver_locations.stats(), **dispatch.stats()}}
+
+@app.get("/admin/orders/{order_id}/nearest-drivers")
+async def get_nearest_drivers(
+    order_id: str,
+    k: int = 5,
+    max_km: float | None = None,
+    include_busy: bool = False,
+    user = Depends(get_current_admin)
+):
+    """Suggest the drivers closest to an order's delivery, from the dispatch index. Admin only."""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    if not 1 <= k <= 50:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 50")
+
+    try:
+        await dispatch.ensure_ready()
+        entry = dispatch.open_delivery_for_order(order_id)
+        if entry is not None:
+            lat, lng, data = entry
+            delivery_id = data['delivery_id']
+        else:
+            # Not in the open pool (already assigned): use its stored position
+            existing = await repository.get_delivery_for_order(order_id)
+            delivery = await repository.get_delivery_position(existing['id']) if existing else None
+            if not delivery or delivery.get('current_lat') is None:
+                raise HTTPException(status_code=404, detail="Delivery not found for order")
+            lat, lng, delivery_id = delivery['current_lat'], delivery['current_lng'], delivery['id']
+
+        nearest = dispatch.nearest_drivers(lat, lng, k, max_km=max_km, include_busy=include_busy)
+        profiles = await repository.get_profiles([key for _, key, _ in nearest], 'full_name')
+        return {
+            "order_id": order_id,
+            "delivery_id": delivery_id,
+            "origin": {"lat": lat, "lng": lng},
+            "drivers": [
+                {
+                    "driver_id": key,
+                    "driver_name": (profiles.get(key) or {}).get('full_name'),
+                    "distance_km": round(distance, 3),
+                    "lat": dispatch.drivers.get(key)[0],
+                    "lng": dispatch.drivers.get(key)[1],
+                    "delivery_id": data['delivery_id'],
+                }
+                for distance, key, data in nearest
+            ],
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error finding nearest drivers: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/driver/deliveries/nearby")
+async def get_nearby_deliveries(
+    lat: float,
+    lng: float,
+    radius_km: float = 5.0,
+    limit: int = 20,
+    user = Depends(get_current_driver)
+):
+    """Open deliveries near the driver's position, closest first."""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise HTTPException(status_code=400, detail="Invalid coordinates")
+    if not 0 < radius_km <= 50 or not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="radius_km must be in (0, 50] and limit in [1, 100]")
+
+    try:
+        await dispatch.ensure_ready()
+    except Exception as e:
+        print(f"Error loading dispatch index: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    driver_id = user.user.id if hasattr(user, 'user') else user.id
+    dispatch.move_driver(driver_id, lat, lng)
+    return [
+        {
+            **data,
+            "distance_km": round(distance, 3),
+            "lat": dispatch.open_deliveries.get(key)[0],
+            "lng": dispatch.open_deliveries.get(key)[1],
+        }
+        for distance, key, data in dispatch.nearby_deliveries(lat, lng, radius_km, limit)
+    ]
+
 @app.post("/admin/deliveries/simulate/{order_id}")
-async def simulate_delivery_endpoint(order_id: str):
-    """Trigger the background simulation script for a specific order."""
-    import subprocess
-    import sys
-    import os
-    
-    # We run the script as a separate process to not block the API
-    # This is a simple dev-mode way to do background tasks
+async def simulate_delivery_endpoint(order_id: str, user = Depends(get_current_admin)):
+    """Start a simulated drive (shop -> customer) for a specific order, in-process. Admin only."""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
     try:
-        # Pass the ORDER_ID as an env var or argument to the script
-        # We need to modify the script to accept args or use this env idea
-        
-        # Actually simplest is just to run the script and let it use the arg
-        # But our script currently has a hardcoded placeholder.
-        # Let's update the script to read from sys.argv first? 
-        # Or better, we just spawn it with an env var.
-        
-        env = os.environ.copy()
-        env["SIMULATE_ORDER_ID"] = order_id
-        
-        # Assuming simulate_driver.py is in the same dir
-        script_path = "simulate_driver.py"
-        
-        subprocess.Popen([sys.executable, script_path], env=env, cwd=os.getcwd())
-        
-        return {"status": "started", "message": f"Simulation started for {order_id}"}
+        route = await simulation.start_order(order_id)
+        return {"status": "started", "message": f"Simulation started for {order_id}", "route": route}
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         print(f"Error starting simulation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+class SimulationStartRequest(BaseModel):
+    order_ids: list[str] = []
+    synthetic: int = 0 # random in-memory routes for load tests (not persisted)
+    steps: int = 100
+
+@app.post("/admin/simulation/start")
+async def start_simulation(request: SimulationStartRequest, user = Depends(get_current_admin)):
+    """Start simulations for orders and/or synthetic load-test routes. Admin only."""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    if request.steps < 1 or request.synthetic < 0:
+        raise HTTPException(status_code=400, detail="steps must be positive and synthetic non-negative")
+
+    results = await asyncio.gather(
+        *(simulation.start_order(order_id, request.steps) for order_id in request.order_ids),
+        return_exceptions=True,
+    )
+    started, failed = [], []
+    for order_id, result in zip(request.order_ids, results):
+        if isinstance(result, Exception):
+            failed.append({"order_id": order_id, "error": str(result)})
+        else:
+            started.append({"order_id": order_id, **result})
+    try:
+        simulation.add_synthetic(request.synthetic, request.steps)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "started", "started": started, "failed": failed, "synthetic": request.synthetic}
+
+@app.post("/admin/simulation/stop")
+async def stop_simulation(user = Depends(get_current_admin)):
+    """Stop every running simulation. Admin only."""
+    await simulation.stop()
+    return {"status": "stopped"}
+
+@app.get("/admin/simulation/status")
+async def get_simulation_status(user = Depends(get_current_admin)):
+    """Running simulations and tick timings. Admin only."""
+    return simulation.status()
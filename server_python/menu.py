@@ -0,0 +1,180 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+
+import repository
+
+# Products can also be edited straight through Supabase (admin app), so the
+# catalog is reloaded in the background after this many seconds.
+MENU_TTL = float(os.getenv("MENU_CACHE_TTL", "60"))
+MISS_REFRESH_INTERVAL = float(os.getenv("MENU_MISS_REFRESH_INTERVAL", "5"))
+
+
+class PricingError(Exception):
+    """An order item can't be priced (unknown or unavailable product, bad quantity)."""
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(',', ':'), default=str)
+
+
+class MenuSnapshot:
+    def __init__(self, version: int, body: bytes):
+        self.version = version
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=6)
+        self.etag = f'W/"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+
+class MenuCatalog:
+    """
+    In-memory products and categories. Serves the public menu as a
+    pre-serialized, pre-compressed snapshot and prices order items without
+    per-item queries. Product writes through the API update it in place.
+    """
+
+    def __init__(self, ttl: float = MENU_TTL):
+        self.ttl = ttl
+        self.loaded_at = None
+        self.version = 0
+        self._products = {}
+        self._categories = {}
+        self._fragments = {}  # product id -> serialized JSON, reused across versions
+        self._snapshot = None
+        self._content = None
+        self._lock = asyncio.Lock()
+        self._refresh_task = None
+        self._last_miss_refresh = 0.0
+        self._touched = None  # product ids written while a reload is in flight
+
+    # --- loading / incremental updates ---
+
+    def replace(self, products, categories):
+        self._products = {str(p['id']): p for p in products}
+        self._categories = {str(c['id']): c for c in categories}
+        self._fragments = {}
+        self.loaded_at = time.monotonic()
+        self._rebuild()
+
+    def _touch(self, pid):
+        if self._touched is not None:
+            self._touched.add(pid)
+
+    def upsert_product(self, product: dict):
+        pid = str(product['id'])
+        self._touch(pid)
+        self._products[pid] = {**self._products.get(pid, {}), **product}
+        self._fragments.pop(pid, None)
+        self._rebuild()
+
+    def remove_product(self, product_id):
+        pid = str(product_id)
+        self._touch(pid)
+        if self._products.pop(pid, None) is not None:
+            self._fragments.pop(pid, None)
+            self._rebuild()
+
+    def _rebuild(self):
+        parts = []
+        for pid, product in self._products.items():
+            if not product.get('is_available', True):
+                continue
+            fragment = self._fragments.get(pid)
+            if fragment is None:
+                fragment = self._fragments[pid] = _dumps(product)
+            parts.append(fragment)
+        content = f'"categories":{_dumps(list(self._categories.values()))},"products":[{",".join(parts)}]'
+        if self._snapshot is not None and content == self._content:
+            return  # a reload with no changes keeps the version (and ETag)
+        self._content = content
+        self.version += 1
+        self._snapshot = MenuSnapshot(self.version, f'{{"version":{self.version},{content}}}'.encode())
+
+    async def refresh(self):
+        """Reloads the catalog; product writes made while the query ran win over its result."""
+        async with self._lock:
+            self._touched = set()
+            try:
+                products, categories = await asyncio.gather(
+                    repository.get_products(),
+                    repository.get_categories(),
+                )
+                fresh = {str(p['id']): p for p in products}
+                for pid in self._touched:
+                    if pid in self._products:
+                        fresh[pid] = self._products[pid]
+                    else:
+                        fresh.pop(pid, None)
+                self.replace(fresh.values(), categories)
+            finally:
+                self._touched = None
+            print(f"Menu catalog loaded: {len(products)} products, {len(categories)} categories")
+
+    async def _refresh_quietly(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            print(f"Error refreshing menu catalog: {e}")
+
+    async def ensure_fresh(self):
+        if self.loaded_at is None:
+            await self.refresh()
+        elif time.monotonic() - self.loaded_at > self.ttl:
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._refresh_quietly())
+
+    async def snapshot(self) -> MenuSnapshot:
+        await self.ensure_fresh()
+        return self._snapshot
+
+    # --- pricing ---
+
+    def get_product(self, product_id):
+        return self._products.get(str(product_id))
+
+    def get_category(self, category_id):
+        return self._categories.get(str(category_id))
+
+    async def price_items(self, items):
+        """
+        Returns (priced_items, total) with unit prices taken from the catalog
+        instead of the client. Raises PricingError for items that can't be sold.
+        """
+        await self.ensure_fresh()
+        if not items:
+            raise PricingError("Order has no items")
+        if not all(isinstance(item, dict) for item in items):
+            raise PricingError("Invalid order items")
+        unknown = [i.get('product_id') for i in items if self.get_product(i.get('product_id')) is None]
+        if unknown and time.monotonic() - self._last_miss_refresh > MISS_REFRESH_INTERVAL:
+            # Possibly created directly in Supabase since the last load
+            self._last_miss_refresh = time.monotonic()
+            await self.refresh()
+
+        priced = []
+        total = 0.0
+        for item in items:
+            product = self.get_product(item.get('product_id'))
+            if product is None:
+                raise PricingError(f"Unknown product: {item.get('product_id')}")
+            if not product.get('is_available', True):
+                raise PricingError(f"Product not available: {product.get('name')}")
+            quantity = item.get('quantity')
+            if isinstance(quantity, float) and quantity.is_integer():
+                quantity = int(quantity)
+            if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+                raise PricingError(f"Invalid quantity for {product.get('name')}")
+
+            try:
+                price = float(product['price'])
+            except (TypeError, ValueError):
+                raise PricingError(f"Product has no price: {product.get('name')}")
+            priced.append({**item, 'quantity': quantity, 'price': price})
+            total += price * quantity
+        return priced, round(total, 2)
+
+
+menu_catalog = MenuCatalog()
@@ -0,0 +1,266 @@
+import contextvars
+import inspect
+import os
+import time
+from bisect import bisect_left
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Exposed at GET /metrics in Prometheus text format. With METRICS_TOKEN set,
+# scrapers must send `Authorization: Bearer <token>`.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CALL_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Route label for requests that matched no route (keeps 404 scans from
+# creating a series per path) and for backend calls made outside a request
+UNMATCHED = "unmatched"
+BACKGROUND = "background"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labels)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def expose(self):
+        lines = super().expose()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [per-bucket counts (+Inf last), sum]
+
+    def observe(self, value, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "manda_http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status")))
+http_duration = registry.register(Histogram(
+    "manda_http_request_duration_seconds", "HTTP request latency.", ("method", "route")))
+http_in_flight = registry.register(Gauge(
+    "manda_http_requests_in_flight", "HTTP requests being handled (open SSE streams included)."))
+request_backend_calls = registry.register(Histogram(
+    "manda_http_request_backend_calls", "Supabase calls made while handling one request.", ("method", "route"), CALL_BUCKETS))
+request_backend_seconds = registry.register(Histogram(
+    "manda_http_request_backend_seconds", "Time spent waiting on Supabase while handling one request.", ("method", "route")))
+backend_calls = registry.register(Counter(
+    "manda_supabase_calls_total", "Supabase calls by calling route, table (or rpc) and outcome.", ("route", "target", "outcome")))
+backend_duration = registry.register(Histogram(
+    "manda_supabase_call_duration_seconds", "Supabase call latency by calling route and table (or rpc).", ("route", "target")))
+
+
+# --- per-request attribution ---
+
+class RequestStats:
+    """Backend calls made on behalf of one request, filled in by the client wrapper."""
+
+    __slots__ = ("calls", "seconds", "by_target", "done")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.by_target = []  # (target, seconds, outcome)
+        self.done = False
+
+
+_current = contextvars.ContextVar("metrics_request", default=None)
+
+
+def _record_backend_call(target, seconds, outcome):
+    stats = _current.get()
+    if stats is None or stats.done:
+        # Startup, background loops, or a task that outlived its request
+        backend_calls.inc(BACKGROUND, target, outcome)
+        backend_duration.observe(seconds, BACKGROUND, target)
+        return
+    stats.calls += 1
+    stats.seconds += seconds
+    stats.by_target.append((target, seconds, outcome))
+
+
+# --- supabase client wrapper ---
+
+class _InstrumentedQuery:
+    """Proxies a PostgREST request builder, timing execute() (sync or async)."""
+
+    __slots__ = ("_builder", "_target")
+
+    def __init__(self, builder, target):
+        self._builder = builder
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if name == "execute":
+            return self._execute
+        if hasattr(attr, "execute"):  # properties such as not_
+            return _InstrumentedQuery(attr, self._target)
+        if not callable(attr):
+            return attr
+
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return _InstrumentedQuery(result, self._target) if hasattr(result, "execute") else result
+        return chained
+
+    def _execute(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = self._builder.execute(*args, **kwargs)
+        except Exception:
+            _record_backend_call(self._target, time.perf_counter() - started, "error")
+            raise
+        if inspect.isawaitable(result):
+            return self._await(result, started)
+        _record_backend_call(self._target, time.perf_counter() - started, "ok")
+        return result
+
+    async def _await(self, awaitable, started):
+        try:
+            result = await awaitable
+        except Exception:
+            _record_backend_call(self._target, time.perf_counter() - started, "error")
+            raise
+        _record_backend_call(self._target, time.perf_counter() - started, "ok")
+        return result
+
+
+class InstrumentedClient:
+    """
+    Wraps a supabase Client / AsyncClient so every execute() on table(),
+    from_() and rpc() queries is timed and attributed to the route being
+    served. Everything else (auth, storage, ...) is passed through.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name, *args, **kwargs):
+        return _InstrumentedQuery(self._client.table(name, *args, **kwargs), name)
+
+    def from_(self, name, *args, **kwargs):
+        return _InstrumentedQuery(self._client.from_(name, *args, **kwargs), name)
+
+    def rpc(self, name, *args, **kwargs):
+        return _InstrumentedQuery(self._client.rpc(name, *args, **kwargs), f"rpc:{name}")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def instrument_client(client):
+    if client is None or not METRICS_ENABLED or isinstance(client, InstrumentedClient):
+        return client
+    return InstrumentedClient(client)
+
+
+# --- ASGI middleware ---
+
+class MetricsMiddleware:
+    """Records latency, status and backend usage per route for every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        started = time.perf_counter()
+        http_in_flight.inc()
+
+        async def tracking_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, tracking_send)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec()
+            stats.done = True
+            _current.reset(token)
+
+            route = getattr(scope.get("route"), "path", None) or UNMATCHED
+            method = scope["method"]
+            http_requests.inc(method, route, str(status))
+            http_duration.observe(elapsed, method, route)
+            request_backend_calls.observe(stats.calls, method, route)
+            request_backend_seconds.observe(stats.seconds, method, route)
+            for target, seconds, outcome in stats.by_target:
+                backend_calls.inc(route, target, outcome)
+                backend_duration.observe(seconds, route, target)
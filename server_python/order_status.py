@@ -0,0 +1,24 @@
+# Order statuses allowed by the orders_status_check constraint
+# (sql/fix_order_status.sql).
+ORDER_STATUSES = ('pending', 'prep', 'ready', 'on_way', 'delivered', 'completed', 'cancelled')
+
+# Still being worked on (kitchen or delivery) vs. finished
+ACTIVE_STATUSES = ('pending', 'prep', 'ready', 'on_way')
+COMPLETED_STATUSES = ('delivered', 'completed')
+
+# Allowed moves (pending -> prep -> ready -> on_way / delivered / completed,
+# cancel from any non-final status). Enforced by PATCH /kds/orders.
+TRANSITIONS = {
+    'pending': ('prep', 'cancelled'),
+    'prep': ('ready', 'cancelled'),
+    'ready': ('on_way', 'delivered', 'completed', 'cancelled'),
+    'on_way': ('delivered', 'cancelled'),
+    'delivered': ('completed',),
+    'completed': (),
+    'cancelled': (),
+}
+
+
+def allowed_from(status: str):
+    """Statuses an order may be in to move to `status`."""
+    return [s for s, targets in TRANSITIONS.items() if status in targets]
@@ -0,0 +1,307 @@
+# Async data access for the API handlers in main.py.
+# Every function awaits the shared async Supabase client (database.py), so
+# handlers don't hold threadpool workers while waiting on PostgREST, and
+# independent reads can be issued together with asyncio.gather.
+import base64
+import json
+
+import database
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+def db():
+    if database.async_supabase is None:
+        raise DatabaseUnavailable("Supabase not configured")
+    return database.async_supabase
+
+
+PAGE_SIZE = 1000  # PostgREST's default max rows per response
+
+
+async def fetch_all(build_query, page_size: int = PAGE_SIZE):
+    """Runs a query page by page with range() and returns all rows."""
+    rows = []
+    start = 0
+    while True:
+        res = await build_query().range(start, start + page_size - 1).execute()
+        rows.extend(res.data)
+        if len(res.data) < page_size:
+            return rows
+        start += page_size
+
+
+async def iter_pages(build_query, page_size: int = PAGE_SIZE):
+    """Like fetch_all, but yields one page at a time so callers never hold the full result."""
+    start = 0
+    while True:
+        res = await build_query().range(start, start + page_size - 1).execute()
+        if res.data:
+            yield res.data
+        if len(res.data) < page_size:
+            return
+        start += page_size
+
+
+async def iter_keyset_pages(build_query, key: str = 'id', page_size: int = PAGE_SIZE):
+    """
+    Like iter_pages, but pages on `key` (unique, ascending) instead of an
+    offset, so rows inserted or deleted during the scan can't shift later
+    pages and make rows be read twice or skipped.
+    """
+    last = None
+    while True:
+        query = build_query()
+        if last is not None:
+            query = query.gt(key, last)
+        res = await query.order(key).limit(page_size).execute()
+        if res.data:
+            yield res.data
+            last = res.data[-1][key]
+        if len(res.data) < page_size:
+            return
+
+
+# --- TABLES / ESTABLISHMENTS ---
+
+async def get_tables():
+    """All tables, paged so large floors aren't cut off at the PostgREST row cap."""
+    return await fetch_all(
+        lambda: db().table("tables").select("id, table_number, establishment_id, qr_code_uuid").order("id")
+    )
+
+async def get_establishments():
+    res = await db().table("establishments").select("*").execute()
+    return res.data
+
+
+# --- ORDERS ---
+
+def build_order_items(items):
+    """Maps cart items from the client onto order_items columns."""
+    items_data = []
+    for item in items:
+        items_data.append({
+            "product_id": item['product_id'],
+            "quantity": item['quantity'],
+            "unit_price": item['price'],
+            "notes": item.get('notes')
+        })
+    return items_data
+
+async def place_order(order_data: dict, items, delivery_data: dict | None = None):
+    """
+    Creates the order, its items and optionally its delivery in a single
+    transaction via the place_order() Postgres function. Returns the order row
+    (plus `delivery_id` when a delivery was created).
+    """
+    res = await db().rpc('place_order', {
+        'p_order': order_data,
+        'p_items': build_order_items(items),
+        'p_delivery': delivery_data,
+    }).execute()
+    return res.data
+
+async def get_active_orders(order_ids=None):
+    """Orders on the kitchen board (pending or prep) with items and table, oldest first."""
+    def build_query():
+        query = db().table('orders') \
+            .select('*, tables(table_number), order_items(*, products(name))') \
+            .or_('status.eq.pending,status.eq.prep')
+        if order_ids is not None:
+            query = query.in_('id', list(order_ids))
+        return query.order('created_at', desc=False).order('id')
+    return await fetch_all(build_query)
+
+async def set_orders_status(order_ids, status: str, from_statuses=None):
+    """
+    Updates the status of one or more orders in one call (sql/set_orders_status.sql).
+    With `from_statuses`, only orders currently in one of them are updated.
+    Returns the updated rows, each with its previous status in `old_status`.
+    """
+    params = {'p_order_ids': list(order_ids), 'p_status': status}
+    if from_statuses is not None:
+        params['p_from_statuses'] = list(from_statuses)
+    res = await db().rpc('set_orders_status', params).execute()
+    return res.data or []
+
+async def get_order_statuses(order_ids):
+    """{order_id: status} for the given orders (missing ids are left out)."""
+    res = await db().table('orders').select('id, status').in_('id', list(order_ids)).execute()
+    return {str(row['id']): row['status'] for row in res.data}
+
+# Embedded resources /admin/orders can include (?expand=); profiles are
+# attached separately (attach_profiles) since many orders have no user_id.
+ORDER_EXPANSIONS = {
+    'items': 'order_items(*, products(name, price, image_url))',
+    'tables': 'tables(table_number)',
+    'delivery': 'deliveries(*)',
+}
+
+def encode_cursor(order: dict) -> str:
+    """Opaque keyset cursor pointing just past `order` in (created_at, id) order."""
+    raw = json.dumps([order['created_at'], str(order['id'])], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str):
+    """(created_at, id) from encode_cursor(); raises ValueError if malformed."""
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(order_id, str) or '"' in created_at + order_id:
+        raise ValueError("Invalid cursor")
+    return created_at, order_id
+
+async def list_orders(status=None, order_type=None, date_from=None, date_to=None, limit=100,
+                      after=None, columns='*', expand=('items', 'tables')):
+    """
+    Orders newest first, ordered by (created_at, id). `after` is a decoded
+    cursor: only orders strictly before it are returned, so every page
+    costs the same however deep it is.
+    """
+    select = ', '.join([columns] + [ORDER_EXPANSIONS[name] for name in expand])
+    query = db().table('orders').select(select)
+    if after:
+        created_at, order_id = after
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{order_id}")')
+    if status:
+        query = query.eq('status', status)
+    if order_type:
+        query = query.eq('order_type', order_type)
+    if date_from:
+        query = query.gte('created_at', date_from)
+    if date_to:
+        query = query.lte('created_at', date_to)
+
+    res = await query.order('created_at', desc=True).order('id', desc=True).limit(limit).execute()
+    return res.data
+
+async def get_order_detail(order_id: str):
+    res = await db().table('orders').select(
+        '*, order_items(*, products(name, price, image_url)), tables(table_number), deliveries(*)'
+    ).eq('id', order_id).single().execute()
+    return res.data
+
+async def get_order_route(order_id: str):
+    """Order with its delivery rows: what a delivery simulation needs to plan a route."""
+    res = await db().table('orders').select('id, establishment_id, user_id, deliveries(*)') \
+        .eq('id', order_id).limit(1).execute()
+    return res.data[0] if res.data else None
+
+async def count_orders(status: str | None = None, created_before: str | None = None):
+    """Exact row count (no rows transferred), optionally for one status / orders older than a timestamp."""
+    query = db().table('orders').select('id', count='exact', head=True)
+    if status:
+        query = query.eq('status', status)
+    if created_before:
+        query = query.lt('created_at', created_before)
+    res = await query.execute()
+    return res.count or 0
+
+
+# --- PROFILES ---
+
+async def get_profiles(user_ids, columns: str):
+    """
+    Batched profile loader: one in_() query for all distinct user ids.
+    Returns {user_id: profile or None}; profiles only carry `columns`.
+    """
+    user_ids = list(dict.fromkeys(uid for uid in user_ids if uid))
+    if not user_ids:
+        return {}
+
+    wanted = [c.strip() for c in columns.split(',')]
+    res = await db().table('profiles').select(', '.join(['id'] + [c for c in wanted if c != 'id'])).in_('id', user_ids).execute()
+
+    profiles = {uid: None for uid in user_ids}
+    for row in res.data:
+        profiles[row['id']] = {c: row.get(c) for c in wanted}
+    return profiles
+
+async def attach_profiles(orders, columns: str):
+    """Sets order['profiles'] on every order with a single profiles query."""
+    profiles = await get_profiles((order.get('user_id') for order in orders), columns)
+    for order in orders:
+        order['profiles'] = profiles.get(order.get('user_id'))
+    return orders
+
+async def update_profile_role(user_id: str, role: str):
+    res = await db().table('profiles').update({'role': role}).eq('id', user_id).execute()
+    return res.data
+
+
+# --- PRODUCTS ---
+
+async def get_products():
+    return await fetch_all(lambda: db().table("products").select("*").order("id"))
+
+async def get_categories():
+    return await fetch_all(lambda: db().table("categories").select("*").order("id"))
+
+async def insert_product(data: dict):
+    res = await db().table("products").insert(data).execute()
+    return res.data
+
+async def update_product(product_id: str, payload: dict):
+    res = await db().table("products").update(payload).eq("id", product_id).execute()
+    return res.data
+
+async def delete_product(product_id: str):
+    res = await db().table("products").delete().eq("id", product_id).execute()
+    return res.data
+
+
+# --- DELIVERIES ---
+
+async def insert_delivery(data: dict):
+    res = await db().table('deliveries').insert(data).execute()
+    return res.data[0]
+
+async def get_delivery_for_order(order_id: str):
+    res = await db().table('deliveries').select('id').eq('order_id', order_id).execute()
+    return res.data[0] if res.data else None
+
+async def get_delivery(delivery_id: str):
+    res = await db().table('deliveries').select('driver_id, status').eq('id', delivery_id).limit(1).execute()
+    return res.data[0] if res.data else None
+
+async def get_delivery_parties(delivery_id: str):
+    """Assigned driver and the order's customer: who may follow the delivery."""
+    res = await db().table('deliveries').select('id, driver_id, orders(user_id)').eq('id', delivery_id).limit(1).execute()
+    if not res.data:
+        return None
+    delivery = res.data[0]
+    return {'driver_id': delivery.get('driver_id'), 'user_id': (delivery.get('orders') or {}).get('user_id')}
+
+async def update_delivery(delivery_id: str, data: dict):
+    res = await db().table('deliveries').update(data).eq('id', delivery_id).execute()
+    return res.data
+
+async def update_open_delivery(delivery_id: str, data: dict):
+    """Updates a delivery only while it is still in the open pool (no driver moving it yet)."""
+    res = await db().table('deliveries').update(data).eq('id', delivery_id).eq('status', 'open').execute()
+    return res.data
+
+async def get_open_deliveries():
+    """The delivery pool (status 'open'), paged."""
+    return await fetch_all(
+        lambda: db().table('deliveries')
+            .select('id, order_id, address, current_lat, current_lng, created_at')
+            .eq('status', 'open').order('id')
+    )
+
+async def get_delivery_position(delivery_id: str):
+    res = await db().table('deliveries').select('id, driver_id, status, current_lat, current_lng, updated_at') \
+        .eq('id', delivery_id).limit(1).execute()
+    return res.data[0] if res.data else None
+
+async def update_delivery_positions(positions):
+    """
+    Writes many delivery positions in one call (sql/update_delivery_positions.sql).
+    `positions` is a list of {"id", "current_lat", "current_lng"}.
+    """
+    res = await db().rpc('update_delivery_positions', {'p_positions': list(positions)}).execute()
+    return res.data
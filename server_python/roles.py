@@ -0,0 +1,82 @@
+import os
+import threading
+
+from cache import TTLCache
+
+# Optional JWT claim carrying the role (e.g. "user_role" set by a custom access
+# token hook, or "app_metadata.role"). When present it is trusted as-is.
+ROLE_CLAIM = os.getenv("AUTH_ROLE_CLAIM")
+
+_role_cache = TTLCache(
+    maxsize=int(os.getenv("ROLE_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("ROLE_CACHE_TTL", "60")),
+)
+
+_NO_ROLE = ""  # cached marker for users without a profile row
+
+# One lookup per user at a time: concurrent requests (e.g. the dashboard's
+# parallel stats calls) wait for the first query instead of repeating it.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _user_id(user):
+    # UserResponse wrapper handling
+    return user.user.id if hasattr(user, 'user') else user.id
+
+
+def _role_from_claims(user):
+    if not ROLE_CLAIM:
+        return None
+    claims = getattr(user, 'claims', None)
+    if claims is None:
+        # Remotely validated users only expose app_metadata
+        inner = user.user if hasattr(user, 'user') else user
+        claims = {"app_metadata": getattr(inner, 'app_metadata', None) or {}}
+    value = claims
+    for part in ROLE_CLAIM.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value if isinstance(value, str) else None
+
+
+def resolve_role(user, client):
+    """
+    Returns the role of an authenticated user ('admin', 'driver', 'client')
+    or None. Reads the configured JWT claim first, then a per-process cache,
+    and only queries `profiles` on a cache miss.
+    """
+    role = _role_from_claims(user)
+    if role:
+        return role
+
+    user_id = _user_id(user)
+    cached = _role_cache.get(user_id)
+    if cached is not None:
+        return cached or None
+
+    with _inflight_lock:
+        lock = _inflight.setdefault(user_id, threading.Lock())
+    try:
+        with lock:
+            cached = _role_cache.get(user_id)
+            if cached is not None:
+                return cached or None
+
+            res = client.table('profiles').select('role').eq('id', user_id).limit(1).execute()
+            role = res.data[0].get('role') if res.data else None
+            _role_cache.set(user_id, role or _NO_ROLE)
+            return role
+    finally:
+        with _inflight_lock:
+            if _inflight.get(user_id) is lock:
+                del _inflight[user_id]
+
+
+def invalidate_role(user_id=None):
+    """Drops the cached role for one user, or for everyone when no id is given."""
+    if user_id is None:
+        _role_cache.clear()
+    else:
+        _role_cache.pop(user_id)
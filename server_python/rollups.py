@@ -0,0 +1,221 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import repository
+
+# Business timezone: daily buckets are kept per local day in this zone, and
+# it is the default for /admin/stats/sales.
+STATS_TIMEZONE = os.getenv("STATS_TIMEZONE", "UTC")
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+# Longest custom range served per granularity, so one request can't walk
+# decades of buckets on the event loop
+MAX_RANGE_DAYS = {'hour': 400, 'day': 3660, 'week': 3660, 'month': 3660}
+
+ALL = '*'  # bucket owner summing every establishment
+
+
+def parse_timestamp(value) -> datetime:
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        # Handle Z timezone or offset if present
+        dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _log_failure(task):
+    if not task.cancelled() and task.exception():
+        print(f"Error backfilling rollups: {task.exception()}")
+
+
+# Sub-daily buckets are 15 minutes wide so that local hours and days line up
+# with whole buckets in every timezone, including the :30 and :45 offsets
+SLOT_SECONDS = 15 * 60
+
+
+def _slot_key(dt: datetime) -> int:
+    return int(dt.timestamp() // SLOT_SECONDS)
+
+
+class SalesRollups:
+    """
+    Pre-summed sales buckets per establishment (and for all of them under
+    ALL): per 15-minute slot and per local day in STATS_TIMEZONE, each
+    holding [revenue, order_count].
+
+    Kept in-process and updated as orders are placed and cancelled, after a
+    paged backfill at startup (or POST /admin/stats/rollups/rebuild).
+    Cancelled orders don't count towards sales. Like the other in-memory
+    caches this assumes a single API worker.
+    """
+
+    def __init__(self, tz: str = STATS_TIMEZONE):
+        self.tz = ZoneInfo(tz)
+        self.slots = {}
+        self.daily = {}
+        self.ready = False
+        self._backfill_task = None
+        self._pending = None  # events seen while a backfill is running
+
+    # --- incremental maintenance ---
+
+    def _apply(self, slots, daily, order, sign: int):
+        amount = float(order.get('total_amount') or 0.0)
+        created = parse_timestamp(order['created_at'])
+        est_id = order.get('establishment_id')
+        slot = _slot_key(created)
+        day = created.astimezone(self.tz).date()
+        for owner in (est_id, ALL):
+            for buckets, key in ((slots, (owner, slot)), (daily, (owner, day))):
+                bucket = buckets.setdefault(key, [0.0, 0])
+                bucket[0] += sign * amount
+                bucket[1] += sign
+
+    def record_order(self, order):
+        """A new order was placed."""
+        if self._pending is not None:
+            self._pending.append((order, None))
+        if order.get('status') != 'cancelled':
+            self._apply(self.slots, self.daily, order, 1)
+
+    def record_status_change(self, order, old_status):
+        """`order` (with its new status) moved from `old_status`."""
+        if self._pending is not None:
+            self._pending.append((order, old_status))
+        new_status = order.get('status')
+        if new_status == 'cancelled' and old_status != 'cancelled':
+            self._apply(self.slots, self.daily, order, -1)
+        elif old_status == 'cancelled' and new_status != 'cancelled':
+            self._apply(self.slots, self.daily, order, 1)
+
+    # --- backfill ---
+
+    async def backfill(self):
+        """Rebuilds all buckets from the orders table, one page at a time."""
+        slots, daily = {}, {}
+        self._pending = []
+        cutoff = datetime.now(timezone.utc).isoformat()
+        counted = {}  # order id -> counted as a sale by the scan
+        try:
+            count = 0
+            async for page in repository.iter_pages(
+                lambda: repository.db().table('orders')
+                    .select('id, establishment_id, created_at, total_amount, status')
+                    .lt('created_at', cutoff)
+                    .order('created_at').order('id')
+            ):
+                for order in page:
+                    counted[str(order['id'])] = order.get('status') != 'cancelled'
+                    if counted[str(order['id'])]:
+                        self._apply(slots, daily, order, 1)
+                count += len(page)
+
+            # Replay what happened to newer orders while we were scanning.
+            # Older ones were scanned, but maybe before they changed: keep
+            # their latest change and correct the scan where it differs.
+            latest = {}
+            for order, old_status in self._pending:
+                if parse_timestamp(order['created_at']) < parse_timestamp(cutoff):
+                    if old_status is not None:
+                        latest[str(order['id'])] = order
+                    continue
+                if old_status is None:
+                    if order.get('status') != 'cancelled':
+                        self._apply(slots, daily, order, 1)
+                elif order.get('status') == 'cancelled' and old_status != 'cancelled':
+                    self._apply(slots, daily, order, -1)
+                elif old_status == 'cancelled' and order.get('status') != 'cancelled':
+                    self._apply(slots, daily, order, 1)
+            for order_id, order in latest.items():
+                if order_id not in counted:
+                    continue
+                counts = order.get('status') != 'cancelled'
+                if counts != counted[order_id]:
+                    self._apply(slots, daily, order, 1 if counts else -1)
+
+            self.slots, self.daily = slots, daily
+            self.ready = True
+            print(f"Sales rollups backfilled from {count} orders")
+        finally:
+            self._pending = None
+
+    def start_backfill(self):
+        if self._backfill_task is None or self._backfill_task.done():
+            self._backfill_task = asyncio.create_task(self.backfill())
+            self._backfill_task.add_done_callback(_log_failure)
+        return self._backfill_task
+
+    async def ensure_ready(self):
+        if not self.ready:
+            await self.start_backfill()
+
+    # --- reads ---
+
+    def _sum_slots(self, est_id, start: datetime, end: datetime):
+        """[start, end), both on slot boundaries (local hours and days are)."""
+        est_id = ALL if est_id is None else est_id
+        revenue, orders = 0.0, 0
+        for slot in range(_slot_key(start), _slot_key(end)):
+            bucket = self.slots.get((est_id, slot))
+            if bucket:
+                revenue += bucket[0]
+                orders += bucket[1]
+        return revenue, orders
+
+    def _sum_day(self, est_id, day, tz):
+        """One local day; uses the daily buckets when tz is the business timezone."""
+        if tz.key == self.tz.key:
+            bucket = self.daily.get((ALL if est_id is None else est_id, day), (0.0, 0))
+            return bucket[0], bucket[1]
+        start = datetime.combine(day, datetime.min.time(), tzinfo=tz)
+        end = datetime.combine(day + timedelta(days=1), datetime.min.time(), tzinfo=tz)
+        return self._sum_slots(est_id, start, end)
+
+    def series(self, start: datetime, end: datetime, granularity: str = 'day', tz: str | None = None, establishment_id=None):
+        """
+        Buckets covering [start, end) at the given granularity, aligned to
+        local time in `tz`. Returns [{"start", "revenue", "orders"}, ...].
+        """
+        zone = ZoneInfo(tz) if tz else self.tz
+        start = start.astimezone(zone)
+        end = end.astimezone(zone)
+        points = []
+
+        if granularity == 'hour':
+            cursor = start.replace(minute=0, second=0, microsecond=0)
+            while cursor < end:
+                nxt = (cursor.astimezone(timezone.utc) + timedelta(hours=1)).astimezone(zone)
+                revenue, orders = self._sum_slots(establishment_id, cursor, nxt)
+                points.append({"start": cursor, "revenue": revenue, "orders": orders})
+                cursor = nxt
+            return points
+
+        day = start.date()
+        last = (end - timedelta(microseconds=1)).date()
+        while day <= last:
+            if granularity == 'week':
+                period_end = day + timedelta(days=7 - day.weekday())
+            elif granularity == 'month':
+                period_end = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+            else:
+                period_end = day + timedelta(days=1)
+            revenue, orders = 0.0, 0
+            d = day
+            while d < period_end and d <= last:
+                r, o = self._sum_day(establishment_id, d, zone)
+                revenue += r
+                orders += o
+                d += timedelta(days=1)
+            points.append({
+                "start": datetime.combine(day, datetime.min.time(), tzinfo=zone),
+                "revenue": revenue,
+                "orders": orders,
+            })
+            day = period_end
+        return points
+
+
+sales_rollups = SalesRollups()
@@ -35,6 +35,10 @@ def setup():
     
     print(f"Found {len(existing_names)} existing: {list(existing_names.keys())}")
 
+    # Look for establishment (once, not per category)
+    est_res = supabase.table("establishments").select("id").limit(1).execute()
+    est_id = est_res.data[0]['id'] if est_res.data else 1
+
     # Insert missing
     for slug, name in REQUIRED_CATS.items():
         if name in existing_names:
@@ -43,10 +47,6 @@ def setup():
         
         print(f"Inserting {name}...")
         try:
-             # Look for establishment
-            est_res = supabase.table("establishments").select("id").limit(1).execute()
-            est_id = est_res.data[0]['id'] if est_res.data else 1
-
             new_cat = supabase.table("categories").insert({
                 "name": name,
                 "establishment_id": est_id
@@ -4,8 +4,7 @@ import asyncio
 from supabase import create_client, Client
 import os
 from dotenv import load_dotenv
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut
+from geocoding import geocoder, build_address_string
 
 # Load environment variables
 load_dotenv()
@@ -22,33 +21,19 @@ supabase: Client = create_client(url, key)
 # Configuration
 ORDER_ID = os.environ.get("SIMULATE_ORDER_ID")
 
-# Geocoding Setup
-geolocator = Nominatim(user_agent="manda_ai_driver_sim")
-
-def get_coordinates(address_str):
+# Geocoding goes through the shared cache (geocoding.py), so repeated
+# simulations don't hit Nominatim again for the same addresses
+async def get_coordinates(address_str):
     try:
         print(f"Geocoding: {address_str}")
-        location = geolocator.geocode(address_str)
-        if location:
-            return location.latitude, location.longitude
-        else:
+        coords = await geocoder.geocode(address_str)
+        if not coords:
             print("  -> Not found")
-            return None
+        return coords
     except Exception as e:
         print(f"  -> Geocoding error: {e}")
         return None
 
-def build_address_string(data):
-    if not data: return None
-    components = [
-        data.get('street'),
-        data.get('zip_code'),
-        data.get('city'),
-        data.get('country')
-    ]
-    # Filter empty/null and join
-    return ", ".join([c for c in components if c])
-
 async def simulate_delivery():
     if not ORDER_ID:
         print("Error: SIMULATE_ORDER_ID env var not set.")
@@ -76,7 +61,7 @@ async def simulate_delivery():
         est_res = supabase.table('establishments').select('*').eq('id', est_id).execute()
         if est_res.data:
              addr_str = build_address_string(est_res.data[0])
-             coords = get_coordinates(addr_str)
+             coords = await get_coordinates(addr_str)
              if coords:
                  start_lat, start_lng = coords
                  print(f"  -> Establishment: {start_lat}, {start_lng} ({addr_str})")
@@ -86,7 +71,7 @@ async def simulate_delivery():
         user_res = supabase.table('profiles').select('*').eq('id', user_id).execute()
         if user_res.data:
             addr_str = build_address_string(user_res.data[0])
-            coords = get_coordinates(addr_str)
+            coords = await get_coordinates(addr_str)
             if coords:
                  end_lat, end_lng = coords
                  print(f"  -> Customer: {end_lat}, {end_lng} ({addr_str})")
@@ -0,0 +1,184 @@
+import asyncio
+import math
+import os
+import random
+import time
+from array import array
+from datetime import datetime, timezone
+
+import repository
+from driver_locations import driver_locations
+from establishments import establishments
+from geocoding import geocoder, build_address_string, DEFAULT_COORDINATES
+
+SIM_TICK = float(os.getenv("SIM_TICK", "1.0"))
+SIM_STEPS = int(os.getenv("SIM_STEPS", "100"))
+MAX_SIMULATIONS = int(os.getenv("SIM_MAX_SIMULATIONS", "20000"))
+
+# Fallback customer position when neither dest_lat/dest_lng nor the
+# customer's profile address resolve (same as the old simulate_driver.py)
+DEFAULT_DESTINATION = (38.7369, -9.1426)
+
+
+class SimulationEngine:
+    """
+    Simulated deliveries driven from the server's own event loop (replaces
+    spawning simulate_driver.py per order). Routes are kept column-wise in
+    parallel arrays and every tick advances all of them in one pass;
+    positions go through the driver location store, whose write-behind
+    flusher persists them in bulk.
+    """
+
+    def __init__(self, tick: float = SIM_TICK):
+        self.tick = tick
+        self._keys = []  # delivery id per slot
+        self._meta = []  # {'order_id', 'persist'} per slot
+        self._slot = {}  # delivery id -> slot
+        self._start_lat = array('d')
+        self._start_lng = array('d')
+        self._d_lat = array('d')  # end - start
+        self._d_lng = array('d')
+        self._heading = array('d')
+        self._step = array('l')
+        self._steps = array('l')
+        self._task = None
+        self.ticks = 0
+        self.completed = 0
+        self.last_tick_ms = 0.0
+
+    # --- routes ---
+
+    def add(self, delivery_id: str, start, end, steps: int = SIM_STEPS, order_id=None, persist: bool = True):
+        if delivery_id in self._slot:
+            self.remove(delivery_id)
+        if len(self._keys) >= MAX_SIMULATIONS:
+            raise ValueError(f"At most {MAX_SIMULATIONS} simulations")
+        self._slot[delivery_id] = len(self._keys)
+        self._keys.append(delivery_id)
+        self._meta.append({'order_id': order_id, 'persist': persist})
+        self._start_lat.append(start[0])
+        self._start_lng.append(start[1])
+        self._d_lat.append(end[0] - start[0])
+        self._d_lng.append(end[1] - start[1])
+        self._heading.append(math.degrees(math.atan2(end[1] - start[1], end[0] - start[0])) % 360)
+        self._step.append(0)
+        self._steps.append(max(1, steps))
+        self._ensure_running()
+
+    def remove(self, delivery_id: str):
+        """Swap-removes a slot so the arrays stay dense."""
+        slot = self._slot.pop(delivery_id, None)
+        if slot is None:
+            return False
+        if not self._meta[slot]['persist']:
+            driver_locations.forget(delivery_id)
+        last = len(self._keys) - 1
+        for column in (self._keys, self._meta, self._start_lat, self._start_lng, self._d_lat, self._d_lng, self._heading, self._step, self._steps):
+            column[slot] = column[last]
+            column.pop()
+        if slot != last:
+            self._slot[self._keys[slot]] = slot
+        return True
+
+    def clear(self):
+        for delivery_id in list(self._keys):
+            self.remove(delivery_id)
+
+    async def start_order(self, order_id: str, steps: int = SIM_STEPS):
+        """Plans the route of an order's delivery (shop -> customer) and starts it."""
+        order = await repository.get_order_route(order_id)
+        if not order or not order.get('deliveries'):
+            raise LookupError("Delivery not found for order")
+        delivery = order['deliveries'][0]
+
+        await establishments.ensure_loaded()
+        shop_address = build_address_string(establishments.get(order.get('establishment_id')))
+
+        async def customer_address():
+            if not order.get('user_id'):
+                return None
+            profiles = await repository.get_profiles([order['user_id']], 'street, zip_code, city, country')
+            return build_address_string(profiles.get(order['user_id']))
+
+        if delivery.get('dest_lat') is not None:
+            shop = await geocoder.geocode(shop_address)
+            destination = (delivery['dest_lat'], delivery['dest_lng'])
+        else:
+            shop, destination = await asyncio.gather(
+                geocoder.geocode(shop_address),
+                geocoder.geocode(await customer_address()),
+            )
+        start = shop or DEFAULT_COORDINATES
+        end = destination or DEFAULT_DESTINATION
+        self.add(str(delivery['id']), start, end, steps, order_id=order_id)
+        return {"delivery_id": delivery['id'], "start": start, "end": end, "steps": steps}
+
+    def add_synthetic(self, count: int, steps: int = SIM_STEPS, center=DEFAULT_COORDINATES, radius_deg: float = 0.05):
+        """Random in-memory routes around `center` for load tests (never written to the database)."""
+        base = self.ticks
+        for i in range(count):
+            start = (center[0] + random.uniform(-radius_deg, radius_deg), center[1] + random.uniform(-radius_deg, radius_deg))
+            end = (center[0] + random.uniform(-radius_deg, radius_deg), center[1] + random.uniform(-radius_deg, radius_deg))
+            self.add(f"sim-{base}-{i}", start, end, steps, persist=False)
+        return count
+
+    # --- ticking ---
+
+    def advance(self):
+        """Moves every route one step and publishes the positions. Returns finished ids."""
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        step = self._step
+        for i in range(len(step)):
+            step[i] += 1
+        # Linear interpolation for all routes at once, column by column
+        t = [min(1.0, s / n) for s, n in zip(step, self._steps)]
+        lats = [a + d * f for a, d, f in zip(self._start_lat, self._d_lat, t)]
+        lngs = [a + d * f for a, d, f in zip(self._start_lng, self._d_lng, t)]
+
+        finished = []
+        for key, meta, lat, lng, heading, f in zip(self._keys, self._meta, lats, lngs, self._heading, t):
+            driver_locations.record(key, None, lat, lng, heading=heading, recorded_at=now, persist=meta['persist'])
+            if f >= 1.0:
+                finished.append(key)
+        for key in finished:
+            self.remove(key)
+        self.completed += len(finished)
+        self.ticks += 1
+        self.last_tick_ms = (time.perf_counter() - started) * 1000
+        return finished
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._keys:
+            await asyncio.sleep(self.tick)
+            try:
+                self.advance()
+            except Exception as e:
+                print(f"Error advancing simulation: {e}")
+
+    async def stop(self):
+        self.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def status(self):
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "active": len(self._keys),
+            "tick_seconds": self.tick,
+            "ticks": self.ticks,
+            "completed": self.completed,
+            "last_tick_ms": round(self.last_tick_ms, 3),
+            "simulations": [
+                {"delivery_id": key, "order_id": meta['order_id'], "step": s, "steps": n}
+                for key, meta, s, n in zip(self._keys[:100], self._meta, self._step, self._steps)
+            ],
+        }
+
+
+simulation = SimulationEngine()
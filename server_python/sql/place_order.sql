@@ -0,0 +1,54 @@
+-- Run this in Supabase SQL Editor
+-- Atomic order placement used by POST /orders/table and /orders/delivery.
+-- The order, its items and (for delivery) the delivery row are created in
+-- one transaction, so a failure can no longer leave orphan rows behind.
+-- Payloads are JSON shaped like the table rows; column types come from the
+-- tables themselves via jsonb_populate_record.
+-- Returns the order row; when a delivery is created its id is added as
+-- "delivery_id".
+
+create or replace function public.place_order(
+  p_order jsonb,
+  p_items jsonb default '[]'::jsonb,
+  p_delivery jsonb default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+  v_input public.orders;
+  v_order public.orders;
+  v_delivery_id uuid;
+begin
+  v_input := jsonb_populate_record(null::public.orders, p_order);
+
+  insert into public.orders (
+    establishment_id, table_id, user_id, order_type, total_amount, status, delivery_address
+  )
+  values (
+    v_input.establishment_id,
+    v_input.table_id,
+    v_input.user_id,
+    v_input.order_type,
+    v_input.total_amount,
+    coalesce(v_input.status, 'pending'),
+    v_input.delivery_address
+  )
+  returning * into v_order;
+
+  insert into public.order_items (order_id, product_id, quantity, unit_price, notes)
+  select v_order.id, i.product_id, i.quantity, i.unit_price, i.notes
+  from jsonb_populate_recordset(null::public.order_items, coalesce(p_items, '[]'::jsonb)) i;
+
+  if p_delivery is not null then
+    insert into public.deliveries (order_id, status, address, current_lat, current_lng)
+    select v_order.id, coalesce(d.status, 'open'), d.address, d.current_lat, d.current_lng
+    from jsonb_populate_record(null::public.deliveries, p_delivery) d
+    returning id into v_delivery_id;
+
+    return to_jsonb(v_order) || jsonb_build_object('delivery_id', v_delivery_id);
+  end if;
+
+  return to_jsonb(v_order);
+end;
+$$;
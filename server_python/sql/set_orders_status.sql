@@ -0,0 +1,43 @@
+-- Run this in Supabase SQL Editor
+-- Status updates used by PATCH /kds/orders and PATCH /kds/orders/{order_id}.
+-- Updates one or more orders in a single statement and returns the updated
+-- rows together with their previous status (old_status), which the API needs
+-- to keep its sales rollups and counters in step (e.g. subtract an order when
+-- it is cancelled).
+-- When p_from_statuses is given, only orders currently in one of those
+-- statuses are updated (the batch endpoint passes the statuses that may move
+-- to p_status); the others are left alone and are not returned.
+
+drop function if exists public.set_orders_status(uuid[], text);
+
+create or replace function public.set_orders_status(
+  p_order_ids uuid[],
+  p_status text,
+  p_from_statuses text[] default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+  v_result jsonb;
+begin
+  with previous as (
+    select o.id, o.status as old_status
+    from public.orders o
+    where o.id = any(p_order_ids)
+      and (p_from_statuses is null or o.status = any(p_from_statuses))
+    for update
+  ),
+  updated as (
+    update public.orders o
+    set status = p_status
+    from previous p
+    where o.id = p.id
+    returning o.*, p.old_status
+  )
+  select coalesce(jsonb_agg(to_jsonb(u)), '[]'::jsonb) into v_result
+  from updated u;
+
+  return v_result;
+end;
+$$;
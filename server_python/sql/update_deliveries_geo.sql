@@ -0,0 +1,8 @@
+-- Run this in Supabase SQL Editor
+-- Customer coordinates for deliveries, filled in by the API's geocoder
+-- (geocoding.py) shortly after a delivery order is placed.
+-- current_lat / current_lng remain the driver's (or the shop's) position.
+
+alter table public.deliveries
+add column if not exists dest_lat float,
+add column if not exists dest_lng float;
@@ -0,0 +1,25 @@
+-- Run this in Supabase SQL Editor
+-- Bulk position update used by the driver location flusher
+-- (driver_locations.py). p_positions is a JSON array of
+-- {"id", "current_lat", "current_lng"}; all rows are updated in one statement.
+
+create or replace function public.update_delivery_positions(
+  p_positions jsonb
+)
+returns integer
+language plpgsql
+as $$
+declare
+  v_count integer;
+begin
+  update public.deliveries d
+  set current_lat = p.current_lat,
+      current_lng = p.current_lng,
+      updated_at = now()
+  from jsonb_to_recordset(p_positions) as p(id uuid, current_lat float, current_lng float)
+  where d.id = p.id;
+
+  get diagnostics v_count = row_count;
+  return v_count;
+end;
+$$;
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+# Responses are fresh for STATS_CACHE_TTL seconds; after that they are still
+# served for up to STATS_CACHE_STALE more seconds while one background
+# refresh runs.
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "5"))
+STATS_CACHE_STALE = float(os.getenv("STATS_CACHE_STALE", "60"))
+STATS_CACHE_MAX_KEYS = int(os.getenv("STATS_CACHE_MAX_KEYS", "512"))
+
+
+def _log_failure(task):
+    if not task.cancelled() and task.exception():
+        print(f"Error refreshing stats cache: {task.exception()}")
+
+
+class StatsCache:
+    """
+    Response cache for the admin stats endpoints, keyed by endpoint and
+    parameters (establishment included). Concurrent requests for the same
+    key share one computation (single flight), and expired entries are
+    served stale while they are recomputed in the background. Errors are
+    never cached.
+    """
+
+    def __init__(self, ttl: float = STATS_CACHE_TTL, stale_ttl: float = STATS_CACHE_STALE, maxsize: int = STATS_CACHE_MAX_KEYS):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (computed_at, value)
+        self._inflight = {}            # key -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+
+    def _store(self, key, value):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _start(self, key, compute):
+        async def run():
+            try:
+                value = await compute()
+                self._store(key, value)
+                return value
+            finally:
+                self._inflight.pop(key, None)
+
+        task = self._inflight[key] = asyncio.create_task(run())
+        return task
+
+    async def get_or_compute(self, key, compute):
+        """Cached value for `key`, calling `await compute()` when needed."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    self._start(key, compute).add_done_callback(_log_failure)
+                return entry[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = self._start(key, compute)
+        # Shielded so a disconnecting client doesn't cancel the shared computation
+        return await asyncio.shield(task)
+
+    def invalidate(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "stale_hits": self.stale_hits,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+        }
+
+
+stats_cache = StatsCache()
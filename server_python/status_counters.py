@@ -0,0 +1,179 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+import repository
+from order_status import ORDER_STATUSES, ACTIVE_STATUSES, COMPLETED_STATUSES
+from rollups import STATS_TIMEZONE, parse_timestamp
+from zoneinfo import ZoneInfo
+
+# How often the counters are recomputed from the database to correct drift
+RECONCILE_INTERVAL = float(os.getenv("STATUS_RECONCILE_INTERVAL", "300"))
+
+
+class StatusCounters:
+    """
+    Live order counts per status (all time) and today's per-status order
+    count and revenue, so the admin home screen reads a handful of numbers
+    instead of scanning orders. Updated right after each order write
+    commits; a periodic reconcile() recomputes them from the database.
+    """
+
+    def __init__(self, tz: str = STATS_TIMEZONE):
+        self.tz = ZoneInfo(tz)
+        self.counts = {}
+        self.today = None
+        self.today_by_status = {}  # status -> [orders, revenue], for orders created today
+        self.ready = False
+        self._lock = asyncio.Lock()
+        self._pending = None  # events seen while a reconcile is running
+
+    def _roll_day(self):
+        today = datetime.now(self.tz).date()
+        if self.today != today:
+            self.today = today
+            self.today_by_status = {}
+        return today
+
+    def _is_today(self, order):
+        return parse_timestamp(order['created_at']).astimezone(self.tz).date() == self._roll_day()
+
+    def _bump(self, status, order, sign):
+        self.counts[status] = self.counts.get(status, 0) + sign
+        if self._is_today(order):
+            bucket = self.today_by_status.setdefault(status, [0, 0.0])
+            bucket[0] += sign
+            bucket[1] += sign * float(order.get('total_amount') or 0.0)
+
+    def _move_today(self, order, old_status, new_status):
+        amount = float(order.get('total_amount') or 0.0)
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            bucket = self.today_by_status.setdefault(status, [0, 0.0])
+            bucket[0] += sign
+            bucket[1] += sign * amount
+
+    def _apply_order(self, order):
+        self._bump(order.get('status') or 'pending', order, 1)
+
+    def _apply_change(self, order, old_status):
+        if old_status is not None:
+            self._bump(old_status, order, -1)
+        self._bump(order.get('status'), order, 1)
+
+    def record_order(self, order):
+        if self._pending is not None:
+            self._pending.append((order, None, None))
+        self._apply_order(order)
+
+    def begin_write(self):
+        """Call before issuing a status write; pass the result to record_status_change()."""
+        return time.monotonic()
+
+    def record_status_change(self, order, old_status, started=None):
+        """`started` is begin_write() from before the write; None if unknown."""
+        if old_status == order.get('status'):
+            return
+        if self._pending is not None:
+            self._pending.append((order, old_status, started))
+        self._apply_change(order, old_status)
+
+    async def reconcile(self):
+        """
+        Recomputes all counters: one count query per status plus today's
+        orders, both limited to orders created before the reconcile began.
+        Writes seen meanwhile are replayed on top, as in rollups.backfill(),
+        except status changes on older orders that may already be in the
+        counts: those are left for the next reconcile.
+        """
+        async with self._lock:
+            self._pending = []
+            try:
+                cutoff = datetime.now(timezone.utc).isoformat()
+                statuses = list(dict.fromkeys(ORDER_STATUSES + tuple(self.counts)))
+                counts = await asyncio.gather(*(
+                    repository.count_orders(status=s, created_before=cutoff) for s in statuses
+                ))
+                counted_at = time.monotonic()
+
+                today = datetime.now(self.tz).date()
+                start = datetime.combine(today, datetime.min.time(), tzinfo=self.tz)
+                today_by_status = {}
+                scanned = {}  # order id -> status the scan saw
+                async for page in repository.iter_pages(
+                    lambda: repository.db().table('orders')
+                        .select('id, status, total_amount')
+                        .gte('created_at', start.isoformat())
+                        .lt('created_at', cutoff)
+                        .order('id')
+                ):
+                    for order in page:
+                        scanned[str(order['id'])] = order['status']
+                        bucket = today_by_status.setdefault(order['status'], [0, 0.0])
+                        bucket[0] += 1
+                        bucket[1] += float(order.get('total_amount') or 0.0)
+
+                pending, self._pending = self._pending, None
+                self.counts = {s: n for s, n in zip(statuses, counts) if n}
+                self.today, self.today_by_status = today, today_by_status
+
+                latest = {}  # older order id -> its most recent change
+                for order, old_status, started in pending:
+                    if parse_timestamp(order['created_at']) >= parse_timestamp(cutoff):
+                        # Outside both snapshots: replay as it happened
+                        if old_status is None:
+                            self._apply_order(order)
+                        else:
+                            self._apply_change(order, old_status)
+                    elif old_status is not None:
+                        # Only a write issued after the counts returned is
+                        # surely missing from them; an earlier one may have
+                        # committed before they ran and be counted already
+                        if started is not None and started >= counted_at:
+                            self.counts[old_status] = self.counts.get(old_status, 0) - 1
+                            new_status = order.get('status')
+                            self.counts[new_status] = self.counts.get(new_status, 0) + 1
+                        latest[str(order['id'])] = order
+                # Today's scan may have read an order before or after it
+                # changed: correct it to the latest known status
+                for order_id, order in latest.items():
+                    seen = scanned.get(order_id)
+                    if seen is not None and seen != order.get('status'):
+                        self._move_today(order, seen, order.get('status'))
+                self.ready = True
+            finally:
+                self._pending = None
+
+    async def ensure_ready(self):
+        if not self.ready:
+            await self.reconcile()
+
+    async def run_reconciler(self, interval: float = RECONCILE_INTERVAL):
+        """Background loop started by main.py's lifespan."""
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"Error reconciling status counters: {e}")
+            await asyncio.sleep(interval)
+
+    def by_status(self):
+        return {status: n for status, n in self.counts.items() if n}
+
+    def today_summary(self):
+        self._roll_day()
+        total_orders = sum(b[0] for b in self.today_by_status.values())
+        total_revenue = sum(b[1] for b in self.today_by_status.values())
+        active_orders = sum(self.today_by_status.get(s, [0])[0] for s in ACTIVE_STATUSES)
+        completed_orders = sum(self.today_by_status.get(s, [0])[0] for s in COMPLETED_STATUSES)
+        avg_order_value = total_revenue / total_orders if total_orders > 0 else 0.0
+        return {
+            "total_orders": total_orders,
+            "total_revenue": round(total_revenue, 2),
+            "active_orders": active_orders,
+            "completed_orders": completed_orders,
+            "avg_order_value": round(avg_order_value, 2)
+        }
+
+
+status_counters = StatusCounters()
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import time
+
+import repository
+
+# How long a loaded directory is trusted before it is reloaded in the background
+TABLES_TTL = float(os.getenv("TABLES_CACHE_TTL", "300"))
+# Minimum gap between reloads triggered by unknown table references
+MISS_REFRESH_INTERVAL = float(os.getenv("TABLES_MISS_REFRESH_INTERVAL", "5"))
+
+
+def normalize_number(number) -> str:
+    """'05', '5' and ' 5 ' all normalise to '5' (but '0' stays '0')."""
+    return str(number).strip().lstrip('0') or '0'
+
+
+class TableDirectory:
+    """
+    In-process index of restaurant tables by id, qr_code_uuid, table number
+    and normalised table number, so resolving a dine-in table needs no
+    round trip. Reloaded in the background once the TTL expires, and on
+    demand (rate limited) when a reference isn't found.
+    """
+
+    def __init__(self, ttl: float = TABLES_TTL):
+        self.ttl = ttl
+        self.loaded_at = None
+        self._by_id = {}
+        self._by_qr = {}
+        self._by_number = {}
+        self._by_normalized = {}
+        self._lock = asyncio.Lock()
+        self._last_miss_refresh = 0.0
+        self._refresh_task = None
+
+    def replace(self, rows):
+        by_id, by_qr, by_number, by_normalized = {}, {}, {}, {}
+        for row in rows:
+            by_id[str(row['id'])] = row
+            if row.get('qr_code_uuid'):
+                by_qr[str(row['qr_code_uuid'])] = row
+            if row.get('table_number') is not None:
+                number = str(row['table_number']).strip()
+                by_number.setdefault(number, row)
+                by_normalized.setdefault(normalize_number(number), row)
+        self._by_id, self._by_qr = by_id, by_qr
+        self._by_number, self._by_normalized = by_number, by_normalized
+        self.loaded_at = time.monotonic()
+
+    def lookup(self, ref: str):
+        """Finds a table by id, QR code or number; exact numbers win over padded ones."""
+        ref = str(ref).strip()
+        return (
+            self._by_id.get(ref)
+            or self._by_qr.get(ref)
+            or self._by_number.get(ref)
+            or self._by_normalized.get(normalize_number(ref))
+        )
+
+    @property
+    def is_stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    async def refresh(self):
+        async with self._lock:
+            rows = await repository.get_tables()
+            self.replace(rows)
+            print(f"Table directory loaded: {len(rows)} tables")
+
+    async def _refresh_quietly(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            print(f"Error refreshing table directory: {e}")
+
+    def _refresh_in_background(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_quietly())
+
+    async def resolve(self, ref: str):
+        """Returns the table row for `ref` or None. Only unknown refs may hit the database."""
+        if self.loaded_at is None:
+            await self.refresh()
+        elif self.is_stale:
+            self._refresh_in_background()
+
+        table = self.lookup(ref)
+        if table is None and time.monotonic() - self._last_miss_refresh > MISS_REFRESH_INTERVAL:
+            # Possibly a table created since the last load
+            self._last_miss_refresh = time.monotonic()
+            await self.refresh()
+            table = self.lookup(ref)
+        return table
+
+    def invalidate(self):
+        self.loaded_at = None
+
+
+table_directory = TableDirectory()
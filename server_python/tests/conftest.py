@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# Settings read at import time by the app modules
+os.environ.setdefault("SUPABASE_JWT_SECRET", "test-secret-" + "x" * 32)
+os.environ.setdefault("AUTH_REMOTE_FALLBACK", "false")
+os.environ.setdefault("IDEMPOTENCY_BACKEND", "memory")
+os.environ.setdefault("GEOCODE_BACKEND", "none")
+os.environ.setdefault("GEOCODE_CACHE_PATH", os.path.join(tempfile.mkdtemp(), "geocode_cache.sqlite3"))
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, os.path.join(SERVER_DIR, "bench"))
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import jwt
+import pytest
+
+import database
+import deps
+import main
+from fake_supabase import FakeSupabase
+
+ADMIN_ID = str(uuid.UUID(int=1))
+
+
+def seed(n_orders):
+    now = datetime.now(timezone.utc)
+    users = [str(uuid.UUID(int=100 + i)) for i in range(n_orders)]
+    data = {
+        'profiles': [{'id': ADMIN_ID, 'role': 'admin', 'full_name': 'Admin', 'email': 'admin@example.com'}]
+                    + [{'id': u, 'role': 'client', 'full_name': f'User {i}', 'email': f'u{i}@example.com'} for i, u in enumerate(users)],
+        'tables': [{'id': str(uuid.UUID(int=50)), 'table_number': '1'}],
+        'products': [{'id': str(uuid.UUID(int=60)), 'name': 'Pizza', 'price': 10.0}],
+        'orders': [], 'order_items': [], 'deliveries': [],
+    }
+    for i in range(n_orders):
+        order_id = str(uuid.UUID(int=1000 + i))
+        data['orders'].append({
+            'id': order_id, 'user_id': users[i], 'table_id': data['tables'][0]['id'], 'status': 'pending',
+            'order_type': 'delivery', 'total_amount': 10.0, 'created_at': (now - timedelta(minutes=i)).isoformat(),
+        })
+        data['order_items'].append({'id': str(uuid.uuid4()), 'order_id': order_id,
+                                    'product_id': data['products'][0]['id'], 'quantity': 1})
+    return data
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    def install(data):
+        db = FakeSupabase(data, is_async=True)
+        sync_db = FakeSupabase(data)
+        monkeypatch.setattr(database, 'async_supabase', db)
+        monkeypatch.setattr(main, 'supabase', sync_db)
+        monkeypatch.setattr(deps, 'supabase', sync_db)
+        return db, sync_db
+    return install
+
+
+def admin_headers():
+    now = int(time.time())
+    claims = {'sub': ADMIN_ID, 'aud': 'authenticated', 'iat': now, 'exp': now + 3600}
+    return {'Authorization': f"Bearer {jwt.encode(claims, os.environ['SUPABASE_JWT_SECRET'], algorithm='HS256')}"}
+
+
+async def get_orders(headers, **params):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        return await client.get('/admin/orders', params=params, headers=headers)
+
+
+@pytest.mark.parametrize("n_orders", [1, 10, 50])
+def test_admin_orders_page_costs_constant_backend_calls(fake_backend, n_orders):
+    db, sync_db = fake_backend(seed(n_orders))
+    headers = admin_headers()
+    asyncio.run(get_orders(headers, limit=100))  # warms the role cache
+
+    before = db.total_calls + sync_db.total_calls
+    res = asyncio.run(get_orders(headers, limit=100))
+    calls = db.total_calls + sync_db.total_calls - before
+
+    assert res.status_code == 200
+    assert len(res.json()) == n_orders
+    assert all(o['profiles'] and o['order_items'] for o in res.json())
+    # One orders query (items and tables embedded) plus one batched profiles query
+    assert calls == 2
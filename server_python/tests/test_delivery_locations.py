@@ -0,0 +1,76 @@
+import asyncio
+import os
+import time
+import uuid
+
+import httpx
+import jwt
+import pytest
+
+import database
+import deps
+import main
+from driver_locations import driver_locations
+from fake_supabase import FakeSupabase
+
+ADMIN_ID = str(uuid.UUID(int=1))
+DRIVER_ID = str(uuid.UUID(int=2))
+CUSTOMER_ID = str(uuid.UUID(int=3))
+STRANGER_ID = str(uuid.UUID(int=4))
+ORDER_ID = str(uuid.UUID(int=10))
+DELIVERY_ID = str(uuid.UUID(int=20))
+
+
+@pytest.fixture(autouse=True)
+def fake_backend(monkeypatch):
+    data = {
+        'profiles': [{'id': ADMIN_ID, 'role': 'admin'}, {'id': DRIVER_ID, 'role': 'driver'},
+                     {'id': CUSTOMER_ID, 'role': 'client'}, {'id': STRANGER_ID, 'role': 'client'}],
+        'orders': [{'id': ORDER_ID, 'user_id': CUSTOMER_ID, 'status': 'prep', 'order_type': 'delivery'}],
+        'deliveries': [{'id': DELIVERY_ID, 'order_id': ORDER_ID, 'driver_id': DRIVER_ID, 'status': 'open',
+                        'current_lat': 38.71, 'current_lng': -9.14}],
+    }
+    sync_db = FakeSupabase(data)
+    monkeypatch.setattr(database, 'async_supabase', FakeSupabase(data, is_async=True))
+    monkeypatch.setattr(main, 'supabase', sync_db)
+    monkeypatch.setattr(deps, 'supabase', sync_db)
+
+
+def headers(user_id):
+    now = int(time.time())
+    claims = {'sub': user_id, 'aud': 'authenticated', 'iat': now, 'exp': now + 3600}
+    return {'Authorization': f"Bearer {jwt.encode(claims, os.environ['SUPABASE_JWT_SECRET'], algorithm='HS256')}"}
+
+
+def request(method, path, user_id, **kwargs):
+    async def go():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.request(method, path, headers=headers(user_id), **kwargs)
+    return asyncio.run(go())
+
+
+def get_location(user_id, delivery_id=DELIVERY_ID):
+    return request('GET', f'/deliveries/{delivery_id}/location', user_id)
+
+
+@pytest.mark.parametrize("user_id", [ADMIN_ID, DRIVER_ID, CUSTOMER_ID])
+def test_admin_driver_and_customer_can_follow_the_delivery(user_id):
+    res = get_location(user_id)
+    assert res.status_code == 200
+    assert res.json()['lat'] == 38.71
+
+
+def test_other_users_cannot_follow_the_delivery():
+    assert get_location(STRANGER_ID).status_code == 403
+
+
+def test_batch_with_a_bad_timestamp_records_nothing():
+    driver_locations.forget(DELIVERY_ID)
+    fixes = [
+        {'delivery_id': DELIVERY_ID, 'lat': 38.72, 'lng': -9.15, 'recorded_at': '2026-10-17T12:00:00+00:00'},
+        {'delivery_id': DELIVERY_ID, 'lat': 38.73, 'lng': -9.16, 'recorded_at': 'yesterday'},
+    ]
+    res = request('POST', '/driver/location', DRIVER_ID, json=fixes)
+    assert res.status_code == 400
+    assert driver_locations.get(DELIVERY_ID) is None
@@ -0,0 +1,15 @@
+from dispatch import DispatchIndex
+
+
+def test_position_update_keeps_the_drivers_delivery():
+    index = DispatchIndex()
+    index.update_driver('d1', 38.71, -9.14, delivery_id='del-1')
+    index.move_driver('d1', 38.72, -9.15)
+    assert index.drivers.get('d1')[2]['delivery_id'] == 'del-1'
+    assert index.nearest_drivers(38.72, -9.15) == []
+
+
+def test_position_update_registers_a_free_driver():
+    index = DispatchIndex()
+    index.move_driver('d2', 38.72, -9.15)
+    assert [key for _, key, _ in index.nearest_drivers(38.72, -9.15)] == ['d2']
@@ -0,0 +1,44 @@
+import asyncio
+
+from fastapi import HTTPException
+
+import idempotency
+from idempotency import run_idempotent
+
+
+def test_retries_after_a_failure_run_the_handler_once():
+    placed = []
+
+    async def scenario():
+        first_started = asyncio.Event()
+        release_first = asyncio.Event()
+
+        async def failing():
+            first_started.set()
+            await release_first.wait()
+            raise HTTPException(status_code=500, detail="boom")
+
+        release_retry = asyncio.Event()
+
+        async def place():
+            await release_retry.wait()
+            placed.append(1)
+            return {"id": len(placed)}
+
+        first = asyncio.create_task(run_idempotent("key-1", "test", {"a": 1}, failing))
+        await first_started.wait()
+        waiting = asyncio.create_task(run_idempotent("key-1", "test", {"a": 1}, place))
+        await asyncio.sleep(0)
+        release_first.set()
+        await asyncio.gather(first, return_exceptions=True)
+        # Arrives while the waiting retry is running
+        late = asyncio.create_task(run_idempotent("key-1", "test", {"a": 1}, place))
+        await asyncio.sleep(0)
+        release_retry.set()
+        return await asyncio.gather(waiting, late)
+
+    waiting, late = asyncio.run(scenario())
+    assert placed == [1]
+    assert waiting == {"id": 1}
+    assert late.headers["Idempotent-Replayed"] == "true"
+    assert "test:key-1" not in idempotency._inflight
@@ -0,0 +1,32 @@
+import json
+
+from kds_board import ActiveBoard
+
+
+def order(i, status='pending'):
+    return {'id': f'o{i}', 'status': status, 'created_at': f'2026-10-17T12:00:0{i}+00:00',
+            'tables': {'table_number': str(i)}, 'order_items': []}
+
+
+def board_with(*orders):
+    board = ActiveBoard()
+    board._replace(orders)
+    return board
+
+
+def test_body_matches_the_listing_and_is_reused():
+    board = board_with(order(2), order(1, 'prep'))
+    body = board.orders_body()
+    assert json.loads(body) == board.orders()
+    assert board.orders_body() is body
+
+
+def test_body_follows_board_changes():
+    board = board_with(order(1), order(2))
+    board.orders_body()
+    board.record_status_change({'id': 'o1', 'status': 'prep'}, 'pending')
+    assert [o['status'] for o in json.loads(board.orders_body())] == ['prep', 'pending']
+    board.record_status_change({'id': 'o2', 'status': 'ready'}, 'pending')
+    assert [o['id'] for o in json.loads(board.orders_body())] == ['o1']
+    board.add(order(3))
+    assert [o['id'] for o in json.loads(board.orders_body())] == ['o1', 'o3']
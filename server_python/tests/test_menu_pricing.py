@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+from menu import MenuCatalog, PricingError
+
+
+def catalog():
+    menu = MenuCatalog()
+    menu.replace([
+        {'id': 'p1', 'name': 'Bifana', 'price': 4.5, 'is_available': True},
+        {'id': 'p2', 'name': 'Special', 'price': None, 'is_available': True},
+    ], [])
+    return menu
+
+
+def test_prices_items_from_the_catalog():
+    priced, total = asyncio.run(catalog().price_items([{'product_id': 'p1', 'quantity': 2, 'price': 0.01}]))
+    assert priced[0]['price'] == 4.5
+    assert total == 9.0
+
+
+def test_empty_cart_is_rejected():
+    with pytest.raises(PricingError):
+        asyncio.run(catalog().price_items([]))
+
+
+def test_product_without_price_is_rejected():
+    with pytest.raises(PricingError):
+        asyncio.run(catalog().price_items([{'product_id': 'p2', 'quantity': 1}]))
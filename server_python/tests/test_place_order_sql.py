@@ -0,0 +1,131 @@
+"""
+Runs sql/place_order.sql against a real Postgres. Point TEST_DATABASE_URL at
+a throwaway database (e.g. `docker run -e POSTGRES_PASSWORD=x -p 5432:5432
+postgres` and postgresql://postgres:x@localhost/postgres) and install
+psycopg (`pip install "psycopg[binary]"`); skipped otherwise.
+
+Everything runs in one transaction that is rolled back, on minimal versions
+of the orders / order_items / deliveries tables.
+"""
+import json
+import os
+
+import pytest
+
+psycopg = pytest.importorskip("psycopg")
+
+DSN = os.getenv("TEST_DATABASE_URL")
+SQL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql")
+
+SCHEMA = """
+create table public.orders (
+  id uuid primary key default gen_random_uuid(),
+  establishment_id uuid,
+  table_id uuid,
+  user_id uuid,
+  order_type text,
+  total_amount numeric,
+  status text,
+  delivery_address text,
+  created_at timestamptz not null default now()
+);
+create table public.order_items (
+  id uuid primary key default gen_random_uuid(),
+  order_id uuid not null references public.orders(id),
+  product_id uuid not null,
+  quantity integer not null check (quantity > 0),
+  unit_price numeric,
+  notes text
+);
+create table public.deliveries (
+  id uuid primary key default gen_random_uuid(),
+  order_id uuid not null references public.orders(id),
+  status text,
+  address text,
+  current_lat double precision,
+  current_lng double precision,
+  created_at timestamptz not null default now()
+);
+"""
+
+PRODUCT_ID = "00000000-0000-0000-0000-000000000060"
+ESTABLISHMENT_ID = "00000000-0000-0000-0000-000000000001"
+
+
+@pytest.fixture
+def conn():
+    if not DSN:
+        pytest.skip("TEST_DATABASE_URL not set")
+    try:
+        connection = psycopg.connect(DSN)
+    except psycopg.OperationalError as e:
+        pytest.skip(f"Postgres not available: {e}")
+    with connection:
+        with connection.cursor() as cur:
+            cur.execute("select to_regclass('public.orders')")
+            if cur.fetchone()[0] is not None:
+                pytest.skip("TEST_DATABASE_URL already has an orders table; use a throwaway database")
+            cur.execute(SCHEMA)
+            with open(os.path.join(SQL_DIR, "place_order.sql"), encoding="utf-8") as f:
+                cur.execute(f.read())
+        try:
+            yield connection
+        finally:
+            connection.rollback()
+
+
+def place_order(conn, order, items, delivery=None):
+    with conn.cursor() as cur:
+        cur.execute(
+            "select public.place_order(%s::jsonb, %s::jsonb, %s::jsonb)",
+            (json.dumps(order), json.dumps(items), json.dumps(delivery) if delivery is not None else None),
+        )
+        return cur.fetchone()[0]
+
+
+def count(conn, table):
+    with conn.cursor() as cur:
+        cur.execute(f"select count(*) from public.{table}")
+        return cur.fetchone()[0]
+
+
+def test_places_table_order_with_items(conn):
+    order = place_order(
+        conn,
+        {"establishment_id": ESTABLISHMENT_ID, "order_type": "dine_in", "total_amount": 25.0},
+        [{"product_id": PRODUCT_ID, "quantity": 2, "unit_price": 10.0},
+         {"product_id": PRODUCT_ID, "quantity": 1, "unit_price": 5.0}],
+    )
+    assert order["status"] == "pending"
+    assert "delivery_id" not in order
+    assert count(conn, "order_items") == 2
+    assert count(conn, "deliveries") == 0
+
+
+def test_places_delivery_order(conn):
+    order = place_order(
+        conn,
+        {"establishment_id": ESTABLISHMENT_ID, "order_type": "delivery", "total_amount": 10.0,
+         "delivery_address": "Rua Augusta 1, Lisboa"},
+        [{"product_id": PRODUCT_ID, "quantity": 1, "unit_price": 10.0}],
+        {"address": "Rua Augusta 1, Lisboa", "current_lat": 38.71, "current_lng": -9.14},
+    )
+    with conn.cursor() as cur:
+        cur.execute("select order_id::text, status from public.deliveries where id = %s", (order["delivery_id"],))
+        assert cur.fetchone() == (order["id"], "open")
+
+
+def test_failing_item_leaves_no_rows(conn):
+    orders_before, deliveries_before = count(conn, "orders"), count(conn, "deliveries")
+    with pytest.raises(psycopg.errors.CheckViolation):
+        with conn.transaction():  # savepoint, so the outer transaction stays usable
+            place_order(
+                conn,
+                {"establishment_id": ESTABLISHMENT_ID, "order_type": "delivery", "total_amount": 10.0},
+                [{"product_id": PRODUCT_ID, "quantity": 1, "unit_price": 10.0},
+                 {"product_id": PRODUCT_ID, "quantity": 0, "unit_price": 10.0}],
+                {"address": "Rua Augusta 1, Lisboa"},
+            )
+    assert count(conn, "orders") == orders_before
+    assert count(conn, "deliveries") == deliveries_before
+    assert count(conn, "order_items") == 0
@@ -0,0 +1,36 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from rollups import SalesRollups
+
+KOLKATA = ZoneInfo("Asia/Kolkata")
+
+
+def rollups_with_order(created_at, amount=10.0):
+    rollups = SalesRollups("UTC")
+    rollups.record_order({"id": "o1", "establishment_id": "e1", "created_at": created_at,
+                          "total_amount": amount, "status": "pending"})
+    return rollups
+
+
+def test_half_hour_zone_counts_an_order_in_one_hour():
+    rollups = rollups_with_order("2026-10-17T18:10:00+00:00")
+    points = rollups.series(datetime(2026, 10, 17, tzinfo=KOLKATA), datetime(2026, 10, 18, 2, tzinfo=KOLKATA),
+                            "hour", "Asia/Kolkata")
+    assert sum(p["revenue"] for p in points) == 10.0
+    assert [p["start"].hour for p in points if p["orders"]] == [23]
+
+
+def test_half_hour_zone_counts_an_order_on_one_day():
+    rollups = rollups_with_order("2026-10-17T18:10:00+00:00")  # 23:40 in Kolkata
+    points = rollups.series(datetime(2026, 10, 17, tzinfo=KOLKATA), datetime(2026, 10, 19, tzinfo=KOLKATA),
+                            "day", "Asia/Kolkata")
+    assert [(p["start"].day, p["revenue"]) for p in points] == [(17, 10.0), (18, 0.0)]
+
+
+def test_business_timezone_days_and_hours_agree():
+    rollups = rollups_with_order("2026-10-17T23:50:00+00:00", amount=7.5)
+    start, end = datetime(2026, 10, 17, tzinfo=ZoneInfo("UTC")), datetime(2026, 10, 18, tzinfo=ZoneInfo("UTC"))
+    hours = rollups.series(start, end, "hour")
+    days = rollups.series(start, end, "day")
+    assert sum(p["revenue"] for p in hours) == days[0]["revenue"] == 7.5
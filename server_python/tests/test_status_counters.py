@@ -0,0 +1,48 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import database
+from fake_supabase import FakeSupabase
+from status_counters import StatusCounters
+
+
+def test_change_committed_before_the_counts_is_not_applied_twice(monkeypatch):
+    yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+    orders = [{'id': str(uuid.UUID(int=i)), 'status': 'pending', 'total_amount': 10.0, 'created_at': yesterday}
+              for i in range(1, 11)]
+    fake = FakeSupabase({'orders': orders}, is_async=True, latency=0.05)
+    monkeypatch.setattr(database, 'async_supabase', fake)
+    counters = StatusCounters('UTC')
+
+    async def scenario():
+        reconcile = asyncio.create_task(counters.reconcile())
+        await asyncio.sleep(0.01)  # count queries are in flight
+        started = counters.begin_write()
+        orders[0]['status'] = 'prep'  # commits before the counts read
+        await asyncio.sleep(0.01)
+        counters.record_status_change(dict(orders[0]), 'pending', started)
+        await reconcile
+
+    asyncio.run(scenario())
+    assert counters.by_status() == {'pending': 9, 'prep': 1}
+
+
+def test_change_issued_after_the_counts_is_replayed(monkeypatch):
+    yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+    orders = [{'id': str(uuid.UUID(int=i)), 'status': 'pending', 'total_amount': 10.0, 'created_at': yesterday}
+              for i in range(1, 11)]
+    fake = FakeSupabase({'orders': orders}, is_async=True, latency=0.05)
+    monkeypatch.setattr(database, 'async_supabase', fake)
+    counters = StatusCounters('UTC')
+
+    async def scenario():
+        reconcile = asyncio.create_task(counters.reconcile())
+        await asyncio.sleep(0.07)  # counts returned, today's scan in flight
+        started = counters.begin_write()
+        orders[0]['status'] = 'prep'
+        counters.record_status_change(dict(orders[0]), 'pending', started)
+        await reconcile
+
+    asyncio.run(scenario())
+    assert counters.by_status() == {'pending': 9, 'prep': 1}
@@ -0,0 +1,55 @@
+import os
+import time
+
+import jwt
+import pytest
+
+import tokens
+from tokens import InvalidToken, decode_token, verify_token
+
+SECRET = os.environ["SUPABASE_JWT_SECRET"]
+
+
+def mint(sub="user-1", secret=SECRET, aud="authenticated", expires_in=3600, **claims):
+    now = int(time.time())
+    payload = {"sub": sub, "aud": aud, "iat": now, "exp": now + expires_in, "role": "authenticated", **claims}
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+def test_decode_good_token():
+    claims = decode_token(mint(email="a@example.com"), secret=SECRET)
+    assert claims["sub"] == "user-1"
+    assert claims["email"] == "a@example.com"
+
+
+def test_decode_expired_token():
+    with pytest.raises(InvalidToken):
+        decode_token(mint(expires_in=-60), secret=SECRET)
+
+
+def test_decode_wrong_audience():
+    with pytest.raises(InvalidToken):
+        decode_token(mint(aud="someone-else"), secret=SECRET)
+
+
+def test_decode_wrong_secret():
+    with pytest.raises(InvalidToken):
+        decode_token(mint(secret="another-secret-" + "y" * 32), secret=SECRET)
+
+
+def test_verify_good_token_is_cached():
+    token = mint(sub="user-2")
+    user = verify_token(token)
+    assert user.user.id == "user-2"
+    assert verify_token(token) is user
+    tokens.forget_token(token)
+
+
+@pytest.mark.parametrize("token", [
+    mint(expires_in=-60),
+    mint(aud="someone-else"),
+    mint(secret="another-secret-" + "y" * 32),
+])
+def test_verify_rejects_bad_tokens(token):
+    with pytest.raises(InvalidToken):
+        verify_token(token)
@@ -0,0 +1,43 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import database
+from fake_supabase import FakeSupabase
+from top_products import TopProducts
+
+PRODUCT_ID = str(uuid.UUID(int=60))
+
+
+class InsertsDuringScan(FakeSupabase):
+    """Places a new 100-item order right after the first order_items page is read."""
+
+    def execute(self, run):
+        result = super().execute(run)
+        if self.calls[('order_items', 'select')] == 1 and not self.tables.get('inserted'):
+            self.tables['inserted'] = True
+            new_order = str(uuid.UUID(int=10 ** 6))
+            self.tables['orders'].append({'id': new_order, 'created_at': datetime.now(timezone.utc).isoformat()})
+            self.tables['order_items'].extend(
+                {'id': str(uuid.UUID(int=i)), 'order_id': new_order, 'product_id': PRODUCT_ID, 'quantity': 1, 'unit_price': 1.0}
+                for i in range(1, 101)  # sort before every existing item
+            )
+            self.invalidate('orders')
+            self.invalidate('order_items')
+        return result
+
+
+def test_backfill_counts_each_item_once_while_orders_arrive(monkeypatch):
+    old_order = str(uuid.UUID(int=1))
+    tables = {
+        'orders': [{'id': old_order, 'created_at': (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()}],
+        'order_items': [
+            {'id': str(uuid.UUID(int=1000 + i)), 'order_id': old_order, 'product_id': PRODUCT_ID, 'quantity': 1, 'unit_price': 1.0}
+            for i in range(2500)
+        ],
+    }
+    monkeypatch.setattr(database, 'async_supabase', InsertsDuringScan(tables, is_async=True))
+
+    counters = TopProducts('UTC')
+    asyncio.run(counters.backfill())
+    assert counters.totals[PRODUCT_ID][0] == 2500
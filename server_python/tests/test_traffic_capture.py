@@ -0,0 +1,20 @@
+import json
+
+from traffic_capture import REDACTED, _capture_body
+
+
+def test_body_keeps_shape_but_no_free_text():
+    body = {
+        "table_id": "4",
+        "user_id": "customer-1",
+        "delivery_address": "Rua Augusta 1",
+        "items": [{"product_id": "p1", "quantity": 2, "notes": "no onions, nut allergy"}],
+        "transitions": [{"order_id": "o1", "status": "prep"}],
+    }
+    captured = _capture_body(json.dumps(body).encode(), "application/json")
+    assert captured["table_id"] == "4"
+    assert captured["user_id"] != "customer-1"
+    assert captured["delivery_address"] == REDACTED
+    assert captured["items"] == [{"product_id": "p1", "quantity": 2, "notes": "x" * len("no onions, nut allergy")}]
+    assert captured["transitions"] == [{"order_id": "o1", "status": "prep"}]
+    assert "onions" not in json.dumps(captured)
@@ -0,0 +1,150 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+
+import jwt
+from dotenv import load_dotenv
+from supabase_auth.types import User, UserResponse
+
+from cache import TTLCache
+
+load_dotenv()
+
+# Local verification settings. With SUPABASE_JWT_SECRET set, HS256 tokens are
+# checked offline; asymmetric tokens (RS256/ES256) use the project's JWKS.
+JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or (
+    f"{os.getenv('SUPABASE_URL').rstrip('/')}/auth/v1/.well-known/jwks.json"
+    if os.getenv("SUPABASE_URL") else None
+)
+# Fall back to supabase.auth.get_user() when a token can't be checked locally
+REMOTE_FALLBACK = os.getenv("AUTH_REMOTE_FALLBACK", "true").lower() in ("1", "true", "yes")
+
+_token_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("AUTH_CACHE_TTL", "300")),
+)
+_jwks_client = None
+
+_SYMMETRIC_ALGS = ["HS256"]
+_ASYMMETRIC_ALGS = ["RS256", "ES256"]
+
+
+class InvalidToken(Exception):
+    """The token was checked and is not acceptable (bad signature, expired, ...)."""
+
+
+class LocalVerificationUnavailable(Exception):
+    """The token can't be checked locally (no secret/JWKS for its algorithm)."""
+
+
+class VerifiedUserResponse(UserResponse):
+    """UserResponse built from locally verified claims; keeps the raw claims around."""
+    claims: dict = {}
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _get_jwks_client():
+    global _jwks_client
+    if _jwks_client is None and JWKS_URL:
+        headers = {"apikey": os.getenv("SUPABASE_KEY")} if os.getenv("SUPABASE_KEY") else None
+        _jwks_client = jwt.PyJWKClient(JWKS_URL, cache_keys=True, lifespan=3600, headers=headers)
+    return _jwks_client
+
+
+def decode_token(token: str, secret: str | None = None, jwks_client=None, audience: str | None = None) -> dict:
+    """
+    Verifies signature, expiry and audience of a Supabase access token and
+    returns its claims. Arguments default to the module configuration, so
+    tests can pass their own secret to check locally minted tokens.
+    """
+    secret = secret if secret is not None else JWT_SECRET
+    audience = audience if audience is not None else JWT_AUDIENCE
+
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.PyJWTError as e:
+        raise InvalidToken(str(e))
+
+    alg = header.get("alg")
+    if alg in _SYMMETRIC_ALGS:
+        if not secret:
+            raise LocalVerificationUnavailable("SUPABASE_JWT_SECRET not configured")
+        key = secret
+    elif alg in _ASYMMETRIC_ALGS:
+        client = jwks_client or _get_jwks_client()
+        if not client:
+            raise LocalVerificationUnavailable("No JWKS URL configured")
+        try:
+            key = client.get_signing_key_from_jwt(token).key
+        except jwt.PyJWKClientError as e:
+            raise LocalVerificationUnavailable(f"JWKS lookup failed: {e}")
+    else:
+        raise InvalidToken(f"Unsupported token algorithm: {alg}")
+
+    try:
+        return jwt.decode(
+            token,
+            key,
+            algorithms=[alg],
+            audience=audience,
+            options={"require": ["exp", "sub"]},
+        )
+    except jwt.PyJWTError as e:
+        raise InvalidToken(str(e))
+
+
+def user_from_claims(claims: dict) -> VerifiedUserResponse:
+    """Maps JWT claims onto the same shape supabase.auth.get_user() returns."""
+    issued_at = claims.get("iat") or claims["exp"]
+    aud = claims.get("aud")
+    user = User(
+        id=claims["sub"],
+        aud=aud[0] if isinstance(aud, list) else (aud or ""),
+        email=claims.get("email"),
+        phone=claims.get("phone"),
+        role=claims.get("role"),
+        app_metadata=claims.get("app_metadata") or {},
+        user_metadata=claims.get("user_metadata") or {},
+        created_at=datetime.fromtimestamp(issued_at, tz=timezone.utc),
+        is_anonymous=claims.get("is_anonymous", False),
+    )
+    return VerifiedUserResponse(user=user, claims=claims)
+
+
+def verify_token(token: str, remote_client=None):
+    """
+    Returns the user for a bearer token, from the cache when possible.
+    Tokens are verified locally; `remote_client` (a supabase client) is only
+    used when local verification is unavailable and the fallback is enabled.
+    Raises InvalidToken when the token is rejected.
+    """
+    key = token_key(token)
+    cached = _token_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        claims = decode_token(token)
+        user = user_from_claims(claims)
+        # Never keep a token in the cache past its own expiry
+        ttl = claims["exp"] - datetime.now(timezone.utc).timestamp()
+    except LocalVerificationUnavailable as e:
+        if not (REMOTE_FALLBACK and remote_client):
+            raise InvalidToken(f"Local verification unavailable: {e}")
+        user = remote_client.auth.get_user(token)
+        if not user:
+            raise InvalidToken("Token rejected by Auth server")
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+        ttl = exp - datetime.now(timezone.utc).timestamp() if exp else None
+
+    _token_cache.set(key, user, ttl=ttl)
+    return user
+
+
+def forget_token(token: str):
+    _token_cache.pop(token_key(token))
@@ -0,0 +1,121 @@
+import asyncio
+import heapq
+from datetime import datetime, timedelta, timezone
+
+import repository
+from rollups import STATS_TIMEZONE, parse_timestamp
+from zoneinfo import ZoneInfo
+
+WINDOWS = {'today': 1, '7d': 7, '30d': 30, 'all': None}
+MAX_DAYS = 30  # daily counters older than the longest window are dropped
+
+
+def _log_failure(task):
+    if not task.cancelled() and task.exception():
+        print(f"Error backfilling top products: {task.exception()}")
+
+
+class TopProducts:
+    """
+    Per-product quantity and revenue counters (revenue from order_items.unit_price),
+    kept per local day so today / 7d / 30d windows are a sum over a few
+    buckets, plus lifetime totals. Filled by a streaming backfill over
+    order_items and then updated as orders are placed.
+    """
+
+    def __init__(self, tz: str = STATS_TIMEZONE):
+        self.tz = ZoneInfo(tz)
+        self.daily = {}    # date -> {product_id: [quantity, revenue]}, last MAX_DAYS only
+        self.totals = {}   # product_id -> [quantity, revenue]
+        self.ready = False
+        self._backfill_task = None
+        self._pending = None
+
+    def _apply(self, daily, totals, product_id, quantity, unit_price, created_at):
+        revenue = quantity * float(unit_price or 0.0)
+        day = parse_timestamp(created_at).astimezone(self.tz).date()
+        counters = [totals.setdefault(product_id, [0, 0.0])]
+        if day > datetime.now(self.tz).date() - timedelta(days=MAX_DAYS):
+            counters.append(daily.setdefault(day, {}).setdefault(product_id, [0, 0.0]))
+        for counter in counters:
+            counter[0] += quantity
+            counter[1] += revenue
+
+    def _prune(self):
+        oldest = datetime.now(self.tz).date() - timedelta(days=MAX_DAYS)
+        for day in [d for d in self.daily if d <= oldest]:
+            del self.daily[day]
+
+    def record_order(self, order, items):
+        """Counts the (priced) items of a newly placed order."""
+        if self._pending is not None:
+            self._pending.append((order, items))
+        for item in items:
+            self._apply(self.daily, self.totals, str(item['product_id']), item['quantity'], item['price'], order['created_at'])
+
+    async def backfill(self):
+        """Rebuilds the counters from order_items, one page at a time."""
+        daily, totals = {}, {}
+        self._pending = []
+        cutoff = datetime.now(timezone.utc)
+        try:
+            count = 0
+            # Items of newer orders are left to the _pending replay below
+            async for page in repository.iter_keyset_pages(
+                lambda: repository.db().table('order_items')
+                    .select('id, product_id, quantity, unit_price, orders!inner(created_at)')
+                    .lt('orders.created_at', cutoff.isoformat())
+            ):
+                for item in page:
+                    created_at = item['orders']['created_at']
+                    self._apply(daily, totals, str(item['product_id']), item['quantity'], item.get('unit_price'), created_at)
+                count += len(page)
+
+            for order, items in self._pending:
+                if parse_timestamp(order['created_at']) >= cutoff:
+                    for item in items:
+                        self._apply(daily, totals, str(item['product_id']), item['quantity'], item['price'], order['created_at'])
+
+            self.daily, self.totals = daily, totals
+            self.ready = True
+            print(f"Top products backfilled from {count} order items")
+        finally:
+            self._pending = None
+
+    def start_backfill(self):
+        if self._backfill_task is None or self._backfill_task.done():
+            self._backfill_task = asyncio.create_task(self.backfill())
+            self._backfill_task.add_done_callback(_log_failure)
+        return self._backfill_task
+
+    async def ensure_ready(self):
+        if not self.ready:
+            await self.start_backfill()
+
+    def counters(self, window: str = 'all'):
+        """{product_id: [quantity, revenue]} for the window (today, 7d, 30d, all)."""
+        days = WINDOWS[window]
+        if days is None:
+            return self.totals
+        self._prune()
+        today = datetime.now(self.tz).date()
+        result = {}
+        for i in range(days):
+            for product_id, (quantity, revenue) in self.daily.get(today - timedelta(days=i), {}).items():
+                counter = result.setdefault(product_id, [0, 0.0])
+                counter[0] += quantity
+                counter[1] += revenue
+        return result
+
+    def top(self, limit: int, window: str = 'all', sort_by: str = 'quantity', product_filter=None):
+        """Top `limit` (product_id, quantity, revenue) tuples, best first."""
+        index = 1 if sort_by == 'revenue' else 0
+        candidates = (
+            (pid, counter[0], counter[1])
+            for pid, counter in self.counters(window).items()
+            if product_filter is None or product_filter(pid)
+        )
+        return heapq.nlargest(limit, candidates, key=lambda c: c[1 + index])
+
+
+top_products = TopProducts()
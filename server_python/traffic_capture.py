@@ -0,0 +1,172 @@
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+import uuid
+from urllib.parse import parse_qsl
+
+# Opt-in: set TRAFFIC_CAPTURE_PATH to record every request to that file
+# (one JSON object per line, appended). Replay it with bench/replay.py.
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH")
+# Pseudonyms are keyed with this salt; without it they only stay stable
+# within one process.
+TRAFFIC_CAPTURE_SALT = os.getenv("TRAFFIC_CAPTURE_SALT") or secrets.token_hex(16)
+TRAFFIC_CAPTURE_EXCLUDE = [p for p in os.getenv("TRAFFIC_CAPTURE_EXCLUDE", "/kds/stream,/metrics").split(",") if p]
+# Bodies larger than this are recorded by size only
+MAX_BODY_BYTES = int(os.getenv("TRAFFIC_CAPTURE_MAX_BODY", "65536"))
+FLUSH_EVERY = 100  # records
+FLUSH_SECONDS = 1.0
+
+# Field names anonymised wherever they appear in a JSON body or the query string
+PSEUDONYMISED_FIELDS = {'user_id', 'driver_id'}
+REDACTED_FIELDS = {'delivery_address', 'address', 'token', 'access_token', 'refresh_token', 'password'}
+REDACTED = "redacted"
+# Body strings kept as sent (ids end in _id); every other string in a body is
+# free text (notes, names, descriptions...) and is recorded as 'x' * length
+STRUCTURAL_FIELDS = {'id', 'status', 'order_type', 'role', 'recorded_at'}
+
+
+def pseudonym(value, salt: str = TRAFFIC_CAPTURE_SALT) -> str:
+    """Stable, salted stand-in for an identifier, shaped like a uuid so it still validates."""
+    digest = hmac.new(salt.encode(), str(value).encode(), hashlib.sha256).digest()
+    return str(uuid.UUID(bytes=digest[:16]))
+
+
+def anonymise(value, key=None):
+    """Copy of a JSON value with identifiers pseudonymised and addresses / secrets blanked."""
+    if isinstance(value, dict):
+        return {k: anonymise(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [anonymise(v, key) for v in value]
+    if value is None:
+        return None
+    if key in PSEUDONYMISED_FIELDS:
+        return pseudonym(value)
+    if key in REDACTED_FIELDS:
+        return REDACTED
+    return value
+
+
+class CaptureLog:
+    """Append-only JSON-lines log of captured requests, written in small batches."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self.records = 0
+
+    def write(self, record: dict):
+        self._buffer.append(json.dumps(record, separators=(",", ":"), default=str))
+        self.records += 1
+        if len(self._buffer) >= FLUSH_EVERY or time.monotonic() - self._last_flush >= FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._file.flush()
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+capture_log = CaptureLog(TRAFFIC_CAPTURE_PATH) if TRAFFIC_CAPTURE_PATH else None
+
+
+def body_shape(value, key=None):
+    """Anonymised JSON body with free-text strings reduced to their length."""
+    if isinstance(value, dict):
+        return {k: body_shape(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [body_shape(v, key) for v in value]
+    if not isinstance(value, str) or value == REDACTED:
+        return value
+    if key in STRUCTURAL_FIELDS or (key or '').endswith('_id'):
+        return value
+    return 'x' * len(value)
+
+
+def _capture_body(body: bytes, content_type: str):
+    if not body:
+        return None
+    if len(body) > MAX_BODY_BYTES or "json" not in content_type:
+        return None
+    try:
+        return body_shape(anonymise(json.loads(body)))
+    except ValueError:
+        return None
+
+
+class CaptureMiddleware:
+    """
+    ASGI middleware recording method, path, anonymised query and body shape
+    (no free text), the matched route, status and timing of each HTTP request. Authorization
+    headers are never written: only whether one was sent. Idempotency keys
+    are pseudonymised so retries still replay as retries.
+    """
+
+    def __init__(self, app, log: CaptureLog, exclude=TRAFFIC_CAPTURE_EXCLUDE):
+        self.app = app
+        self.log = log
+        self.exclude = tuple(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude):
+            await self.app(scope, receive, send)
+            return
+
+        started_wall = time.time()
+        started = time.perf_counter()
+        chunks = []
+        state = {"status": None, "bytes": 0}
+
+        async def capturing_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunks.append(message.get("body", b""))
+            return message
+
+        async def capturing_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, capturing_receive, capturing_send)
+        finally:
+            headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+            body = b"".join(chunks)
+            route = scope.get("route")
+            path = scope["path"]
+            for name, value in scope.get("path_params", {}).items():
+                if name in PSEUDONYMISED_FIELDS:
+                    path = path.replace(str(value), pseudonym(value))
+            query = [(k, anonymise(v, k)) for k, v in parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)]
+            record = {
+                "t": round(started_wall, 6),
+                "method": scope["method"],
+                "path": path,
+                "route": getattr(route, "path", None),
+                "query": query,
+                "auth": "authorization" in headers,
+                "idempotency_key": pseudonym(headers["idempotency-key"]) if "idempotency-key" in headers else None,
+                "content_type": headers.get("content-type"),
+                "body_bytes": len(body),
+                "body": _capture_body(body, headers.get("content-type", "")),
+                "status": state["status"],
+                "response_bytes": state["bytes"],
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            }
+            try:
+                self.log.write(record)
+            except Exception as e:
+                print(f"Error writing traffic capture: {e}")